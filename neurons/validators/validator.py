@@ -16,9 +16,12 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import os
 import copy
 import torch
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import bittensor as bt
 from traceback import print_exception
 import pdb
@@ -42,6 +45,8 @@ from prompting.validators.utils import (
 )
 from prompting.validators.weights import should_set_weights, set_weights
 from prompting.validators.misc import ttl_get_block
+from prompting.validators.timing import StepTimer
+from prompting.validators.loading import ModelLoader
 
 # Load gating models
 from prompting.validators.reward import (
@@ -51,6 +56,10 @@ from prompting.validators.reward import (
     RelevanceRewardModel,
     DiversityRewardModel,
     RewardModelType,
+    RewardCache,
+    RewardBatcher,
+    LazyRewardModel,
+    ModelRegistry,
 )
 
 from prompting.validators.penalty import (
@@ -85,8 +94,28 @@ class neuron:
             self.character_set = CharacterSet()
         bt.logging.debug(str(self.character_set))
 
+    def load_reward_model(self, name: str, model_class: type, **kwargs):
+        """Returns a stand-in loading the model on first use if it is lazy, otherwise the future of the model
+        loading on the model loader."""
+        if name in self.config.neuron.lazy_reward_models:
+            return LazyRewardModel(name, model_class, **kwargs)
+        return self.model_loader.submit(name, partial(model_class, **kwargs))
+
     def init_reward_models(self):
         bt.logging.debug("loading", "reward_functions")
+        self.reward_executor = (
+            ThreadPoolExecutor(
+                max_workers=self.config.neuron.reward_max_workers,
+                thread_name_prefix="reward",
+            )
+            if self.config.neuron.reward_execution == "concurrent"
+            else None
+        )
+
+        # Tune the number of threads used by the models running on cpu.
+        if self.config.neuron.reward_num_threads > 0:
+            torch.set_num_threads(self.config.neuron.reward_num_threads)
+
         if self.config.neuron.mock_reward_models:
             self.reward_functions = []
             self.reward_weights = []
@@ -120,8 +149,13 @@ class neuron:
                 bt.logging.error(message)
                 raise Exception(message)
 
+            # Start loading the models concurrently, they are resolved once every model is submitted.
             self.reward_functions = [
-                MistralRewardModel(device=self.device)
+                self.load_reward_model(
+                    RewardModelType.mistral.value,
+                    MistralRewardModel,
+                    device=self.device,
+                )
                 if self.config.reward.mistral_weight > 0
                 else MockRewardModel(RewardModelType.mistral.value),
             ]
@@ -137,29 +171,66 @@ class neuron:
 
             # Masking functions
             self.blacklist = (
-                Blacklist()
+                self.load_reward_model(
+                    RewardModelType.blacklist.value,
+                    Blacklist,
+                    ngram_keys=self.config.neuron.blacklist_ngram_keys,
+                )
                 if not self.config.neuron.blacklist_off
                 else MockRewardModel(RewardModelType.blacklist.value)
             )
 
             relevance_model = (
-                RelevanceRewardModel(device=self.device)
+                self.load_reward_model(
+                    RewardModelType.relevance.value,
+                    RelevanceRewardModel,
+                    device=self.device,
+                    backend=self.config.neuron.reward_backend,
+                )
                 if not self.config.neuron.relevance_off
                 else MockRewardModel(RewardModelType.relevance.value)
             )
 
             self.diversity_model = (
-                DiversityRewardModel(device=self.device)
+                self.load_reward_model(
+                    RewardModelType.diversity.value,
+                    DiversityRewardModel,
+                    device=self.device,
+                    backend=self.config.neuron.reward_backend,
+                    index=self.config.neuron.diversity_index,
+                    num_probes=self.config.neuron.diversity_index_probes,
+                    history_dtype=self.config.neuron.diversity_history_dtype,
+                    history_path=os.path.join(
+                        self.config.neuron.full_path, "diversity_history.bin"
+                    )
+                    if self.config.neuron.diversity_history_mmap
+                    else None,
+                )
                 if not self.config.neuron.diversity_off
                 else MockRewardModel(RewardModelType.diversity.value)
             )
 
             nsfw_model = (
-                NSFWRewardModel(device=self.device)
+                self.load_reward_model(
+                    RewardModelType.nsfw.value,
+                    NSFWRewardModel,
+                    device=self.device,
+                    backend=self.config.neuron.reward_backend,
+                )
                 if not self.config.neuron.nsfw_off
                 else MockRewardModel(RewardModelType.nsfw.value)
             )
 
+            # Wait for the models still loading.
+            self.reward_functions = [
+                self.model_loader.resolve(reward_fn)
+                for reward_fn in self.reward_functions
+            ]
+            self.blacklist = self.model_loader.resolve(self.blacklist)
+            relevance_model = self.model_loader.resolve(relevance_model)
+            self.diversity_model = self.model_loader.resolve(self.diversity_model)
+            nsfw_model = self.model_loader.resolve(nsfw_model)
+
             self.masking_functions = [
                 self.blacklist,
                 # relevance_model, 
@@ -177,6 +248,26 @@ class neuron:
             bt.logging.debug(str(self.masking_functions))
             bt.logging.debug(str(self.penalty_functions))
 
+        # Share a reward cache between the stateless reward models.
+        if self.config.neuron.reward_cache_size > 0:
+            reward_cache = RewardCache(
+                max_size=self.config.neuron.reward_cache_size,
+                ttl=self.config.neuron.reward_cache_ttl,
+            )
+            for reward_fn in self.reward_functions + self.masking_functions:
+                if not reward_fn.stateful:
+                    reward_fn.cache = reward_cache
+
+        # Batch the completions of concurrent forwards in the stateless reward models.
+        if self.config.neuron.reward_batch_window > 0:
+            for reward_fn in self.reward_functions + self.masking_functions:
+                if not reward_fn.stateful:
+                    reward_fn.batcher = RewardBatcher(
+                        reward_fn,
+                        window=self.config.neuron.reward_batch_window,
+                        max_batch_size=self.config.neuron.reward_max_batch_size,
+                    )
+
     def __init__(self):
         self.config = neuron.config()
         self.check_config(self.config)
@@ -189,6 +280,11 @@ class neuron:
         self.device = torch.device(self.config.neuron.device)
         bt.logging.debug(str(self.device))
 
+        # Init step timer.
+        self.step_timer = StepTimer(
+            enabled=self.config.neuron.timing, window=self.config.neuron.timing_window
+        )
+
         # Init subtensor
         bt.logging.debug("loading", "subtensor")
         self.subtensor = bt.subtensor(config=self.config)
@@ -224,6 +320,11 @@ class neuron:
 
         self.init_characterset()
 
+        # Init the model loader, which loads the gating and reward models concurrently.
+        self.model_loader = ModelLoader(
+            max_workers=self.config.neuron.model_loading_workers
+        )
+
         # Init the gating model which learns which miners to select for each query.
         bt.logging.debug("loading", "gating_model")
         if not self.config.gating.num_uids:
@@ -232,14 +333,19 @@ class neuron:
         if self.config.neuron.mock_gating_model:
             self.gating_model = MockGatingModel(self.metagraph.n.item())
         elif self.config.neuron.use_custom_gating_model:
-            self.gating_model = SentenceEmbedGatingModel(
-                metagraph=self.metagraph, config=self.config
-            ).to(self.device)
+            self.gating_model = self.model_loader.submit(
+                "gating_model",
+                lambda: SentenceEmbedGatingModel(
+                    metagraph=self.metagraph, config=self.config
+                ).to(self.device),
+            )
         else:
-            self.gating_model = GatingModel(
-                metagraph=self.metagraph, config=self.config
-            ).to(self.device)
-        bt.logging.debug(str(self.gating_model))
+            self.gating_model = self.model_loader.submit(
+                "gating_model",
+                lambda: GatingModel(metagraph=self.metagraph, config=self.config).to(
+                    self.device
+                ),
+            )
 
         if not self.config.neuron.axon_off:
             bt.logging.debug("serving ip to chain...")
@@ -275,6 +381,12 @@ class neuron:
 
         self.init_reward_models()
 
+        self.gating_model = self.model_loader.resolve(self.gating_model)
+        bt.logging.debug(str(self.gating_model))
+        self.model_loader.log_timeline()
+        ModelRegistry.log_memory_report()
+        self.model_loader.shutdown()
+
         # Init the event loop.
         self.loop = asyncio.get_event_loop()
 
@@ -22,7 +22,14 @@ import argparse
 import bittensor as bt
 from loguru import logger
 from prompting.validators.gating import BaseGatingModel
-from prompting.validators.reward import DefaultRewardFrameworkConfig
+from prompting.validators.reward import (
+    DefaultRewardFrameworkConfig,
+    RewardModelType,
+    REWARD_BACKENDS,
+    DIVERSITY_INDEXES,
+    HISTORY_DTYPES,
+    BLACKLIST_NGRAM_KEYS,
+)
 
 
 def check_config(cls, config: "bt.Config"):
@@ -96,6 +103,122 @@ def add_args(cls, parser):
         help="The number of concurrent forwards running at any time.",
         default=1,
     )
+    parser.add_argument(
+        "--neuron.reward_execution",
+        type=str,
+        choices=["sequential", "concurrent"],
+        help="Run the reward, masking and penalty functions one after another or concurrently on a thread pool.",
+        default="sequential",
+    )
+    parser.add_argument(
+        "--neuron.reward_max_workers",
+        type=int,
+        help="Number of threads used to run the reward functions when reward_execution is concurrent.",
+        default=8,
+    )
+    parser.add_argument(
+        "--neuron.short_circuit_rewards",
+        action="store_true",
+        help="Run the penalties and cheap masks first and only score the completions they do not zero out with the expensive models. "
+        "The running normalization statistics of those models are then only updated with the surviving completions.",
+        default=False,
+    )
+    parser.add_argument(
+        "--neuron.reward_cache_size",
+        type=int,
+        help="Number of reward events cached for duplicate completions, 0 disables the reward cache.",
+        default=0,
+    )
+    parser.add_argument(
+        "--neuron.reward_cache_ttl",
+        type=float,
+        help="Seconds after which a cached reward event expires.",
+        default=3600,
+    )
+    parser.add_argument(
+        "--neuron.model_loading_workers",
+        type=int,
+        help="Number of threads loading the gating and reward models at startup, 1 loads them one after another.",
+        default=4,
+    )
+    parser.add_argument(
+        "--neuron.lazy_reward_models",
+        type=str,
+        nargs="*",
+        choices=[reward_model_type.value for reward_model_type in RewardModelType],
+        help="Reward models loaded on first use instead of at startup.",
+        default=[],
+    )
+    parser.add_argument(
+        "--neuron.reward_backend",
+        type=str,
+        choices=REWARD_BACKENDS,
+        help="Inference backend of the nsfw, relevance and diversity models, int8 quantizes them dynamically on cpu.",
+        default="fp32",
+    )
+    parser.add_argument(
+        "--neuron.diversity_index",
+        type=str,
+        choices=DIVERSITY_INDEXES,
+        help="Search of the diversity history, ivf only compares completions with the nearest clusters of past completions.",
+        default="exact",
+    )
+    parser.add_argument(
+        "--neuron.diversity_index_probes",
+        type=int,
+        help="Number of clusters of the ivf diversity index searched for each completion.",
+        default=16,
+    )
+    parser.add_argument(
+        "--neuron.diversity_history_dtype",
+        type=str,
+        choices=list(HISTORY_DTYPES),
+        help="Storage format of the diversity history, int8 stores every embedding with its own scale. Only with the exact diversity index.",
+        default="fp32",
+    )
+    parser.add_argument(
+        "--neuron.diversity_history_mmap",
+        action="store_true",
+        help="Keep the diversity history in a memory mapped file of the neuron directory, so checkpoints only write the new rows. Only with the exact diversity index.",
+        default=False,
+    )
+    parser.add_argument(
+        "--neuron.blacklist_ngram_keys",
+        type=str,
+        choices=BLACKLIST_NGRAM_KEYS,
+        help="Keys of the blacklist n-gram counter, hash stores 64-bit rolling hashes instead of tuples of token ids.",
+        default="tuple",
+    )
+    parser.add_argument(
+        "--neuron.reward_num_threads",
+        type=int,
+        help="Number of intra-op threads used by the reward models on cpu, 0 keeps the torch default.",
+        default=0,
+    )
+    parser.add_argument(
+        "--neuron.reward_batch_window",
+        type=float,
+        help="Seconds a reward model waits at most for the concurrent forwards that are scoring to batch their completions, 0 disables batching.",
+        default=0,
+    )
+    parser.add_argument(
+        "--neuron.reward_max_batch_size",
+        type=int,
+        help="Number of completions after which a reward batch is scored without waiting for the window to end.",
+        default=64,
+    )
+    parser.add_argument(
+        "--neuron.timing",
+        action="store_true",
+        help="Record the wall and CPU time of every stage of a step in the event.",
+        default=False,
+    )
+    parser.add_argument(
+        "--neuron.timing_window",
+        type=int,
+        help="Number of recent steps used to compute the rolling timing percentiles.",
+        default=1000,
+    )
     parser.add_argument(
         "--neuron.disable_set_weights",
         action="store_true",
@@ -83,6 +83,15 @@ class EventSchema:
     relevance_filter_mpnet_score: Optional[
         List[float]
     ]  # Output vector of the relevance scoring reward model
+
+    # Reward cache data, step-level counts of the completions served from the cache and scored by the model
+    nsfw_filter_cache_hits: Optional[int]
+    nsfw_filter_cache_misses: Optional[int]
+    relevance_filter_cache_hits: Optional[int]
+    relevance_filter_cache_misses: Optional[int]
+    mistral_reward_model_cache_hits: Optional[int]
+    mistral_reward_model_cache_misses: Optional[int]
+
     # TODO: Add comments
     task_validation_penalty_raw: Optional[List[float]]
     task_validation_penalty_adjusted: Optional[List[float]]
@@ -140,6 +149,16 @@ class EventSchema:
             ),
             "nsfw_filter_score": event_dict.get(RewardModelType.nsfw.value + "_score"),
         }
+        # Only set when the reward cache is enabled.
+        cache = {
+            f"{name.value}_cache_{count}": event_dict.get(f"{name.value}_cache_{count}")
+            for name in [
+                RewardModelType.nsfw,
+                RewardModelType.relevance,
+                RewardModelType.mistral,
+            ]
+            for count in ["hits", "misses"]
+        }
         penalties = {
             "task_validation_penalty_raw": event_dict.get(
                 PenaltyModelType.task_validation_penalty.value + "_raw"
@@ -193,6 +212,7 @@ class EventSchema:
             best=event_dict["best"],
             rewards=event_dict["rewards"],
             **rewards,
+            **cache,
             **penalties,
             set_weights=None,
         )
@@ -19,17 +19,20 @@
 
 import time
 import torch
+import asyncio
 import random
 import bittensor as bt
 import random
 
 from loguru import logger
-from typing import List
+from typing import Callable, Dict, List, Tuple
+from functools import partial
 from dataclasses import asdict
 from prompting.validators.event import EventSchema
 from prompting.validators.misc import ttl_get_block
 from prompting.validators.prompts import followup_prompt, answer_prompt, augment_prompt
 from prompting.validators.utils import check_uid_availability
+from prompting.validators.reward import BaseRewardModel, RewardCaller
 from prompting.validators.tasks import (
     RoleplayTask,
 
@@ -99,42 +102,240 @@ def restrict_format_followup_responses(
                 response.completion = " ".join(completion.split(" ")[-max_words:])
 
 
+def run_reward_jobs(self, jobs: List[Callable]) -> list:
+    """Runs the jobs one after another or on the reward thread pool, returning their results in order."""
+    if self.config.neuron.reward_execution == "concurrent":
+        # Run every job on the thread pool, torch releases the GIL inside its kernels.
+        futures = [self.reward_executor.submit(job) for job in jobs]
+        return [future.result() for future in futures]
+
+    return [job() for job in jobs]
+
+
+def timed(self, stage: str, event: dict, job: Callable) -> Callable:
+    """Wraps the job so that it is timed as a stage of the step."""
+
+    def run():
+        with self.step_timer.time(stage, event):
+            return job()
+
+    return run
+
+
+def expect_callers(self) -> Dict[str, RewardCaller]:
+    """Registers the step with the batchers of its reward and masking functions, so that they wait
+    for its completions instead of the whole batching window."""
+    return {
+        fn.name: fn.batcher.expect()
+        for fn in self.reward_functions + self.masking_functions
+        if fn.batcher is not None
+    }
+
+
+def expected(callers: Dict[str, RewardCaller], name: str, job: Callable) -> Callable:
+    """Wraps the job so that the batcher of the function recognizes the step it is waiting for."""
+    caller = callers.get(name)
+    if caller is None:
+        return job
+
+    def run():
+        with caller:
+            return job()
+
+    return run
+
+
+def compute_short_circuit_results(
+    self,
+    task: RoleplayTask,
+    responses: List[bt.Synapse],
+    task_name: str,
+    successful: torch.BoolTensor,
+    event: dict,
+    callers: Dict[str, RewardCaller],
+) -> Tuple[list, list, list]:
+    """Runs the penalties first and then the masking and reward functions in increasing order of cost.
+    Each function only scores the completions that are not zeroed yet, except for stateful functions
+    which always see every successful completion.
+
+    The masking functions run one after another since each narrows the completions of the next, the
+    penalties and the reward functions are independent and follow `reward_execution`.
+
+    Models normalizing their rewards with running statistics (see `BaseRewardModel.normalize_rewards`)
+    only update them with the completions they score. Their statistics therefore follow the surviving
+    completions instead of every successful one, and the normalized rewards of the survivors differ from
+    those of the full computation."""
+    penalty_results = run_reward_jobs(
+        self,
+        [
+            timed(
+                self,
+                penalty_fn_i.name,
+                event,
+                partial(penalty_fn_i.apply_penalties, responses, task),
+            )
+            for penalty_fn_i in self.penalty_functions
+        ],
+    )
+
+    # Successful completions whose reward is not multiplied to zero yet.
+    alive = successful.clone()
+    for _, _, applied_penalty_i in penalty_results:
+        alive = alive & (applied_penalty_i.cpu() > 0)
+
+    masking_results = [None] * len(self.masking_functions)
+    for i in sorted(
+        range(len(self.masking_functions)),
+        key=lambda i: self.masking_functions[i].cost,
+    ):
+        masking_fn_i = self.masking_functions[i]
+        with self.step_timer.time(masking_fn_i.name, event):
+            masking_results[i] = expected(
+                callers,
+                masking_fn_i.name,
+                partial(
+                    masking_fn_i.apply,
+                    task.base_text,
+                    responses,
+                    task_name,
+                    mask=successful if masking_fn_i.stateful else alive,
+                ),
+            )()
+        alive = alive & (masking_results[i][0].cpu() > 0)
+
+    # Every reward function scores the same completions, so they can run concurrently.
+    reward_results = run_reward_jobs(
+        self,
+        [
+            timed(
+                self,
+                reward_fn_i.name,
+                event,
+                expected(
+                    callers,
+                    reward_fn_i.name,
+                    partial(
+                        reward_fn_i.apply,
+                        task.base_text,
+                        responses,
+                        task_name,
+                        mask=successful if reward_fn_i.stateful else alive,
+                    ),
+                ),
+            )
+            for reward_fn_i in self.reward_functions
+        ],
+    )
+
+    return reward_results, masking_results, penalty_results
+
+
 def compute_rewards(
     self, task: RoleplayTask, responses: List[bt.Synapse], task_name: str, event: dict
 ) -> torch.FloatTensor:
+    # Responses answered successfully, shared by every reward and masking function of the step.
+    successful = BaseRewardModel.successful_mask(responses)
+
+    callers = expect_callers(self)
+    try:
+        if self.config.neuron.short_circuit_rewards:
+            (
+                reward_results,
+                masking_results,
+                penalty_results,
+            ) = compute_short_circuit_results(
+                self, task, responses, task_name, successful, event, callers
+            )
+        else:
+            # The reward, masking and penalty functions are independent until their outputs are combined.
+            reward_jobs = [
+                timed(
+                    self,
+                    reward_fn_i.name,
+                    event,
+                    expected(
+                        callers,
+                        reward_fn_i.name,
+                        partial(
+                            reward_fn_i.apply,
+                            task.base_text,
+                            responses,
+                            task_name,
+                            mask=successful,
+                        ),
+                    ),
+                )
+                for reward_fn_i in self.reward_functions
+            ]
+            masking_jobs = [
+                timed(
+                    self,
+                    masking_fn_i.name,
+                    event,
+                    expected(
+                        callers,
+                        masking_fn_i.name,
+                        partial(
+                            masking_fn_i.apply,
+                            task.base_text,
+                            responses,
+                            task_name,
+                            mask=successful,
+                        ),
+                    ),
+                )
+                for masking_fn_i in self.masking_functions
+            ]
+            penalty_jobs = [
+                timed(
+                    self,
+                    penalty_fn_i.name,
+                    event,
+                    partial(penalty_fn_i.apply_penalties, responses, task),
+                )
+                for penalty_fn_i in self.penalty_functions
+            ]
+            results = run_reward_jobs(self, reward_jobs + masking_jobs + penalty_jobs)
+
+            reward_results = results[: len(reward_jobs)]
+            masking_results = results[
+                len(reward_jobs) : len(reward_jobs) + len(masking_jobs)
+            ]
+            penalty_results = results[len(reward_jobs) + len(masking_jobs) :]
+    finally:
+        # The batchers stop waiting for the functions that did not run.
+        for caller in callers.values():
+            caller.release()
+
     # Compute the rewards for the responses given the prompt.
     rewards: torch.FloatTensor = torch.zeros(len(responses), dtype=torch.float32).to(
         self.device
     )
 
-    # Computes the rewards for the responses given the prompt.
-    for weight_i, reward_fn_i in zip(self.reward_weights, self.reward_functions):
-        reward_i_normalized, reward_event = reward_fn_i.apply(
-            task.base_text, responses, task_name
-        )
+    # Combine the outputs in the same order as they are listed, so that the result does not depend on the
+    # execution mode.
+    for weight_i, reward_fn_i, (reward_i_normalized, reward_event) in zip(
+        self.reward_weights, self.reward_functions, reward_results
+    ):
         rewards += weight_i * reward_i_normalized.to(self.device)
         if not self.config.neuron.disable_log_rewards:
             event.update(reward_event)
         bt.logging.trace(str(reward_fn_i.name), reward_i_normalized.tolist())
-    
 
-    for masking_fn_i in self.masking_functions:
-        mask_i_normalized, reward_event = masking_fn_i.apply(
-            task.base_text, responses, task_name
-        )
+    for masking_fn_i, (mask_i_normalized, reward_event) in zip(
+        self.masking_functions, masking_results
+    ):
         rewards *= mask_i_normalized.to(self.device)  # includes diversity
 
         if not self.config.neuron.disable_log_rewards:
             event.update(reward_event)
         bt.logging.trace(str(masking_fn_i.name), mask_i_normalized.tolist())
-        
-
-    for penalty_fn_i in self.penalty_functions:
-        (
-            raw_penalty_i,
-            adjusted_penalty_i,
-            applied_penalty_i,
-        ) = penalty_fn_i.apply_penalties(responses, task)
+
+    for penalty_fn_i, (
+        raw_penalty_i,
+        adjusted_penalty_i,
+        applied_penalty_i,
+    ) in zip(self.penalty_functions, penalty_results):
         rewards *= applied_penalty_i.to(self.device)
 
         if not self.config.neuron.disable_log_rewards:
@@ -179,27 +380,42 @@ async def run_step(
         criteria=task.get_criteria_strs(),
     )
 
-    # Make calls to the network with the prompt.
-    responses: List[bt.Synapse] = await self.dendrite(
-        axons=axons,
-        synapse=synapse,
-        timeout=timeout,
-    )
+    # Make calls to the network with the prompt, the loop runs other forwards while waiting.
+    with self.step_timer.time("dendrite", event, cpu=False):
+        responses: List[bt.Synapse] = await self.dendrite(
+            axons=axons,
+            synapse=synapse,
+            timeout=timeout,
+        )
 
     # Update blacklist with completions so that n-gram filtering can be applied
-    self.blacklist.add(
-        [response.completion for response in responses if response.completion]
-    )
+    with self.step_timer.time("blacklist_update", event):
+        self.blacklist.add(
+            [response.completion for response in responses if response.completion]
+        )
 
     restrict_format_followup_responses(self, responses, task_name)
 
-    rewards : torch.FloatTensor  = compute_rewards(self, task, responses, task_name, event)
+    batch_rewards = self.config.neuron.reward_batch_window > 0
+    with self.step_timer.time("compute_rewards", event, cpu=not batch_rewards):
+        if batch_rewards:
+            # Score on a worker thread so that the reward models can batch the completions of concurrent forwards.
+            rewards: torch.FloatTensor = (
+                await asyncio.get_running_loop().run_in_executor(
+                    None, compute_rewards, self, task, responses, task_name, event
+                )
+            )
+        else:
+            rewards: torch.FloatTensor = compute_rewards(
+                self, task, responses, task_name, event
+            )
     
     # Train the gating model based on the predicted scores and the actual rewards.
-    gating_scores: torch.FloatTensor = self.gating_model(prompt).to(self.device)
-    gating_loss: torch.FloatTensor = self.gating_model.backward(
-        scores=gating_scores[uids], rewards=rewards
-    )
+    with self.step_timer.time("gating", event):
+        gating_scores: torch.FloatTensor = self.gating_model(prompt).to(self.device)
+        gating_loss: torch.FloatTensor = self.gating_model.backward(
+            scores=gating_scores[uids], rewards=rewards
+        )
 
     # Find the best completion given the rewards vector.
     completions: List[str] = [comp.completion for comp in responses]
@@ -237,6 +453,7 @@ async def run_step(
             "block": ttl_get_block(self),
             "step_length": time.time() - start_time,
             "prompt": prompt,
+            "base_text": task.base_text,
             "uids": uids.tolist(),
             "completions": completions,
             "completion_times": completion_times,
@@ -249,6 +466,8 @@ async def run_step(
     )
 
     bt.logging.debug("event:", str(event))
+    if self.step_timer.enabled:
+        bt.logging.debug("step timing percentiles:", str(self.step_timer.percentiles()))
     if not self.config.neuron.dont_save_events:
         logger.log("EVENTS", "events", **event)
 
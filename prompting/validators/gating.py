@@ -19,9 +19,10 @@
 import argparse
 import torch
 import bittensor as bt
-from transformers import AutoModel, AutoTokenizer
 from abc import ABC, abstractmethod
 from prompting.validators.utils import resync_linear_layer
+from prompting.validators.reward.embedding import EmbeddingService
+from prompting.validators.reward.registry import ModelRegistry
 
 
 class BaseGatingModel(torch.nn.Module, ABC):
@@ -143,9 +144,11 @@ class GatingModel(BaseGatingModel):
         self.config = config
         self.num_uids = config.gating.num_uids
         self.device = torch.device(self.config.neuron.device)
-        self.tokenizer = AutoTokenizer.from_pretrained(self.config.gating.model_name)
+        self.tokenizer = ModelRegistry.tokenizer(self.config.gating.model_name)
         self.tokenizer.pad_token = self.tokenizer.eos_token
-        self.model = AutoModel.from_pretrained(self.config.gating.model_name)
+        self.model = ModelRegistry.model(
+            self.config.gating.model_name, device=self.device
+        )
         self.linear = torch.nn.Linear(
             self.model.config.hidden_size, config.gating.num_uids
         )
@@ -240,10 +243,12 @@ class SentenceEmbedGatingModel(BaseGatingModel):
         self.config = config
         self.num_uids = config.gating.num_uids
         self.device = torch.device(self.config.neuron.device)
-        self.tokenizer = AutoTokenizer.from_pretrained(self.config.gating.model_name)
-        self.transformer = AutoModel.from_pretrained(self.config.gating.model_name)
+        # Shares the encoder (and its embedding cache) with the reward models using the same checkpoint.
+        self.embedding_service = EmbeddingService.get(
+            self.config.gating.model_name, self.device
+        )
         self.linear = torch.nn.Linear(
-            self.transformer.config.hidden_size, config.gating.num_uids
+            self.embedding_service.model.config.hidden_size, config.gating.num_uids
         )
         self.optimizer = torch.optim.SGD(
             [{"params": self.linear.parameters()}],
@@ -251,27 +256,6 @@ class SentenceEmbedGatingModel(BaseGatingModel):
             momentum=self.config.gating.momentum,
         )
 
-    def mean_pooling(self, model_output, attention_mask):
-        """Applies mean pooling to the token embeddings generated by the model.
-        Args:
-            model_output (torch.Tensor): Embedding model output, where the first element contains token embeddings.
-            attention_mask (torch.Tensor): Attention mask to indicate valid tokens.
-        Returns:
-            torch.Tensor: Mean-pooled representation of the token embeddings.
-        Notes:
-            - The function calculates the mean-pooled representation using the attention mask for valid tokens.
-            - Input_mask_expanded is created by expanding the attention mask to match the size of token embeddings.
-            - The result is obtained by summing the element-wise multiplication of embeddings and input_mask_expanded,
-              and dividing it by the sum of input_mask_expanded after clamping its values to a minimum of 1e-9.
-        """
-        token_embeddings = model_output[0]
-        input_mask_expanded = (
-            attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-        )
-        return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(
-            input_mask_expanded.sum(1), min=1e-9
-        )
-
     def forward(self, message: str) -> "torch.FloatTensor":
         """Runs a forward pass through the model.
         Args:
@@ -281,27 +265,7 @@ class SentenceEmbedGatingModel(BaseGatingModel):
             scores (:obj:`torch.FloatTensor` of shape :obj:`(network_size)`):
                 Scores for each uids as output by the gating model.
         """
-        encoded_input = self.tokenizer(
-            message,
-            padding=True,
-            truncation=True,
-            return_overflowing_tokens=True,
-            return_tensors="pt",
-        ).to(self.device)
-
-        # Pop the overflow mapping from the input to maintain the expected { input_ids, mask } format of the model
-        _ = encoded_input.pop("overflow_to_sample_mapping")
-
-        with torch.no_grad():
-            embeddings = self.transformer(**encoded_input)
-
-        sentence_embeddings = self.mean_pooling(
-            embeddings, encoded_input["attention_mask"]
-        )
-        sentence_embeddings = torch.nn.functional.normalize(
-            sentence_embeddings, p=2, dim=1
-        )
-        batch_representation = torch.mean(sentence_embeddings, dim=0)
+        batch_representation = self.embedding_service.embed([message], overflow=True)[0]
 
         scores = self.linear(batch_representation)
 
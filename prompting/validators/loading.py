@@ -0,0 +1,83 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+import bittensor as bt
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+
+class ModelLoader:
+    """Loads independent models concurrently on a thread pool and records when each one was loaded.
+
+    `submit` returns a future of the model, `resolve` waits for it. With a single worker the models are
+    loaded one after another as they are submitted.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.executor = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="loader")
+            if max_workers > 1
+            else None
+        )
+        self.start_time = time.perf_counter()
+        # (name, start, end) of every loaded model, in seconds since the loader was created.
+        self.timeline: List[Tuple[str, float, float]] = []
+        self.lock = threading.Lock()
+
+    def load(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Runs the factory, recording it in the timeline."""
+        start = time.perf_counter() - self.start_time
+        model = factory()
+        end = time.perf_counter() - self.start_time
+        with self.lock:
+            self.timeline.append((name, start, end))
+        bt.logging.debug(f"loaded {name} in {end - start:.2f}s")
+        return model
+
+    def submit(self, name: str, factory: Callable[[], Any]) -> Future:
+        """Starts loading the model and returns its future."""
+        if self.executor is not None:
+            return self.executor.submit(self.load, name, factory)
+
+        future = Future()
+        future.set_result(self.load(name, factory))
+        return future
+
+    @staticmethod
+    def resolve(model: Any) -> Any:
+        """Waits for the model if it is still loading, raising the error of its factory if it failed."""
+        return model.result() if isinstance(model, Future) else model
+
+    def log_timeline(self):
+        """Logs when each model started and finished loading."""
+        with self.lock:
+            timeline = sorted(self.timeline, key=lambda entry: entry[1])
+        for name, start, end in timeline:
+            bt.logging.info(
+                f"startup timeline: {name:<24} started at {start:7.2f}s, took {end - start:7.2f}s"
+            )
+        if timeline:
+            bt.logging.info(
+                f"startup timeline: all models loaded after {max(end for _, _, end in timeline):.2f}s"
+            )
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
@@ -47,6 +47,7 @@ class MockGatingModel(BaseGatingModel):
 
 
 class MockRewardModel(BaseRewardModel):
+    cost: float = 0.0
     question_blacklist = []
     answer_blacklist = []
 
@@ -66,7 +67,13 @@ class MockRewardModel(BaseRewardModel):
     def set_counter_to_half(self):
         pass
 
-    def apply(self, prompt: str, completion: List[str], name: str) -> torch.FloatTensor:
+    def apply(
+        self,
+        prompt: str,
+        completion: List[str],
+        name: str,
+        mask: torch.BoolTensor = None,
+    ) -> torch.FloatTensor:
         mock_reward = torch.tensor([1 for _ in completion], dtype=torch.float32)
         return mock_reward, {}
 
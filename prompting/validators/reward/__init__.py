@@ -1,7 +1,15 @@
-from .blacklist import Blacklist
+from .blacklist import Blacklist, BLACKLIST_NGRAM_KEYS
 from .nsfw import NSFWRewardModel
 from .mistral import MistralRewardModel
 from .relevance import RelevanceRewardModel
 from .reward import BaseRewardModel
 from .diversity import DiversityRewardModel
 from .config import RewardModelType, DefaultRewardFrameworkConfig
+from .embedding import EmbeddingService
+from .cache import RewardCache
+from .batching import RewardBatcher, RewardCaller
+from .backend import REWARD_BACKENDS, apply_backend
+from .lazy import LazyRewardModel
+from .registry import ModelRegistry
+from .ann import DIVERSITY_INDEXES, IVFIndex
+from .history import HISTORY_DTYPES, EmbeddingHistory
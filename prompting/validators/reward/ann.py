@@ -0,0 +1,269 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import torch.nn.functional as F
+from typing import List, Tuple
+
+# Search modes of the diversity history, `exact` compares every new completion with the whole history.
+DIVERSITY_INDEXES = ["exact", "ivf"]
+
+
+class InvertedList:
+    """Embeddings of one cluster and their ids, in increasing id order.
+
+    Rows are appended to a buffer that doubles when full, the expired rows at its start are only dropped
+    when the buffer is compacted, so that appending and expiring are amortized constant time.
+    """
+
+    def __init__(self, dim: int, device: torch.device):
+        self.vectors = torch.empty((0, dim), device=device)
+        self.ids = torch.empty((0,), dtype=torch.long, device=device)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def expire(self, oldest_id: int):
+        """Skips the rows older than the id."""
+        self.start += int(
+            torch.searchsorted(self.ids[self.start : self.end], oldest_id)
+        )
+
+    def append(self, ids: torch.LongTensor, vectors: torch.FloatTensor):
+        if self.end + len(ids) > len(self.ids):
+            size = len(self)
+            capacity = max(2 * (size + len(ids)), 16)
+            buffer = torch.empty(
+                (capacity, self.vectors.shape[1]), device=self.vectors.device
+            )
+            buffer[:size] = self.vectors[self.start : self.end]
+            id_buffer = torch.empty(
+                (capacity,), dtype=torch.long, device=self.ids.device
+            )
+            id_buffer[:size] = self.ids[self.start : self.end]
+            self.vectors, self.ids, self.start, self.end = buffer, id_buffer, 0, size
+
+        self.vectors[self.end : self.end + len(ids)] = vectors
+        self.ids[self.end : self.end + len(ids)] = ids
+        self.end += len(ids)
+
+    def view(self, lowest_id: int) -> Tuple[torch.FloatTensor, torch.LongTensor]:
+        """Returns the rows whose id is at least the lowest id, without copying them."""
+        ids = self.ids[self.start : self.end]
+        start = self.start + int(torch.searchsorted(ids, lowest_id))
+        return self.vectors[start : self.end], self.ids[start : self.end]
+
+
+class IVFIndex:
+    """Inverted file index over a sliding window of embeddings.
+
+    Every embedding gets an increasing id and is stored in the list of its nearest centroid, found with
+    spherical k-means. A query only scans the `num_probes` lists whose centroids are the most similar to
+    it in absolute value, so that it finds the nearest as well as the opposite embeddings. Only the last
+    `capacity` ids are part of the window, older ones are skipped and dropped as the lists are updated.
+
+    Until it holds `train_size` embeddings the index has a single list and every search is exact, it is
+    then retrained every time the window has been fully replaced so that the centroids follow the
+    distribution of the completions.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        num_lists: int = 128,
+        num_probes: int = 16,
+        train_size: int = None,
+        iterations: int = 10,
+        seed: int = 0,
+    ):
+        self.capacity = capacity
+        self.num_lists = num_lists
+        self.num_probes = num_probes
+        self.train_size = train_size or min(capacity, 32 * num_lists)
+        self.iterations = iterations
+        self.generator = torch.Generator().manual_seed(seed)
+
+        self.next_id = 0
+        self.trained_at = None
+        self.centroids: torch.FloatTensor = None
+        self.lists: List[InvertedList] = []
+
+    def __len__(self) -> int:
+        return min(self.next_id, self.capacity)
+
+    @property
+    def oldest_id(self) -> int:
+        return max(0, self.next_id - self.capacity)
+
+    def add(self, embeddings: torch.FloatTensor):
+        """Appends the embeddings to the window, expiring the oldest ones once it is full."""
+        embeddings = F.normalize(embeddings.float(), p=2, dim=1)
+        if not self.lists:
+            self.lists = [InvertedList(embeddings.shape[1], embeddings.device)]
+
+        ids = torch.arange(
+            self.next_id, self.next_id + len(embeddings), device=embeddings.device
+        )
+        self.next_id += len(embeddings)
+        self.assign(ids[-self.capacity :], embeddings[-self.capacity :])
+
+        if self.centroids is None:
+            if len(self) >= self.train_size:
+                self.train()
+        elif self.next_id - self.trained_at >= self.capacity:
+            self.train()
+
+    def assign(self, ids: torch.LongTensor, embeddings: torch.FloatTensor):
+        """Appends the embeddings to the lists of their nearest centroids and expires the old ids."""
+        nearest = (
+            (embeddings @ self.centroids.T).argmax(dim=1)
+            if self.centroids is not None
+            else torch.zeros(len(ids), dtype=torch.long, device=ids.device)
+        )
+        for list_id, inverted_list in enumerate(self.lists):
+            inverted_list.expire(self.oldest_id)
+            members = nearest == list_id
+            if members.any():
+                inverted_list.append(ids[members], embeddings[members])
+
+    def embeddings(self) -> Tuple[torch.FloatTensor, torch.LongTensor]:
+        """Returns a copy of the embeddings of the window and their ids, from the oldest to the newest."""
+        views = [inverted_list.view(self.oldest_id) for inverted_list in self.lists]
+        embeddings = torch.cat([vectors for vectors, _ in views])
+        ids = torch.cat([ids for _, ids in views])
+        order = ids.argsort()
+        return embeddings[order], ids[order]
+
+    def reset(self):
+        """Forgets every embedding and the centroids."""
+        self.next_id = 0
+        self.trained_at = None
+        self.centroids = None
+        self.lists = []
+
+    def train(self):
+        """Fits the centroids on the window with spherical k-means and rebuilds the lists."""
+        embeddings, ids = self.embeddings()
+
+        num_lists = min(self.num_lists, len(ids))
+        sample = torch.randperm(len(ids), generator=self.generator)[:num_lists]
+        centroids = embeddings[sample.to(embeddings.device)]
+        for _ in range(self.iterations):
+            nearest = (embeddings @ centroids.T).argmax(dim=1)
+            sums = torch.zeros_like(centroids).index_add_(0, nearest, embeddings)
+            counts = torch.bincount(nearest, minlength=num_lists)
+            # Empty lists keep their previous centroid.
+            centroids = torch.where(
+                counts.unsqueeze(1) > 0, F.normalize(sums, p=2, dim=1), centroids
+            )
+
+        self.centroids = centroids
+        self.trained_at = self.next_id
+        self.lists = [
+            InvertedList(embeddings.shape[1], embeddings.device)
+            for _ in range(num_lists)
+        ]
+        self.assign(ids, embeddings)
+
+    def scan(
+        self,
+        queries: torch.FloatTensor,
+        probes: torch.LongTensor,
+        k: int,
+        skip: int,
+        absolute: bool = True,
+    ) -> Tuple[torch.FloatTensor, torch.LongTensor]:
+        """Returns the `k` largest absolute similarities of each query within its probed lists, or the `k`
+        largest similarities when `absolute` is not set.
+
+        Each list is scanned once for all the queries probing it, the `k` best rows of every probed list
+        are then merged. Missing neighbours have a similarity of -1 and an id of -1.
+        """
+        lowest_id = self.oldest_id + skip
+        num_queries, num_probes = probes.shape
+        similarities = torch.full(
+            (num_queries, num_probes * k), -1.0, device=queries.device
+        )
+        ids = torch.full_like(similarities, -1, dtype=torch.long)
+        offsets = torch.arange(k, device=queries.device)
+
+        for list_id in probes.unique().tolist():
+            vectors, list_ids = self.lists[list_id].view(lowest_id)
+            if len(list_ids) == 0:
+                continue
+
+            rows, ranks = (probes == list_id).nonzero(as_tuple=True)
+            list_similarities = queries[rows] @ vectors.T
+            if absolute:
+                list_similarities = list_similarities.abs()
+            list_similarities, positions = list_similarities.topk(
+                min(k, len(list_ids)), dim=1
+            )
+            columns = (ranks * k).unsqueeze(1) + offsets[: positions.shape[1]]
+            similarities[rows.unsqueeze(1), columns] = list_similarities
+            ids[rows.unsqueeze(1), columns] = list_ids[positions]
+
+        similarities, positions = similarities.topk(k, dim=1)
+        return similarities, ids.gather(1, positions)
+
+    def exact_search(
+        self, queries: torch.FloatTensor, k: int, skip: int = 0, absolute: bool = True
+    ) -> Tuple[torch.FloatTensor, torch.LongTensor]:
+        """Returns the `k` largest absolute cosine similarities of each query with the window, and their ids.
+        Args:
+            queries (:obj:`torch.FloatTensor`):
+                Embeddings to search for.
+            k (:obj:`int`):
+                Number of neighbours, the window must hold at least `skip + k` embeddings.
+            skip (:obj:`int`):
+                Number of the oldest embeddings that are left out of the search.
+            absolute (:obj:`bool`):
+                Rank the neighbours by absolute cosine similarity, otherwise by cosine similarity.
+        Returns:
+            similarities (:obj:`torch.FloatTensor`):
+                Absolute, or raw, cosine similarities in decreasing order, of shape (queries, k).
+            ids (:obj:`torch.LongTensor`):
+                Ids of the neighbours.
+        """
+        queries = F.normalize(queries.float(), p=2, dim=1)
+        probes = torch.arange(len(self.lists), device=queries.device)
+        return self.scan(queries, probes.expand(len(queries), -1), k, skip, absolute)
+
+    def search(
+        self, queries: torch.FloatTensor, k: int, skip: int = 0, absolute: bool = True
+    ) -> Tuple[torch.FloatTensor, torch.LongTensor]:
+        """Approximate :func:`exact_search`, only scanning the `num_probes` most similar lists of each query."""
+        if self.centroids is None or self.num_probes >= len(self.lists):
+            return self.exact_search(queries, k, skip, absolute)
+
+        queries = F.normalize(queries.float(), p=2, dim=1)
+        centroid_similarities = queries @ self.centroids.T
+        if absolute:
+            centroid_similarities = centroid_similarities.abs()
+        probes = centroid_similarities.topk(self.num_probes, dim=1)[1]
+        similarities, ids = self.scan(queries, probes, k, skip, absolute)
+
+        # Too few neighbours in the probed lists, search the whole window instead.
+        missing = (ids < 0).any(dim=1)
+        if missing.any():
+            similarities[missing], ids[missing] = self.exact_search(
+                queries[missing], k, skip, absolute
+            )
+        return similarities, ids
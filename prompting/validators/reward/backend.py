@@ -0,0 +1,57 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import bittensor as bt
+
+# Inference backends of the auxiliary (NSFW, relevance and diversity) reward models.
+REWARD_BACKENDS = ["fp32", "int8"]
+
+
+def apply_backend(model: torch.nn.Module, backend: str, device: str) -> torch.nn.Module:
+    """Prepares a transformer for inference with the backend.
+    Args:
+        model (:obj:`torch.nn.Module`):
+            Model with fp32 weights, already moved to the device.
+        backend (:obj:`str`):
+            `fp32` keeps the model as is, `int8` quantizes the weights of its linear layers to int8 and
+            quantizes their activations on the fly (dynamic quantization).
+        device (:obj:`str`):
+            Device the model runs on, int8 is only supported on cpu.
+    Returns:
+        model (:obj:`torch.nn.Module`):
+            Model ready for inference.
+    """
+    if backend not in REWARD_BACKENDS:
+        raise ValueError(
+            f"Unknown reward backend {backend}, expected one of {REWARD_BACKENDS}"
+        )
+
+    model.eval()
+    if backend == "fp32":
+        return model
+
+    if torch.device(device).type != "cpu":
+        bt.logging.warning(
+            f"The {backend} reward backend only runs on cpu, keeping fp32 weights on {device}."
+        )
+        return model
+
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
@@ -0,0 +1,158 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+from typing import List
+
+
+class RewardJob:
+    """Completions of a step waiting to be scored by a batch."""
+
+    def __init__(self, prompt: str, completions: List[str], name: str):
+        self.prompt = prompt
+        self.completions = completions
+        self.name = name
+        self.reward_events = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class RewardCaller:
+    """Step expected to submit a job to a batcher, see :func:`RewardBatcher.expect`.
+
+    Entering the caller marks the current thread as the step, so that its submission is recognized.
+    The step stops being expected once it submits, or once it leaves or is released without submitting.
+    """
+
+    def __init__(self, batcher: "RewardBatcher"):
+        self.batcher = batcher
+        self.expected = True
+
+    def __enter__(self) -> "RewardCaller":
+        self.batcher.local.caller = self
+        return self
+
+    def __exit__(self, *exc_info):
+        self.batcher.local.caller = None
+        self.release()
+
+    def release(self):
+        self.batcher.release(self)
+
+
+class RewardBatcher:
+    """Coalesces the scoring requests of concurrent steps into batches of a reward model.
+
+    The first thread submitting a job becomes the leader of the next batch: it waits until no other
+    expected step is left to submit, for at most `window` seconds or until `max_batch_size` completions
+    are queued, then scores every queued job with a single call to :func:`BaseRewardModel.get_batch_rewards`
+    and hands each job its own reward events. A step alone is therefore scored without waiting. The
+    other threads wait for their job to be scored. A new leader can gather the next batch while the
+    previous one is being scored.
+    """
+
+    def __init__(self, model, window: float = 0.01, max_batch_size: int = 64):
+        self.model = model
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.condition = threading.Condition()
+        self.queue: List[RewardJob] = []
+        self.queued_completions = 0
+        self.has_leader = False
+        # Steps that are scoring and have not submitted their job yet.
+        self.expected = 0
+        self.local = threading.local()
+
+    def expect(self) -> RewardCaller:
+        """Registers a step that is about to score, the leaders wait for its job."""
+        with self.condition:
+            self.expected += 1
+        return RewardCaller(self)
+
+    def release(self, caller: RewardCaller):
+        """Stops waiting for the step, if it is still expected."""
+        with self.condition:
+            if caller.expected:
+                caller.expected = False
+                self.expected -= 1
+                self.condition.notify_all()
+
+    def submit(self, prompt: str, completions: List[str], name: str) -> list:
+        """Scores the completions together with the jobs of the concurrent steps.
+        Args:
+            prompt (:obj:`str`):
+                Prompt of the completions.
+            completions (:obj:`List[str]`):
+                Completions to score.
+            name (:obj:`str`):
+                Name of the task.
+        Returns:
+            reward_events (:obj:`list`):
+                Reward event of every completion, as returned by the model's get_rewards.
+        """
+        job = RewardJob(prompt, completions, name)
+
+        with self.condition:
+            self.queue.append(job)
+            self.queued_completions += len(completions)
+            caller = getattr(self.local, "caller", None)
+            if caller is not None and caller.expected:
+                caller.expected = False
+                self.expected -= 1
+            is_leader = not self.has_leader
+            if is_leader:
+                self.has_leader = True
+            else:
+                # Wake the leader up early if the batch is full or complete.
+                self.condition.notify_all()
+
+        if is_leader:
+            self.run_batch()
+
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.reward_events
+
+    def run_batch(self):
+        """Waits for the expected steps or for the batch to fill up, and scores it."""
+        deadline = time.monotonic() + self.window
+        with self.condition:
+            while self.expected > 0 and self.queued_completions < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            jobs, self.queue = self.queue, []
+            self.queued_completions = 0
+            self.has_leader = False
+
+        try:
+            batch_reward_events = self.model.get_batch_rewards(
+                [(job.prompt, job.completions, job.name) for job in jobs]
+            )
+            for job, reward_events in zip(jobs, batch_reward_events):
+                job.reward_events = reward_events
+        except Exception as error:
+            for job in jobs:
+                job.error = error
+        finally:
+            for job in jobs:
+                job.done.set()
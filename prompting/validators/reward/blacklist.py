@@ -19,16 +19,32 @@
 import re
 import torch
 import math
-from fuzzywuzzy import fuzz
+import bisect
+import heapq
+import numpy as np
 from typing import List, Union
 from .config import RewardModelType
 from .reward import BaseRewardModel, BaseRewardEvent
-from transformers import BertTokenizer
+from .registry import ModelRegistry
+from .matching import PhraseMatcher
+from .counter import NgramCounter
+from transformers import BertTokenizerFast
 from dataclasses import dataclass
 
 
 # TODO: Use CLI arguments to set blacklist values: the most important being the boundary value and max_size
 
+# Keys of the n-gram counter, `hash` replaces the tuples of token ids with 64-bit rolling hashes.
+BLACKLIST_NGRAM_KEYS = ["tuple", "hash"]
+
+# Separator joining the completions of a batch for preprocessing, a whitespace character for the
+# regular expressions and the tokenizer.
+BATCH_SEPARATOR = "\x1e"
+
+# Base of the polynomial rolling hash, and the multiplier mixing the n-gram length into it.
+HASH_BASE = np.uint64(0x100000001B3)
+HASH_LENGTH_SALT = np.uint64(0x9E3779B97F4A7C15)
+
 
 @dataclass
 class BlacklistRewardEvent(BaseRewardEvent):
@@ -37,6 +53,10 @@ class BlacklistRewardEvent(BaseRewardEvent):
 
 
 class Blacklist(BaseRewardModel):
+    tokenizer_path = "bert-base-cased"
+    cost: float = 0.1
+    stateful: bool = True
+
     @property
     def name(self) -> str:
         return RewardModelType.blacklist.value
@@ -55,6 +75,7 @@ class Blacklist(BaseRewardModel):
         error: float = 0.001,
         memory_lim: int = 1_000_000,
         frequency_multiplier: float = 100,
+        ngram_keys: str = "tuple",
     ):
         """N-gram blacklist reward model which penalizes overused phrases in the network
 
@@ -72,16 +93,29 @@ class Blacklist(BaseRewardModel):
             error (float, optional): Error parameter for lossy sampling, should be as small as possible, further decreasing it further will increase memory usage. (support should be >> error )
             memory_lim (int, optional): Max number of counter entry to save for memory protection.
             frequency_multiplier (float, optional): Multiplier for phrases frequency. Default to 100.
+            ngram_keys (str, optional): Keys of the counter, `tuple` of token ids or 64-bit rolling `hash`. With hashes the n-grams are decoded when they cross the support threshold, and the counter is stored as numpy arrays. Defaults to `tuple`.
         """
         super().__init__()
-
-        self.counter = {}
+        if ngram_keys not in BLACKLIST_NGRAM_KEYS:
+            raise ValueError(
+                f"Unknown n-gram keys {ngram_keys}, expected one of {BLACKLIST_NGRAM_KEYS}"
+            )
+
+        self.ngram_keys = ngram_keys
+        self.significant = {}  # Decoded n-grams above the support threshold
+        self.significant_heap = (
+            []
+        )  # (frequency + max_error, n-gram) of the significant n-grams
+        self.candidates = {}  # Token ids of hashed n-grams near the support threshold
 
         self.n_min = n_min
         self.n_max = n_max
+        self.counter = self.new_counter()
         self.word_limit = word_limit
 
         self.significance_scores = {}  # Store significance scores
+        self.matcher = None  # Index of the significant n-grams, see get_matcher
+        self._matcher_scores = None
         self.A = A
         self.boundary = boundary
         self.partial_ratio_boundary = partial_ratio_boundary
@@ -100,7 +134,9 @@ class Blacklist(BaseRewardModel):
         self.num_completion = 0
 
         self.half_life = half_life
-        self.tokenizer = BertTokenizer.from_pretrained("bert-base-cased")
+        self.tokenizer = ModelRegistry.tokenizer(
+            self.tokenizer_path, tokenizer_class=BertTokenizerFast
+        )
         self.memory_lim = memory_lim
         self.frequency_multiplier = frequency_multiplier
 
@@ -111,22 +147,33 @@ class Blacklist(BaseRewardModel):
             texts (list): batch of completion texts
         """
 
-        for text in texts:
-            # Extract n-grams from lowercased text
-            ngrams = self.extract_ngrams(text.lower())
+        with self.lock:
+            # Tokenize the whole batch at once
+            batch_words = self.tokenize_batch(texts)
+            for words in batch_words:
+                if self.ngram_keys == "hash":
+                    ngrams = self.hash_ngrams(words)
+                    if len(ngrams):
+                        self._add_ngrams(ngrams, words)
+                    continue
 
-            if ngrams:
-                self._add_ngrams(ngrams)
+                ngrams = self.ngrams(words)
 
-    def extract_ngrams(self, text: str) -> List[tuple]:
-        """Extract n-grams from text string
+                if ngrams:
+                    self._add_ngrams(ngrams)
+
+    def new_counter(self) -> Union[dict, NgramCounter]:
+        """Empty n-gram counter, a dictionary of tuples or a columnar counter of hashes."""
+        return NgramCounter() if self.ngram_keys == "hash" else {}
+
+    def tokenize(self, text: str) -> List[int]:
+        """Preprocess and tokenize text string
 
         Args:
             text (str): completion text
 
         Returns:
-            list: List of n-gram tuples
-
+            list: Token ids of the text, without the special tokens
         """
 
         if self.preprocess:
@@ -138,29 +185,155 @@ class Blacklist(BaseRewardModel):
         if self.word_limit is not None:
             words = words[: self.word_limit]
 
+        return words
+
+    def tokenize_batch(self, texts: List[str]) -> List[List[int]]:
+        """Preprocess and tokenize a batch of text strings, see :func:`tokenize`
+
+        The texts are joined to be lowercased and preprocessed in a single pass, then tokenized
+        together by the fast tokenizer.
+
+        Args:
+            texts (list): batch of completion texts
+
+        Returns:
+            list: Token ids of each text, without the special tokens
+        """
+
+        if not texts:
+            return []
+
+        text = BATCH_SEPARATOR.join(texts).lower()
+        if self.preprocess:
+            # remove all punctuation
+            text = self.preprocess.sub("", text)
+        texts_lower = text.split(BATCH_SEPARATOR)
+
+        # Texts containing the separator, or a preprocessing removing it, break the split.
+        if len(texts_lower) != len(texts):
+            return [self.tokenize(text.lower()) for text in texts]
+
+        batch_words = self.tokenizer(texts_lower, add_special_tokens=False)["input_ids"]
+
+        if self.word_limit is not None:
+            batch_words = [words[: self.word_limit] for words in batch_words]
+
+        return batch_words
+
+    def ngrams(self, words: List[int]) -> List[tuple]:
+        """N-gram tuples of a tokenized text
+
+        Args:
+            words (list): Token ids of the text
+
+        Returns:
+            list: List of n-gram tuples
+        """
+
         ngrams = []
         for i in range(self.n_min, self.n_max + 1):
             ngrams.extend(zip(*[words[j:] for j in range(i)]))
 
         return ngrams
 
-    def _add_ngrams(self, ngrams: List[tuple]):
+    def extract_ngrams(self, text: str) -> List[tuple]:
+        """Extract n-grams from text string
+
+        Args:
+            text (str): completion text
+
+        Returns:
+            list: List of n-gram tuples
+
+        """
+
+        return self.ngrams(self.tokenize(text))
+
+    def hash_ngrams(self, words: List[int]) -> np.ndarray:
+        """Hash the n-grams of a tokenized text with a polynomial rolling hash
+
+        Args:
+            words (list): Token ids of the text
+
+        Returns:
+            np.ndarray: 64-bit hash of every n-gram, in the order of :func:`extract_ngrams`
+        """
+
+        ids = np.asarray(words, dtype=np.uint64)
+        hashes = []
+        rolling = np.zeros(len(ids), dtype=np.uint64)
+        # Array arithmetic wraps modulo 2**64.
+        salts = np.arange(self.n_max + 1, dtype=np.uint64) * HASH_LENGTH_SALT
+        for n in range(1, self.n_max + 1):
+            # Extend the hashes of the (n - 1)-grams by one token.
+            rolling = rolling[: max(0, len(ids) - n + 1)] * HASH_BASE + ids[n - 1 :]
+            if n >= self.n_min:
+                hashes.append(rolling ^ salts[n])
+
+        if not hashes:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(hashes).view(np.int64)
+
+    def ngram_tokens(self, words: List[int], index: int) -> tuple:
+        """Token ids of the n-gram at an index of :func:`hash_ngrams`
+
+        Args:
+            words (list): Token ids of the text
+            index (int): Index of the n-gram hash
+
+        Returns:
+            tuple: Token ids of the n-gram
+        """
+
+        offsets = [0]
+        for n in range(self.n_min, self.n_max + 1):
+            offsets.append(offsets[-1] + max(0, len(words) - n + 1))
+        position = bisect.bisect_right(offsets, index) - 1
+        start = index - offsets[position]
+        return tuple(words[start : start + self.n_min + position])
+
+    def _add_ngrams(
+        self, ngrams: Union[List[tuple], np.ndarray], words: List[int] = None
+    ):
         """Adds n-grams to counter, removing old n-grams periodically.
         Counting and pruning method based on Lossy counter.
         Reference: https://files.ifi.uzh.ch/dbtg/sdbs13/T01.3.pdf
 
         Args:
-            ngrams (List[tuple]): List of n-gram tuples
+            ngrams (Union[List[tuple], np.ndarray]): List of n-gram tuples, or array of n-gram hashes
+            words (List[int], optional): Token ids the n-grams are hashed from, to decode the hashed n-grams crossing the support threshold
         """
 
-        for ngram in ngrams:
-            if ngram in self.counter:
-                self.counter[ngram][0] += 1
-            else:
-                # Store the tuple (frequency, max_error)
-                self.counter[ngram] = [1, self.w_current - 1]
-
-            self.num_ngram += 1
+        threshold = self.support_threshold()
+        if isinstance(self.counter, NgramCounter):
+            # Count the whole completion at once, keep the token ids of the n-grams that a drop of the
+            # threshold could make significant, then decode the n-grams crossing the threshold.
+            keys, positions, totals = self.counter.add(ngrams, self.w_current - 1)
+            near = totals > self.candidate_threshold()
+            for ngram, index in zip(keys[near].tolist(), positions[near].tolist()):
+                if ngram not in self.candidates:
+                    self.candidates[ngram] = self.ngram_tokens(words, index)
+
+            crossed = totals > threshold
+            for ngram in keys[crossed].tolist():
+                if ngram not in self.significant:
+                    self.promote(ngram, self.candidates[ngram])
+            self.num_ngram += len(ngrams)
+        else:
+            for ngram in ngrams:
+                if ngram in self.counter:
+                    count = self.counter[ngram]
+                    count[0] += 1
+                    if (
+                        count[0] + count[1] > threshold
+                        and ngram not in self.significant
+                    ):
+                        self.promote(ngram, ngram)
+                else:
+                    # Store the tuple (frequency, max_error)
+                    self.counter[ngram] = [1, self.w_current - 1]
+
+                self.num_ngram += 1
 
         self.num_completion += 1
 
@@ -174,12 +347,104 @@ class Blacklist(BaseRewardModel):
             self.w_current += 1
             self.prune()
 
+        # The n-grams were promoted against the threshold in effect when they were counted. Resetting the
+        # window index after a safety prune lowers it, promote the n-grams it uncovers.
+        if self.support_threshold() < threshold:
+            self.promote_above(self.support_threshold())
+
         # Apply half life for the counter
         if self.num_completion > self.half_life:
             self.set_counter_to_half()
 
+    def support_threshold(self) -> float:
+        """Count above which an n-gram is significant."""
+        return max(self.support * self.num_completion, self.w_current + 1)
+
+    def candidate_threshold(self) -> float:
+        """Count above which the token ids of a hashed n-gram are kept.
+
+        The support threshold never falls below the threshold of the current window, at least 2. It only
+        drops when a window resets the index raised by safety prunes, to no less than that, or when the
+        counter is halved past the half life, to no less than the threshold of half the completions while
+        the counts are halved rounding up. An n-gram counted below both bounds cannot become significant
+        before it is counted again.
+
+        Returns:
+            float: Lowest count from which an n-gram can become significant without being counted again
+        """
+
+        def lowest(num_completion: int) -> float:
+            return max(
+                self.support * num_completion,
+                math.ceil(num_completion / self.window),
+                2,
+            )
+
+        halved = math.ceil(max(self.num_completion, self.half_life + 1) / 2)
+        return min(lowest(self.num_completion), 2 * lowest(halved) - 2)
+
+    def promote(self, ngram: tuple, tokens: tuple):
+        """Add an n-gram that crossed the support threshold to the significant n-grams.
+
+        Args:
+            ngram (tuple): Key of the n-gram in the counter
+            tokens (tuple): Token ids of the n-gram
+        """
+        decoded_ngram = self.tokenizer.decode(tokens)
+        # N-grams decoding to fewer than n_min words are significant but never scored.
+        self.significant[ngram] = (
+            decoded_ngram if len(decoded_ngram.split()) >= self.n_min else None
+        )
+        count = self.counter[ngram]
+        heapq.heappush(self.significant_heap, (count[0] + count[1], ngram))
+
+    def promote_above(self, threshold: float):
+        """Add the counted n-grams above the support threshold that are not significant yet.
+
+        Args:
+            threshold (float): Support threshold
+        """
+        if isinstance(self.counter, NgramCounter):
+            keys, _ = self.counter.above(threshold)
+            for ngram in keys.tolist():
+                if ngram not in self.significant:
+                    self.promote(ngram, self.candidates[ngram])
+            return
+
+        for ngram, count in self.counter.items():
+            if count[0] + count[1] > threshold and ngram not in self.significant:
+                self.promote(ngram, ngram)
+
+    def demote(self, threshold: float):
+        """Remove the n-grams whose count fell below the support threshold from the significant n-grams.
+
+        The heap holds a lower bound of the count of every significant n-gram, so only the n-grams whose
+        bound is below the threshold are visited, and those still above it are pushed back with their count.
+
+        Args:
+            threshold (float): Support threshold
+        """
+        heap = self.significant_heap
+        while heap and heap[0][0] <= threshold:
+            _, ngram = heapq.heappop(heap)
+            if ngram not in self.significant:
+                continue
+            count = self.counter[ngram]
+            if count[0] + count[1] > threshold:
+                heapq.heappush(heap, (count[0] + count[1], ngram))
+            else:
+                del self.significant[ngram]
+
     def prune(self):
         """Prune the counter when the count is smaller then bucket index."""
+        if isinstance(self.counter, NgramCounter):
+            self.counter.prune(self.w_current)
+            for ngram in [key for key in self.significant if key not in self.counter]:
+                del self.significant[ngram]
+            for ngram in [key for key in self.candidates if key not in self.counter]:
+                del self.candidates[ngram]
+            return
+
         prune_ele = []
         for ele, (frequency, max_error) in self.counter.items():
             if frequency + max_error <= self.w_current:
@@ -187,36 +452,42 @@ class Blacklist(BaseRewardModel):
 
         for ele in prune_ele:
             del self.counter[ele]
+            self.significant.pop(ele, None)
 
     def reset(self):
         """Reset counters to initial values."""
         self.num_ngram = 0
         self.num_completion = 0
         self.w_current = 1
-        self.counter = {}
+        self.counter = self.new_counter()
+        self.significant = {}
+        self.significant_heap = []
+        self.candidates = {}
         self.significance_scores = {}
         self._last_update = 0
 
     def calculate_significance(self) -> dict:
-        """Calculate significance of all n-grams in counter. By construction, n-grams with count 1 will have significance 0.
+        """Calculate significance of the n-grams above the support threshold. By construction, n-grams with count 1 will have significance 0.
+
+        The n-grams above the threshold are maintained as they are counted, so only they are scored
+        instead of the whole counter.
 
         Returns:
             dict: Dictionary of n-gram tuples and their significance scores
         """
 
+        self.demote(self.support_threshold())
+
         significance_scores = {}
-        for ngram, count in self.counter.items():
-            if count[0] + count[1] > max(
-                self.support * self.num_completion, self.w_current + 1
-            ):
-                decoded_ngram = self.tokenizer.decode(ngram)
-                if len(decoded_ngram.split()) >= self.n_min:
-                    # calculate significance score for ngram
-                    significance_scores[decoded_ngram] = (
-                        self.A ** (len(decoded_ngram.split()) - 1)
-                        * ((count[0] + count[1]) / self.num_completion)
-                        * self.frequency_multiplier
-                    )
+        for ngram, decoded_ngram in self.significant.items():
+            if decoded_ngram is not None:
+                count = self.counter[ngram]
+                # calculate significance score for ngram
+                significance_scores[decoded_ngram] = (
+                    self.A ** (len(decoded_ngram.split()) - 1)
+                    * ((count[0] + count[1]) / self.num_completion)
+                    * self.frequency_multiplier
+                )
 
         self._last_update = self.num_completion
 
@@ -236,6 +507,25 @@ class Blacklist(BaseRewardModel):
 
         return self.significance_scores
 
+    def get_matcher(self, scores: dict) -> PhraseMatcher:
+        """Get the index of the n-grams with significance above the boundary, rebuilding it when the scores change.
+
+        Args:
+            scores (dict): Significance scores of the n-grams
+
+        Returns:
+            PhraseMatcher: Index of the n-grams above the boundary, in decreasing significance
+        """
+
+        if self._matcher_scores is not scores:
+            self.matcher = PhraseMatcher(
+                [ngram for ngram, score in scores.items() if score > self.boundary],
+                self.partial_ratio_boundary,
+            )
+            self._matcher_scores = scores
+
+        return self.matcher
+
     def most_common(self, n: int = 10) -> dict:
         """Get most common n-grams in queue
 
@@ -268,12 +558,28 @@ class Blacklist(BaseRewardModel):
         self.num_ngram = math.ceil(self.num_ngram / 2)
         self.num_completion = math.ceil(self.num_completion / 2)
         self.w_current = math.ceil(self.num_completion / self.window)
-        self.counter = {
-            tokens: [math.ceil(count[0] / 2), math.ceil(count[1] / 2)]
-            for tokens, count in self.counter.items()
-        }
         self._last_update = 0
 
+        if isinstance(self.counter, NgramCounter):
+            self.counter.halve()
+        else:
+            self.counter = {
+                tokens: [math.ceil(count[0] / 2), math.ceil(count[1] / 2)]
+                for tokens, count in self.counter.items()
+            }
+
+        # Rounding can lift n-grams above the halved threshold, rebuild the significant n-grams.
+        threshold = self.support_threshold()
+        self.significant_heap = []
+        for ngram in list(self.significant):
+            count = self.counter[ngram]
+            if count[0] + count[1] > threshold:
+                self.significant_heap.append((count[0] + count[1], ngram))
+            else:
+                del self.significant[ngram]
+        heapq.heapify(self.significant_heap)
+        self.promote_above(threshold)
+
     def reward(self, prompt: str, completion: str, name: str) -> BlacklistRewardEvent:
         """Reward function for blacklist reward model. Returns 1 if completion contains an n-gram with significance above the boundary, 0 otherwise.
 
@@ -295,17 +601,15 @@ class Blacklist(BaseRewardModel):
         # Get significance scores
         scores = self.get_significance()
 
-        # Check if any n-grams have significance above the boundary
-        for ngram, score in scores.items():
-            if (
-                score > self.boundary
-                and fuzz.partial_ratio(ngram, completion.lower())
-                > self.partial_ratio_boundary
-            ):
-                reward_event.reward = 0
-                reward_event.matched_ngram = ngram
-                reward_event.significance_score = score
-                return reward_event
+        # Check if any n-grams with significance above the boundary fuzzy match the completion
+        matcher = self.get_matcher(scores)
+        index = matcher.match(completion.lower())
+        if index is not None:
+            ngram = matcher.phrases[index]
+            reward_event.reward = 0
+            reward_event.matched_ngram = ngram
+            reward_event.significance_score = scores[ngram]
+            return reward_event
 
         reward_event.reward = 1
         return reward_event
@@ -0,0 +1,73 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class RewardCache:
+    """LRU cache of reward events for duplicate completions, bounded in size and in age.
+
+    Entries are keyed by the reward model name, a hash of the prompt and a hash of the
+    whitespace-normalized completion, so byte-identical and whitespace-identical completions
+    to the same prompt are only scored once by a stateless reward model.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(model_name: str, prompt: str, completion: str) -> tuple:
+        """Returns the cache key of a completion scored by the given model."""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        completion_hash = hashlib.sha256(
+            " ".join(completion.split()).encode("utf-8")
+        ).hexdigest()
+        return model_name, prompt_hash, completion_hash
+
+    def get(self, key: tuple) -> Optional[Any]:
+        """Returns the cached value for the key, or None if it is missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            timestamp, value = entry
+            if time.monotonic() - timestamp > self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: Any):
+        """Stores the value, evicting the least recently used entries above max_size."""
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,185 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+from typing import List, Tuple
+
+# Multiplier spreading the keys over the slots of the index (Fibonacci hashing).
+SLOT_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class NgramCounter:
+    """Lossy counter of hashed n-grams stored as parallel numpy arrays.
+
+    Row `i` holds the 64-bit key, the frequency and the maximum error of one n-gram. An open addressing
+    index with linear probing maps the keys to their rows; it is kept at most half full and only
+    rebuilt when it grows or when the counter is pruned, since rows are never deleted one by one.
+    Lookups and insertions of a whole completion are vectorized, pruning is a mask over the rows
+    followed by a rebuild of the index, and halving is a single operation on the count arrays.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.keys = np.zeros(capacity, dtype=np.int64)
+        self.frequency = np.zeros(capacity, dtype=np.int32)
+        self.max_error = np.zeros(capacity, dtype=np.int32)
+        self.bits = max(1, int(2 * capacity - 1).bit_length())
+        self.index = np.full(1 << self.bits, -1, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, key: int) -> bool:
+        return self.find(np.array([key], dtype=np.int64))[0] >= 0
+
+    def __getitem__(self, key: int) -> List[int]:
+        """Returns a copy of the [frequency, max_error] of the key."""
+        row = self.find(np.array([key], dtype=np.int64))[0]
+        if row < 0:
+            raise KeyError(key)
+        return [int(self.frequency[row]), int(self.max_error[row])]
+
+    def items(self) -> List[Tuple[int, List[int]]]:
+        return [
+            (key, [frequency, max_error])
+            for key, frequency, max_error in zip(
+                self.keys[: self.size].tolist(),
+                self.frequency[: self.size].tolist(),
+                self.max_error[: self.size].tolist(),
+            )
+        ]
+
+    def slots(self, keys: np.ndarray) -> np.ndarray:
+        """Home slot of every key in the index."""
+        return (
+            (keys.view(np.uint64) * SLOT_MULTIPLIER) >> np.uint64(64 - self.bits)
+        ).astype(np.int64)
+
+    def find(self, keys: np.ndarray) -> np.ndarray:
+        """Returns the row of every key, or -1 for the keys that are not counted."""
+        mask = (1 << self.bits) - 1
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        slots = self.slots(keys)
+        pending = np.arange(len(keys))
+        while len(pending):
+            candidates = self.index[slots[pending]].astype(np.int64)
+            occupied = candidates >= 0
+            found = occupied & (self.keys[np.maximum(candidates, 0)] == keys[pending])
+            rows[pending[found]] = candidates[found]
+
+            # Probe the next slot until the key or an empty slot is found.
+            pending = pending[occupied & ~found]
+            slots[pending] = (slots[pending] + 1) & mask
+        return rows
+
+    def insert(self, rows: np.ndarray):
+        """Adds rows whose keys are not in the index yet."""
+        mask = (1 << self.bits) - 1
+        slots = self.slots(self.keys[rows])
+        pending = np.arange(len(rows))
+        while len(pending):
+            free = pending[self.index[slots[pending]] < 0]
+            # Among the rows probing the same free slot, the first one takes it.
+            claimed, first = np.unique(slots[free], return_index=True)
+            self.index[claimed] = rows[free[first]]
+
+            taken = np.ones(len(slots), dtype=bool)
+            taken[pending] = False
+            taken[free[first]] = True
+            pending = np.flatnonzero(~taken)
+            slots[pending] = (slots[pending] + 1) & mask
+
+    def reindex(self, capacity: int):
+        """Rebuilds the index with room for `capacity` rows."""
+        self.bits = max(1, int(2 * capacity - 1).bit_length())
+        self.index = np.full(1 << self.bits, -1, dtype=np.int32)
+        self.insert(np.arange(self.size))
+
+    def reserve(self, size: int):
+        """Grows the arrays and the index so that they can hold `size` rows."""
+        if size > len(self.keys):
+            capacity = max(size, 2 * len(self.keys))
+            for name in ["keys", "frequency", "max_error"]:
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[: self.size] = array[: self.size]
+                setattr(self, name, grown)
+        if 2 * size > len(self.index):
+            self.reindex(size)
+
+    def add(
+        self, keys: np.ndarray, max_error: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Counts every occurrence of the keys, the new keys start with the maximum error.
+        Args:
+            keys (:obj:`np.ndarray`):
+                Keys of the n-grams of a completion, with repetitions.
+            max_error (:obj:`int`):
+                Maximum error of the keys that are not counted yet.
+        Returns:
+            keys (:obj:`np.ndarray`):
+                Distinct keys.
+            positions (:obj:`np.ndarray`):
+                Position of the first occurrence of each distinct key.
+            totals (:obj:`np.ndarray`):
+                Frequency plus maximum error of each distinct key after counting it.
+        """
+        keys, positions, counts = np.unique(keys, return_index=True, return_counts=True)
+        rows = self.find(keys)
+
+        new = rows < 0
+        count = int(new.sum())
+        if count:
+            self.reserve(self.size + count)
+            rows[new] = np.arange(self.size, self.size + count)
+            self.keys[rows[new]] = keys[new]
+            self.frequency[rows[new]] = 0
+            self.max_error[rows[new]] = max_error
+            self.size += count
+            self.insert(rows[new])
+
+        self.frequency[rows] += counts.astype(np.int32)
+        totals = self.frequency[rows].astype(np.int64) + self.max_error[rows]
+        return keys, positions, totals
+
+    def above(self, bound: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the keys whose frequency plus maximum error is above the bound, and their totals."""
+        totals = (
+            self.frequency[: self.size].astype(np.int64) + self.max_error[: self.size]
+        )
+        mask = totals > bound
+        return self.keys[: self.size][mask], totals[mask]
+
+    def prune(self, bound: float):
+        """Removes the keys whose frequency plus maximum error is not above the bound."""
+        totals = (
+            self.frequency[: self.size].astype(np.int64) + self.max_error[: self.size]
+        )
+        keep = np.flatnonzero(totals > bound)
+        if len(keep) == self.size:
+            return
+        for name in ["keys", "frequency", "max_error"]:
+            array = getattr(self, name)
+            array[: len(keep)] = array[keep]
+        self.size = len(keep)
+        self.reindex(max(self.size, len(self.keys) // 2))
+
+    def halve(self):
+        """Halves the frequencies and maximum errors, rounding up."""
+        self.frequency[: self.size] = (self.frequency[: self.size] + 1) // 2
+        self.max_error[: self.size] = (self.max_error[: self.size] + 1) // 2
@@ -21,33 +21,13 @@ import torch.nn.functional as F
 from typing import List, Union
 from .config import RewardModelType
 from .reward import BaseRewardModel, BaseRewardEvent
-from transformers import AutoTokenizer, AutoModel
+from .embedding import EmbeddingService
+from .ann import DIVERSITY_INDEXES, IVFIndex
+from .history import EmbeddingHistory
 from dataclasses import dataclass
 from torchmetrics.functional import pairwise_cosine_similarity
 
 
-def mean_pooling(model_output, attention_mask):
-    """Applies mean pooling to the token embeddings generated by the model.
-    Args:
-        model_output (torch.Tensor): Embedding model output, where the first element contains token embeddings.
-        attention_mask (torch.Tensor): Attention mask to indicate valid tokens.
-    Returns:
-        torch.Tensor: Mean-pooled representation of the token embeddings.
-    Notes:
-        - The function calculates the mean-pooled representation using the attention mask for valid tokens.
-        - Input_mask_expanded is created by expanding the attention mask to match the size of token embeddings.
-        - The result is obtained by summing the element-wise multiplication of embeddings and input_mask_expanded,
-            and dividing it by the sum of input_mask_expanded after clamping its values to a minimum of 1e-9.
-    """
-    token_embeddings = model_output[0]
-    input_mask_expanded = (
-        attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-    )
-    return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(
-        input_mask_expanded.sum(1), min=1e-9
-    )
-
-
 @dataclass
 class DiversityRewardEvent(BaseRewardEvent):
     historic: float = None
@@ -56,25 +36,124 @@ class DiversityRewardEvent(BaseRewardEvent):
 
 class DiversityRewardModel(BaseRewardModel):
     diversity_model_path = "sentence-transformers/all-mpnet-base-v2"
+    cost: float = 2.0
+    stateful: bool = True
 
     @property
     def name(self) -> str:
         return RewardModelType.diversity.value
 
-    def __init__(self, device: str):
+    def __init__(
+        self,
+        device: str,
+        backend: str = "fp32",
+        index: str = "exact",
+        num_probes: int = 16,
+        history_dtype: str = "fp32",
+        history_path: str = None,
+    ):
         super().__init__()
+        if index not in DIVERSITY_INDEXES:
+            raise ValueError(
+                f"Unknown diversity index {index}, expected one of {DIVERSITY_INDEXES}"
+            )
+        if index == "ivf" and (history_dtype != "fp32" or history_path is not None):
+            raise ValueError(
+                "The ivf diversity index keeps its own fp32 history in memory, "
+                "a history dtype or path needs the exact index"
+            )
+
         self.device = device
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            DiversityRewardModel.diversity_model_path
+        self.embedding_service = EmbeddingService.get(
+            self.diversity_model_path, self.device, backend=backend
         )
-        self.model = AutoModel.from_pretrained(
-            DiversityRewardModel.diversity_model_path
-        ).to(self.device)
         self.reward_bottom_k = 2
         self.history_reward_bottom_k = 2
-        self.historic_embeddings = torch.tensor([]).to(self.device)
         self.history_range = (500, 15500)
         self.boundary = 0.2
+        # Completions this similar to one of the batch or of the recent history are not added to it.
+        self.duplicate_threshold = 0.999
+        self.duplicate_range = 1000
+        # The ivf index holds the history in place of the ring buffer.
+        self.index = (
+            IVFIndex(self.history_range[1], num_probes=num_probes)
+            if index == "ivf"
+            else None
+        )
+        self.history = (
+            EmbeddingHistory(
+                self.history_range[1],
+                self.device,
+                dtype=history_dtype,
+                path=history_path,
+            )
+            if self.index is None
+            else None
+        )
+
+    @property
+    def history_size(self) -> int:
+        """Number of embeddings in the history, without reading them."""
+        return len(self.index if self.index is not None else self.history)
+
+    @property
+    def historic_embeddings(self) -> torch.FloatTensor:
+        """Copy of the history from the oldest to the newest embedding, used to save the model."""
+        if self.index is not None:
+            return self.index.embeddings()[0] if len(self.index) else torch.tensor([])
+        return self.history.tensor()
+
+    @historic_embeddings.setter
+    def historic_embeddings(self, embeddings: torch.FloatTensor):
+        if self.index is not None:
+            self.index.reset()
+            if len(embeddings) > 0:
+                self.index.add(embeddings.to(self.device))
+            return
+
+        self.history.clear()
+        if len(embeddings) > 0:
+            self.history.append(embeddings.to(self.device))
+
+    def state_dict(self) -> dict:
+        """Returns the history to save, the ring buffer is saved in its storage format and the ivf index as fp32 embeddings."""
+        if self.index is not None:
+            return {"historic_embeddings": self.historic_embeddings.to("cpu")}
+        if self.history.path is not None:
+            # The rows are already in the history file, only the new ones and the header are written.
+            self.history.flush()
+            return {"history": {"dtype": self.history.dtype, "path": self.history.path}}
+        return {"history": self.history.state_dict()}
+
+    def load_state_dict(self, state: dict):
+        """Restores a history saved by :func:`state_dict`, or a fp32 `historic_embeddings` tensor."""
+        if "history" not in state:
+            self.historic_embeddings = state["historic_embeddings"]
+            return
+
+        saved = state["history"]
+        if "path" in saved:
+            # The history file was mapped when the model was created.
+            if self.index is None and saved["path"] == self.history.path:
+                return
+            history = EmbeddingHistory(
+                self.history_range[1], "cpu", dtype=saved["dtype"], path=saved["path"]
+            )
+            self.historic_embeddings = history.tensor()
+            return
+
+        history = EmbeddingHistory(
+            self.history_range[1], self.device, dtype=saved["dtype"]
+        )
+        history.load_state_dict(saved)
+        if (
+            self.index is None
+            and self.history.path is None
+            and history.dtype == self.history.dtype
+        ):
+            self.history = history
+        else:
+            self.historic_embeddings = history.tensor()
 
     def get_embeddings(self, sentences: List[str]) -> "torch.FloatTensor":
         """Runs a forward pass through the model.
@@ -85,65 +164,82 @@ class DiversityRewardModel(BaseRewardModel):
             embedding (:obj:`torch.FloatTensor`):
                 Embedding for the message.
         """
-        # Tokenizing sentences
+        return self.embedding_service.embed(sentences)
 
-        encoded_input = self.tokenizer(
-            sentences,
-            padding=True,
-            truncation=True,
-            return_tensors="pt",
-        ).to(self.device)
+    def duplicates(self, embeddings: torch.FloatTensor) -> torch.BoolTensor:
+        """Flags the near duplicates of an earlier embedding of the batch or of the recent history.
+        Args:
+            embeddings (:obj:`torch.FloatTensor`):
+                Embeddings of the completions.
+        Returns:
+            duplicates (:obj:`torch.BoolTensor`):
+                True for the embeddings whose cosine similarity with an earlier embedding of the batch, or
+                with one of the last `duplicate_range` embeddings of the history, reaches the threshold.
+        """
+        embeddings = F.normalize(embeddings, p=2, dim=1)
+        similarity = embeddings @ embeddings.T
+        duplicates = (similarity.triu(diagonal=1) >= self.duplicate_threshold).any(
+            dim=0
+        )
 
-        # Compute token embedding
-        with torch.no_grad():
-            embeddings = self.model(**encoded_input)
+        history_size = self.history_size
+        if history_size == 0:
+            return duplicates
 
-        # Pooling
-        sentence_embeddings = mean_pooling(embeddings, encoded_input["attention_mask"])
+        skip = max(0, history_size - self.duplicate_range)
+        if self.index is not None:
+            # Same raw similarity test as the history, opposite embeddings are not duplicates.
+            similarities, _ = self.index.search(
+                embeddings, 1, skip=skip, absolute=False
+            )
+            return duplicates | (similarities[:, 0] >= self.duplicate_threshold)
 
-        # Normalizing
-        sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
-        return sentence_embeddings
+        similarity = self.history.similarity(embeddings, skip=skip)
+        return duplicates | (similarity >= self.duplicate_threshold).any(dim=1)
 
     def update_historic_embeddings(self, embeddings: torch.FloatTensor):
-        def unique(embeddings):
-            unique_embeddings = [embeddings[0]]
-            last_emb = embeddings[0]
-            for emb in embeddings:
-                if not torch.all(torch.eq(emb, last_emb)):
-                    unique_embeddings.append(emb)
-                last_emb = emb
-            return torch.stack(unique_embeddings)
-
-        embeddings_unique = unique(embeddings)
-        historic_embeddings = torch.cat([self.historic_embeddings, embeddings_unique])
-        self.historic_embeddings = historic_embeddings[-self.history_range[1] :, :]
+        embeddings_unique = embeddings[~self.duplicates(embeddings)]
+        if len(embeddings_unique) == 0:
+            return
+
+        if self.index is not None:
+            self.index.add(embeddings_unique)
+            return
+
+        self.history.append(embeddings_unique)
 
     def get_historic_rewards(self, embeddings: torch.FloatTensor) -> torch.FloatTensor:
         def regularise(rewards):
             # sigmoid function that cutoff at 0.05 approximately
             return 1 / (1 + torch.exp(-1000 * rewards + 50))
 
+        history_size = self.history_size
+
         # Return None if history size is too small
-        if self.historic_embeddings.shape[0] < (
-            self.history_range[0] + self.history_reward_bottom_k
-        ):
+        if history_size < (self.history_range[0] + self.history_reward_bottom_k):
             return None
 
-        # Calculate the pairwise cosine similarity.
-        similarity = pairwise_cosine_similarity(
-            embeddings, self.historic_embeddings[self.history_range[0] :]
-        )
+        bottom_k = min(self.history_reward_bottom_k, len(embeddings))
+        if self.index is not None:
+            # Reward to be the bottom_k smallest 1 - similarity score among the probed neighbours.
+            similarities, _ = self.index.search(
+                embeddings, bottom_k, skip=self.history_range[0]
+            )
+            return regularise(1 - similarities[:, -1])
+
+        # Calculate the pairwise cosine similarity with the history, without its oldest embeddings.
+        similarity = self.history.similarity(embeddings, skip=self.history_range[0])
 
         # Reward to be at the bottom_k smallest of the 1 - similarity score.
-        bottom_k = min(self.history_reward_bottom_k, len(similarity))
         rewards = torch.topk((1 - torch.abs(similarity)), bottom_k, largest=False)[0][
             :, -1
         ]
 
         return regularise(rewards)
 
-    def get_batch_rewards(self, embeddings: torch.FloatTensor) -> torch.FloatTensor:
+    def get_batch_diversity_rewards(
+        self, embeddings: torch.FloatTensor
+    ) -> torch.FloatTensor:
         def regularise(rewards):
             # sigmoid function that maps 0.07 -> 0.23; 0.1 -> 0.5; 0.2 -> 0.98
             return 1 / (1 + torch.exp(-40 * rewards + 4))
@@ -170,7 +266,7 @@ class DiversityRewardModel(BaseRewardModel):
         embeddings = self.get_embeddings(completions)
 
         # Get batch rewards.
-        batch_rewards = self.get_batch_rewards(embeddings)
+        batch_rewards = self.get_batch_diversity_rewards(embeddings)
 
         # get historic rewards.
         historic_rewards = self.get_historic_rewards(embeddings)
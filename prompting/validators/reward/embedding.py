@@ -0,0 +1,182 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import threading
+import torch
+import torch.nn.functional as F
+from collections import OrderedDict
+from typing import List
+from .registry import ModelRegistry
+
+
+def mean_pooling(model_output, attention_mask):
+    """Applies mean pooling to the token embeddings generated by the model.
+    Args:
+        model_output (torch.Tensor): Embedding model output, where the first element contains token embeddings.
+        attention_mask (torch.Tensor): Attention mask to indicate valid tokens.
+    Returns:
+        torch.Tensor: Mean-pooled representation of the token embeddings.
+    Notes:
+        - The function calculates the mean-pooled representation using the attention mask for valid tokens.
+        - Input_mask_expanded is created by expanding the attention mask to match the size of token embeddings.
+        - The result is obtained by summing the element-wise multiplication of embeddings and input_mask_expanded,
+            and dividing it by the sum of input_mask_expanded after clamping its values to a minimum of 1e-9.
+    """
+    token_embeddings = model_output[0]
+    input_mask_expanded = (
+        attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
+    )
+    return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(
+        input_mask_expanded.sum(1), min=1e-9
+    )
+
+
+class EmbeddingService:
+    """Process-wide sentence embedding service.
+
+    Holds a single tokenizer and model per (checkpoint, device, backend) and an LRU cache of sentence
+    embeddings keyed by a hash of their content, so that every consumer of the same checkpoint
+    (diversity, relevance, sentence gating) shares the weights and each sentence is only encoded
+    once per step.
+    """
+
+    @classmethod
+    def get(
+        cls,
+        model_path: str,
+        device: str,
+        cache_size: int = 4096,
+        backend: str = "fp32",
+    ) -> "EmbeddingService":
+        """Returns the shared service for the checkpoint, device and backend, loading it on first use."""
+        key = ("embedding_service", model_path, str(torch.device(device)), backend)
+        return ModelRegistry.get(
+            key, lambda: cls(model_path, device, cache_size, backend)
+        )
+
+    def __init__(
+        self,
+        model_path: str,
+        device: str,
+        cache_size: int = 4096,
+        backend: str = "fp32",
+    ):
+        self.model_path = model_path
+        self.device = device
+        self.cache_size = cache_size
+        self.backend = backend
+        self.tokenizer = ModelRegistry.tokenizer(model_path)
+        self.model = ModelRegistry.model(model_path, device=device, backend=backend)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(sentence: str, overflow: bool) -> str:
+        """Hashes the sentence together with the embedding mode."""
+        return hashlib.sha256(f"{int(overflow)}:{sentence}".encode("utf-8")).hexdigest()
+
+    def encode(self, sentences: List[str], overflow: bool = False) -> torch.FloatTensor:
+        """Runs a forward pass through the model.
+        Args:
+            sentences (:obj:`List[str]`):
+                text messages to be encoded.
+            overflow (:obj:`bool`):
+                If set, messages longer than the model are split into chunks whose embeddings are averaged,
+                otherwise they are truncated.
+        Returns:
+            embeddings (:obj:`torch.FloatTensor`):
+                Normalized embedding for each message.
+        """
+        encoded_input = self.tokenizer(
+            sentences,
+            padding=True,
+            truncation=True,
+            return_overflowing_tokens=overflow,
+            return_tensors="pt",
+        ).to(self.device)
+
+        # Pop the overflow mapping from the input to maintain the expected { input_ids, mask } format of the model
+        overflow_to_sample_mapping = encoded_input.pop(
+            "overflow_to_sample_mapping", None
+        )
+
+        # Compute token embedding
+        with torch.no_grad():
+            embeddings = self.model(**encoded_input)
+
+        # Pooling
+        sentence_embeddings = mean_pooling(embeddings, encoded_input["attention_mask"])
+
+        # Normalizing
+        sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
+
+        if overflow_to_sample_mapping is None:
+            return sentence_embeddings
+
+        # Average the chunk embeddings of each message.
+        batch_representation = torch.zeros(
+            (len(sentences), sentence_embeddings.shape[1]),
+            dtype=sentence_embeddings.dtype,
+            device=sentence_embeddings.device,
+        ).index_add_(0, overflow_to_sample_mapping, sentence_embeddings)
+        chunk_counts = torch.bincount(
+            overflow_to_sample_mapping, minlength=len(sentences)
+        )
+        return batch_representation / chunk_counts.unsqueeze(1)
+
+    def embed(self, sentences: List[str], overflow: bool = False) -> torch.FloatTensor:
+        """Returns the embedding of each sentence, only encoding the sentences that are not cached.
+        Args:
+            sentences (:obj:`List[str]`):
+                text messages to be encoded.
+            overflow (:obj:`bool`):
+                Embedding mode, see :func:`encode`.
+        Returns:
+            embeddings (:obj:`torch.FloatTensor`):
+                Normalized embedding for each message.
+        """
+        keys = [self.content_hash(sentence, overflow) for sentence in sentences]
+
+        with self.lock:
+            # Encode the sentences that are not cached yet in a single batch.
+            missing = {}
+            for key, sentence in zip(keys, sentences):
+                if key not in self.cache and key not in missing:
+                    missing[key] = sentence
+
+            if missing:
+                embeddings = self.encode(list(missing.values()), overflow=overflow)
+                for key, embedding in zip(missing.keys(), embeddings):
+                    self.cache[key] = embedding
+
+            embeddings = []
+            for key in keys:
+                self.cache.move_to_end(key)
+                embeddings.append(self.cache[key])
+
+            # Evict the least recently used embeddings.
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return torch.stack(embeddings)
+
+    def clear(self):
+        """Empties the embedding cache."""
+        with self.lock:
+            self.cache.clear()
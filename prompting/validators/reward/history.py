@@ -0,0 +1,308 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import torch
+import struct
+import numpy as np
+import bittensor as bt
+import torch.nn.functional as F
+from typing import Dict, List
+
+# Storage formats of the diversity history, int8 rows are stored with a per-row scale.
+HISTORY_DTYPES = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "int8": torch.int8,
+}
+
+# Header of the history files: magic, capacity, cursor, count, dim and dtype, padded to 64 bytes.
+HEADER = struct.Struct("<8sQQQQ8s")
+HEADER_SIZE = 64
+MAGIC = b"DIVHIST1"
+
+
+class EmbeddingHistory:
+    """Ring buffer of the most recent embeddings.
+
+    The buffer is allocated once with `capacity` rows, new embeddings overwrite the oldest ones at the
+    write cursor. The stored embeddings are exposed as at most two views of the buffer, from the oldest
+    to the newest, so that reading the history never copies it.
+
+    The rows can be stored in reduced precision: fp16 and bf16 halve the memory, int8 quarters it by
+    storing every row divided by its own scale (its largest absolute value over 127). Similarities are
+    computed in fp32, upcasting one chunk of rows at a time.
+
+    With a `path`, the rows live in a memory mapped file: a header followed by the ring and the scales.
+    On cpu the buffer is the mapping itself, on other devices every write goes to both. Every write
+    commits its rows before the header counting them: the rows it overwrites are first dropped from the
+    header, then the rows and finally the new header are synced to the file, so that the file always
+    holds a consistent history. An existing file with the same capacity and dtype is mapped back without
+    reading it, so that checkpoints and restarts stay proportional to the new rows.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        device: str,
+        dtype: str = "fp32",
+        chunk_size: int = 4096,
+        path: str = None,
+    ):
+        if dtype not in HISTORY_DTYPES:
+            raise ValueError(
+                f"Unknown history dtype {dtype}, expected one of {list(HISTORY_DTYPES)}"
+            )
+
+        self.capacity = capacity
+        self.device = device
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.buffer: torch.Tensor = None
+        self.scales: torch.FloatTensor = None
+        self.cursor = 0
+        self.length = 0
+
+        self.path = path
+        self.file: np.memmap = None
+        self.file_rows: torch.Tensor = None
+        self.file_scales: torch.FloatTensor = None
+        if path is not None and os.path.exists(path):
+            self.open()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def quantize(self, embeddings: torch.FloatTensor) -> Dict[str, torch.Tensor]:
+        """Converts the embeddings to the storage format, returning the rows and their scales."""
+        if self.dtype != "int8":
+            return {"rows": embeddings.to(HISTORY_DTYPES[self.dtype]), "scales": None}
+
+        scales = embeddings.abs().amax(dim=1).clamp(min=1e-12) / 127
+        rows = torch.round(embeddings / scales.unsqueeze(1)).to(torch.int8)
+        return {"rows": rows, "scales": scales.float()}
+
+    def append(self, embeddings: torch.FloatTensor):
+        """Writes the embeddings at the cursor, overwriting the oldest ones once the buffer is full."""
+        # Only the last `capacity` embeddings of a very large batch survive.
+        self.write(**self.quantize(embeddings[-self.capacity :].float()))
+
+    def map(self, dim: int, create: bool):
+        """Maps the history file, creating it with room for `capacity` rows of `dim` values."""
+        itemsize = torch.empty((), dtype=HISTORY_DTYPES[self.dtype]).element_size()
+        rows_size = self.capacity * dim * itemsize
+        scales_size = 4 * self.capacity if self.dtype == "int8" else 0
+        self.file = np.memmap(
+            self.path,
+            dtype=np.uint8,
+            mode="w+" if create else "r+",
+            shape=(HEADER_SIZE + rows_size + scales_size,),
+        )
+
+        data = torch.from_numpy(self.file)
+        self.file_rows = (
+            data[HEADER_SIZE : HEADER_SIZE + rows_size]
+            .view(HISTORY_DTYPES[self.dtype])
+            .view(self.capacity, dim)
+        )
+        if scales_size:
+            self.file_scales = data[HEADER_SIZE + rows_size :].view(torch.float32)
+
+        if torch.device(self.device).type == "cpu":
+            self.buffer, self.scales = self.file_rows, self.file_scales
+        else:
+            self.buffer = self.file_rows.to(self.device)
+            if self.file_scales is not None:
+                self.scales = self.file_scales.to(self.device)
+
+    def open(self):
+        """Maps an existing history file, ignoring it if it was written with another capacity or dtype."""
+        with open(self.path, "rb") as file:
+            magic, capacity, cursor, count, dim, dtype = HEADER.unpack(
+                file.read(HEADER.size)
+            )
+
+        if (
+            magic != MAGIC
+            or capacity != self.capacity
+            or dtype.rstrip(b"\0").decode() != self.dtype
+        ):
+            bt.logging.warning(
+                f"Ignoring the diversity history {self.path}, it does not hold {self.capacity} {self.dtype} rows."
+            )
+            return
+
+        self.map(dim, create=False)
+        self.cursor = cursor
+        self.length = count
+
+    def commit(self, cursor: int, length: int):
+        """Writes the header of the rows before the cursor to the history file and syncs the file."""
+        header = HEADER.pack(
+            MAGIC,
+            self.capacity,
+            cursor,
+            length,
+            self.buffer.shape[1],
+            self.dtype.encode(),
+        )
+        self.file[: HEADER.size] = np.frombuffer(header, dtype=np.uint8)
+        self.file.flush()
+
+    def flush(self):
+        """Syncs the history file, which already holds every written row and its header."""
+        if self.file is None:
+            return
+
+        self.commit(self.cursor, self.length)
+
+    def write(self, rows: torch.Tensor, scales: torch.FloatTensor = None):
+        """Writes rows that are already in the storage format."""
+        if self.buffer is None:
+            if self.path is not None:
+                self.map(rows.shape[1], create=True)
+            else:
+                self.buffer = torch.empty(
+                    (self.capacity, rows.shape[1]),
+                    dtype=HISTORY_DTYPES[self.dtype],
+                    device=self.device,
+                )
+                if self.dtype == "int8":
+                    self.scales = torch.empty((self.capacity,), device=self.device)
+
+        rows = rows[-self.capacity :]
+        scales = scales[-self.capacity :] if scales is not None else None
+        head = min(len(rows), self.capacity - self.cursor)
+
+        # Stop counting the oldest rows in the file before overwriting them.
+        overwritten = max(0, self.length + len(rows) - self.capacity)
+        if self.file is not None and overwritten:
+            self.commit(self.cursor, self.length - overwritten)
+
+        targets = [(self.buffer, rows), (self.scales, scales)]
+        if self.file is not None and self.file_rows is not self.buffer:
+            targets += [(self.file_rows, rows), (self.file_scales, scales)]
+        for target, values in targets:
+            if target is None:
+                continue
+            values = values.to(target.device)
+            target[self.cursor : self.cursor + head] = values[:head]
+            target[: len(values) - head] = values[head:]
+
+        # Sync the rows on their own, a single sync of the rows and the header could persist the header first.
+        if self.file is not None:
+            self.file.flush()
+
+        self.cursor = (self.cursor + len(rows)) % self.capacity
+        self.length = min(self.length + len(rows), self.capacity)
+        if self.file is not None:
+            self.commit(self.cursor, self.length)
+
+    def slices(self, skip: int = 0) -> List[slice]:
+        """Returns the slices of the buffer holding the stored embeddings, from the oldest to the newest.
+        Args:
+            skip (:obj:`int`):
+                Number of the oldest embeddings left out.
+        Returns:
+            slices (:obj:`List[slice]`):
+                Non-empty slices, at most two when the stored embeddings wrap around the end of the buffer.
+        """
+        if skip >= self.length:
+            return []
+
+        start = (self.cursor - self.length + skip) % self.capacity
+        end = start + self.length - skip
+        if end <= self.capacity:
+            return [slice(start, end)]
+        return [slice(start, self.capacity), slice(0, end - self.capacity)]
+
+    def segments(self, skip: int = 0) -> List[torch.Tensor]:
+        """Returns views of the stored rows, in the storage format, from the oldest to the newest."""
+        return [self.buffer[rows] for rows in self.slices(skip)]
+
+    def dequantize(self, rows: slice) -> torch.FloatTensor:
+        """Returns the stored embeddings of the slice in fp32."""
+        embeddings = self.buffer[rows].float()
+        if self.scales is not None:
+            embeddings = embeddings * self.scales[rows].unsqueeze(1)
+        return embeddings
+
+    def similarity(
+        self, queries: torch.FloatTensor, skip: int = 0
+    ) -> torch.FloatTensor:
+        """Returns the cosine similarity of every query with the stored embeddings.
+        Args:
+            queries (:obj:`torch.FloatTensor`):
+                Embeddings to compare with the history.
+            skip (:obj:`int`):
+                Number of the oldest embeddings left out.
+        Returns:
+            similarity (:obj:`torch.FloatTensor`):
+                Similarities of shape (queries, stored embeddings - skip), from the oldest to the newest.
+        """
+        queries = F.normalize(queries.float(), p=2, dim=1)
+        similarities = [torch.empty((len(queries), 0), device=queries.device)]
+        for rows in self.slices(skip):
+            for start in range(rows.start, rows.stop, self.chunk_size):
+                chunk = slice(start, min(start + self.chunk_size, rows.stop))
+                # The scale of the int8 rows cancels out in the cosine similarity.
+                embeddings = F.normalize(self.buffer[chunk].float(), p=2, dim=1)
+                similarities.append(queries @ embeddings.T)
+        return torch.cat(similarities, dim=1)
+
+    def tensor(self) -> torch.FloatTensor:
+        """Returns a fp32 copy of the stored embeddings from the oldest to the newest."""
+        slices = self.slices()
+        if not slices:
+            return torch.tensor([]).to(self.device)
+        return torch.cat([self.dequantize(rows) for rows in slices])
+
+    def state_dict(self) -> Dict[str, torch.Tensor]:
+        """Returns the stored rows and scales in the storage format, from the oldest to the newest."""
+        slices = self.slices()
+        return {
+            "dtype": self.dtype,
+            "rows": torch.cat([self.buffer[rows] for rows in slices]).cpu()
+            if slices
+            else None,
+            "scales": torch.cat([self.scales[rows] for rows in slices]).cpu()
+            if slices and self.scales is not None
+            else None,
+        }
+
+    def load_state_dict(self, state: Dict[str, torch.Tensor]):
+        """Replaces the history with a state saved in the same storage format."""
+        if state["dtype"] != self.dtype:
+            raise ValueError(
+                f"Cannot load a {state['dtype']} history into a {self.dtype} history"
+            )
+
+        self.clear()
+        if state["rows"] is not None:
+            scales = state["scales"]
+            self.write(
+                state["rows"].to(self.device),
+                scales.to(self.device) if scales is not None else None,
+            )
+
+    def clear(self):
+        self.cursor = 0
+        self.length = 0
+        if self.file is not None:
+            self.commit(self.cursor, self.length)
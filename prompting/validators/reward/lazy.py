@@ -0,0 +1,108 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+import bittensor as bt
+from typing import List, Tuple
+from .reward import BaseRewardModel, BaseRewardEvent
+
+
+class LazyRewardModel(BaseRewardModel):
+    """Stands in for a reward model that is only loaded the first time it is used.
+
+    Scoring, and any attribute that is not part of the base reward model (e.g. `Blacklist.add`), is
+    forwarded to the loaded model. The reward cache and batcher assigned to the stand-in are handed
+    over to the loaded model. A state restored before the model is loaded is kept until it is, so that
+    checkpoints do not load it.
+    """
+
+    @property
+    def name(self) -> str:
+        return self.lazy_name
+
+    def __init__(self, name: str, model_class: type, **kwargs):
+        super().__init__()
+        self.lazy_name = name
+        self.model_class = model_class
+        self.kwargs = kwargs
+        self.cost = model_class.cost
+        self.stateful = model_class.stateful
+        self.model: BaseRewardModel = None
+        self.state: dict = None
+        self.load_lock = threading.Lock()
+
+    def load(self) -> BaseRewardModel:
+        """Returns the model, loading it on first use."""
+        with self.load_lock:
+            if self.model is None:
+                start = time.perf_counter()
+                model = self.model_class(**self.kwargs)
+                model.cache = self.cache
+                model.batcher = self.batcher
+                if self.state is not None:
+                    model.load_state_dict(self.state)
+                    self.state = None
+                self.model = model
+                bt.logging.info(
+                    f"lazily loaded {self.name} in {time.perf_counter() - start:.2f}s"
+                )
+        return self.model
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def state_dict(self) -> dict:
+        """Returns the state of the loaded model, or None while it is not loaded and its state did not change."""
+        with self.load_lock:
+            return self.model.state_dict() if self.model is not None else None
+
+    def load_state_dict(self, state: dict):
+        """Restores the state of the model, or keeps it until the model is loaded."""
+        with self.load_lock:
+            if self.model is None:
+                self.state = state
+                return
+        self.model.load_state_dict(state)
+
+    def __getattr__(self, attr: str):
+        # Only called for attributes missing on the stand-in.
+        if attr.startswith("__") or attr in ("model", "model_class", "load_lock"):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr: str, value):
+        # Attributes of the stand-in are set on it, the others on the loaded model.
+        if "load_lock" not in self.__dict__ or attr in self.__dict__:
+            super().__setattr__(attr, value)
+        else:
+            setattr(self.load(), attr, value)
+
+    def get_rewards(
+        self, prompt: str, completions: List[str], name: str
+    ) -> List[BaseRewardEvent]:
+        return self.load().get_rewards(prompt, completions, name)
+
+    def get_batch_rewards(
+        self, jobs: List[Tuple[str, List[str], str]]
+    ) -> List[List[BaseRewardEvent]]:
+        return self.load().get_batch_rewards(jobs)
+
+    def apply(self, *args, **kwargs):
+        return self.load().apply(*args, **kwargs)
@@ -0,0 +1,115 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+from collections import deque
+from fuzzywuzzy import fuzz
+from typing import Dict, List, Optional, Set
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton, finding the occurrences of a set of patterns in a single pass over a text."""
+
+    def __init__(self, patterns: List[str]):
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.failures: List[int] = [0]
+        self.outputs: List[List[int]] = [[]]
+
+        # Trie of the patterns.
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for character in pattern:
+                if character not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.failures.append(0)
+                    self.outputs.append([])
+                    self.transitions[state][character] = len(self.transitions) - 1
+                state = self.transitions[state][character]
+            self.outputs[state].append(index)
+
+        # Failure links, in breadth first order so that the links of shorter prefixes are known.
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, child in self.transitions[state].items():
+                queue.append(child)
+                failure = self.failures[state]
+                while failure and character not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                self.failures[child] = self.transitions[failure].get(character, 0)
+                self.outputs[child] = (
+                    self.outputs[child] + self.outputs[self.failures[child]]
+                )
+
+    def search(self, text: str) -> Set[int]:
+        """Returns the indices of the patterns occurring in the text."""
+        transitions, failures, outputs = self.transitions, self.failures, self.outputs
+        found = set()
+        state = 0
+        for character in text:
+            while state and character not in transitions[state]:
+                state = failures[state]
+            state = transitions[state].get(character, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class PhraseMatcher:
+    """Finds the first phrase whose fuzzy partial ratio with a text is above a boundary.
+
+    Equivalent to returning the first phrase for which `fuzz.partial_ratio(phrase, text) > boundary`, without
+    computing the ratio of every phrase. A ratio above the boundary allows fewer than
+    `2 * len(phrase) * (1 - boundary / 100)` unmatched or inserted characters, so splitting each phrase
+    into one more piece than that guarantees that one of its pieces occurs verbatim in the text. A single
+    Aho-Corasick pass over the text finds those pieces, and only the phrases with a piece in the text,
+    or longer than the text (partial_ratio then compares them the other way round), are scored.
+    """
+
+    def __init__(self, phrases: List[str], boundary: float):
+        self.phrases = phrases
+        self.boundary = boundary
+        self.max_length = max((len(phrase) for phrase in phrases), default=0)
+
+        pieces, self.owners = [], []
+        for index, phrase in enumerate(phrases):
+            for piece in self.split(phrase):
+                pieces.append(piece)
+                self.owners.append(index)
+        self.automaton = AhoCorasick(pieces)
+
+    def split(self, phrase: str) -> List[str]:
+        """Splits the phrase into as many pieces as errors it can hold in a match, plus one."""
+        count = int(2 * len(phrase) * (1 - self.boundary / 100)) + 1
+        count = max(1, min(count, len(phrase)))
+        bounds = [round(index * len(phrase) / count) for index in range(count + 1)]
+        return [phrase[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def match(self, text: str) -> Optional[int]:
+        """Returns the index of the first phrase matching the text, or None."""
+        candidates = {self.owners[piece] for piece in self.automaton.search(text)}
+        if len(text) < self.max_length:
+            candidates.update(
+                index
+                for index, phrase in enumerate(self.phrases)
+                if len(phrase) > len(text)
+            )
+
+        for index in sorted(candidates):
+            if fuzz.partial_ratio(self.phrases[index], text) > self.boundary:
+                return index
+        return None
@@ -1,68 +1,252 @@
 import torch
-from typing import List, Union
+from typing import List, Tuple, Union
 from .config import RewardModelType
 from .reward import BaseRewardModel, BaseRewardEvent
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
+from .registry import ModelRegistry
+from transformers import AutoModelForSequenceClassification, pipeline
 
 
 class MistralRewardModel(BaseRewardModel):
     reward_model_path: str = "reciprocate/mistral-7b-rm"
     revision: str = "e301d78"
+    cost: float = 10.0
 
     @property
     def name(self) -> str:
         return RewardModelType.mistral.value
 
-    def __init__(self, device: str):
+    def __init__(self, device: str, batch_size: int = 8, prefix_caching: bool = True):
         super().__init__()
         self.device = device
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            MistralRewardModel.reward_model_path,
-            revision=MistralRewardModel.revision,
+        self.batch_size = batch_size
+        self.prefix_caching = prefix_caching
+        self.max_length = 4096
+        self.tokenizer = ModelRegistry.tokenizer(
+            self.reward_model_path,
+            revision=self.revision,
         )
         # self.tokenizer = AutoTokenizer.from_pretrained("mistralai/Mistral-7B-Instruct-v0.1")
-        self.model = AutoModelForSequenceClassification.from_pretrained(
-            MistralRewardModel.reward_model_path,
-            revision=MistralRewardModel.revision,
-            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-        ).to(self.device)
+        self.model = ModelRegistry.model(
+            self.reward_model_path,
+            revision=self.revision,
+            dtype=torch.float16 if self.device == "cuda" else torch.float32,
+            device=self.device,
+            model_class=AutoModelForSequenceClassification,
+        )
+
+        # Batched inference needs a padding token. Fall back to the unknown token rather than
+        # eos, since eos also terminates the assistant turn and would shift the scored position.
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.unk_token
+        if self.model.config.pad_token_id is None:
+            self.model.config.pad_token_id = self.tokenizer.pad_token_id
+
         self.reward_fn = pipeline(
             "text-classification",
             model=self.model,
             tokenizer=self.tokenizer,
             truncation=True,
-            batch_size=8,
-            max_length=4096,
+            batch_size=self.batch_size,
+            max_length=self.max_length,
             device=self.device,
         )
 
+    def build_chat(self, prompt: str, completion: str) -> str:
+        """Renders the prompt and completion through the tokenizer chat template."""
+        chat = [
+            {
+                "role": "user",
+                "content": prompt,
+            },
+            {
+                "role": "assistant",
+                "content": completion,
+            },
+        ]
+        return self.tokenizer.apply_chat_template(chat, tokenize=False)
+
     def reward(self, prompt: str, completion: str, name: str) -> BaseRewardEvent:
         reward_event = BaseRewardEvent()
         with torch.no_grad():
-            chat = [
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-                {
-                    "role": "assistant",
-                    "content": completion,
-                },
-            ]
-
-            output = self.reward_fn(
-                self.tokenizer.apply_chat_template(chat, tokenize=False)
-            )
+            output = self.reward_fn(self.build_chat(prompt, completion))
             scores = [x["score"] for x in output]
             reward_event.reward = float(scores[0])
             return reward_event
 
+    def postprocess(self, logits: torch.FloatTensor) -> torch.FloatTensor:
+        """Turns the logits into the score the text-classification pipeline returns for the top label."""
+        config = self.model.config
+        if (
+            config.problem_type == "multi_label_classification"
+            or config.num_labels == 1
+        ):
+            probabilities = logits.float().sigmoid()
+        else:
+            probabilities = logits.float().softmax(dim=-1)
+        return probabilities.max(dim=-1).values
+
+    def get_suffix_scores(
+        self, input_ids: List[List[int]], prefix_length: int
+    ) -> List[float]:
+        """Scores tokenized chats sharing their first prefix_length tokens.
+
+        The shared prefix runs through the model once, then the attention keys and values it cached
+        are reused by every micro-batch of suffixes, so that only the suffix tokens are processed
+        per chat.
+        Args:
+            input_ids (:obj:`List[List[int]]`):
+                Token ids of every chat, each longer than the prefix.
+            prefix_length (:obj:`int`):
+                Number of leading tokens shared by every chat.
+        Returns:
+            scores (:obj:`List[float]`):
+                Score of every chat, in the order of the chats.
+        """
+        base_model = self.model.base_model
+        pad_token_id = self.model.config.pad_token_id
+        suffixes = [ids[prefix_length:] for ids in input_ids]
+
+        # Sort the suffixes by length so that each micro-batch pads to a similar length.
+        order = sorted(
+            range(len(suffixes)), key=lambda i: len(suffixes[i]), reverse=True
+        )
+
+        scores = [None] * len(suffixes)
+        # Score the same token as the model's own pooling: the one before the first padding token, or the
+        # last token if there is none.
+        positions = []
+        for ids in input_ids:
+            position = (ids.index(pad_token_id) if pad_token_id in ids else 0) - 1
+            positions.append(position if position >= 0 else len(ids) - 1)
+
+        with torch.no_grad():
+            prefix = torch.tensor([input_ids[0][:prefix_length]], device=self.device)
+            prefix_outputs = base_model(input_ids=prefix, use_cache=True)
+            prefix_hidden_states = prefix_outputs[0][0]
+            past_key_values = prefix_outputs.past_key_values
+            if hasattr(past_key_values, "to_legacy_cache"):
+                past_key_values = past_key_values.to_legacy_cache()
+
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start : start + self.batch_size]
+                max_length = max(len(suffixes[i]) for i in batch)
+
+                # Right pad the suffixes, the prefix is visible to every token.
+                suffix_ids = torch.full(
+                    (len(batch), max_length), pad_token_id, dtype=torch.long
+                )
+                attention_mask = torch.zeros(
+                    (len(batch), prefix_length + max_length), dtype=torch.long
+                )
+                attention_mask[:, :prefix_length] = 1
+                for row, i in enumerate(batch):
+                    suffix_ids[row, : len(suffixes[i])] = torch.tensor(suffixes[i])
+                    attention_mask[
+                        row, prefix_length : prefix_length + len(suffixes[i])
+                    ] = 1
+                position_ids = torch.arange(
+                    prefix_length, prefix_length + max_length
+                ).expand(len(batch), -1)
+
+                # Share the cached prefix between the rows of the micro-batch without copying it.
+                batch_past_key_values = tuple(
+                    tuple(
+                        tensor.expand(len(batch), *tensor.shape[1:]) for tensor in layer
+                    )
+                    for layer in past_key_values
+                )
+
+                hidden_states = base_model(
+                    input_ids=suffix_ids.to(self.device),
+                    attention_mask=attention_mask.to(self.device),
+                    position_ids=position_ids.to(self.device),
+                    past_key_values=batch_past_key_values,
+                    use_cache=False,
+                )[0]
+
+                # Gather the scored token of every chat, from the prefix if it lies within it.
+                scored_hidden_states = torch.stack(
+                    [
+                        hidden_states[row, positions[i] - prefix_length]
+                        if positions[i] >= prefix_length
+                        else prefix_hidden_states[positions[i]]
+                        for row, i in enumerate(batch)
+                    ]
+                )
+                batch_scores = self.postprocess(
+                    self.model.score(scored_hidden_states)
+                ).tolist()
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = score
+
+        return scores
+
+    def get_chat_scores(self, chats: List[str]) -> List[float]:
+        """Scores the rendered chats in length-sorted micro-batches, in the order of the chats."""
+        if self.prefix_caching and len(chats) > 1:
+            input_ids = self.tokenizer(
+                chats, truncation=True, max_length=self.max_length
+            )["input_ids"]
+
+            # Length of the prefix shared by every chat, keeping at least one suffix token per chat.
+            prefix_length = min(len(ids) for ids in input_ids) - 1
+            for ids in input_ids[1:]:
+                for position in range(prefix_length):
+                    if ids[position] != input_ids[0][position]:
+                        prefix_length = position
+                        break
+
+            if prefix_length > 0:
+                return self.get_suffix_scores(input_ids, prefix_length)
+
+        # Sort the chats by length so that each micro-batch pads to a similar length.
+        order = sorted(range(len(chats)), key=lambda i: len(chats[i]), reverse=True)
+
+        scores = [None] * len(chats)
+        with torch.no_grad():
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start : start + self.batch_size]
+                outputs = self.reward_fn([chats[i] for i in batch])
+                for i, output in zip(batch, outputs):
+                    scores[i] = float(output["score"])
+
+        return scores
+
     def get_rewards(
         self, prompt: str, completions: List[str], name: str
     ) -> List[BaseRewardEvent]:
-        # Get all the reward results.
+        if len(completions) == 0:
+            return []
+
+        chats = [self.build_chat(prompt, completion) for completion in completions]
+
+        # Get all the reward results, in the order of the completions.
         reward_events = [
-            self.reward(prompt, completion, name) for completion in completions
+            BaseRewardEvent(reward=score) for score in self.get_chat_scores(chats)
         ]
 
         return reward_events
+
+    def get_batch_rewards(
+        self, jobs: List[Tuple[str, List[str], str]]
+    ) -> List[List[BaseRewardEvent]]:
+        # Score the chats of the jobs sharing a prompt together, so that they share the prefix cache
+        # and the micro-batches are full.
+        chats_by_prompt = {}
+        for prompt, completions, _ in jobs:
+            chats_by_prompt.setdefault(prompt, []).extend(
+                self.build_chat(prompt, completion) for completion in completions
+            )
+        scores_by_prompt = {
+            prompt: iter(self.get_chat_scores(chats))
+            for prompt, chats in chats_by_prompt.items()
+        }
+
+        # Split the reward events back into jobs.
+        return [
+            [
+                BaseRewardEvent(reward=next(scores_by_prompt[prompt]))
+                for _ in completions
+            ]
+            for prompt, completions, _ in jobs
+        ]
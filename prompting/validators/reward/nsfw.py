@@ -17,10 +17,11 @@
 # DEALINGS IN THE SOFTWARE.
 
 import torch
-from typing import List, Union
+from typing import List, Tuple, Union
 from .config import RewardModelType
 from .reward import BaseRewardModel, BaseRewardEvent
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from .registry import ModelRegistry
+from transformers import AutoModelForSequenceClassification
 from dataclasses import dataclass
 
 
@@ -31,25 +32,29 @@ class NSFWRewardEvent(BaseRewardEvent):
 
 class NSFWRewardModel(BaseRewardModel):
     nsfw_filter_model_path = "facebook/roberta-hate-speech-dynabench-r4-target"
+    cost: float = 1.0
 
     @property
     def name(self) -> str:
         return RewardModelType.nsfw.value
 
-    def __init__(self, device: str):
+    def __init__(self, device: str, batch_size: int = 16, backend: str = "fp32"):
         super().__init__()
         self.device = device
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            NSFWRewardModel.nsfw_filter_model_path
+        self.tokenizer = ModelRegistry.tokenizer(self.nsfw_filter_model_path)
+        self.model = ModelRegistry.model(
+            self.nsfw_filter_model_path,
+            device=self.device,
+            model_class=AutoModelForSequenceClassification,
+            backend=backend,
         )
-        self.model = AutoModelForSequenceClassification.from_pretrained(
-            NSFWRewardModel.nsfw_filter_model_path
-        ).to(self.device)
+        self.boundary = -0.5
+        self.chunk_size = 512
+        self.batch_size = batch_size
 
     def reward(self, prompt: str, completion: str, name: str) -> NSFWRewardEvent:
         reward_event = NSFWRewardEvent()
 
-        boundary = -0.5
         with torch.no_grad():
             message = completion
             input_ids = self.tokenizer(message)["input_ids"]
@@ -71,20 +76,95 @@ class NSFWRewardModel(BaseRewardModel):
                 return max_score
 
             # 0 when needs to be filtered out, 1 when it is safe
-            score = sum_nsfw_scores(input_ids, chunk_size=512)
+            score = sum_nsfw_scores(input_ids, chunk_size=self.chunk_size)
             reward_event.score = score
-            reward_event.reward = 0.0 if score > boundary else 1.0
+            reward_event.reward = 0.0 if score > self.boundary else 1.0
             return reward_event
 
+    def get_chunk_scores(self, chunks: List[List[int]]) -> List[float]:
+        """Runs the classifier over token chunks in length-bucketed batches.
+        Args:
+            chunks (:obj:`List[List[int]]`):
+                Token id chunks, each at most chunk_size long.
+        Returns:
+            scores (:obj:`List[float]`):
+                max(-nothate, hate) for every chunk, in the order of the chunks.
+        """
+        # Sort chunks by length so that each batch only pads to its own longest chunk.
+        order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]), reverse=True)
+        pad_token_id = self.tokenizer.pad_token_id
+
+        scores = [None] * len(chunks)
+        with torch.no_grad():
+            for start in range(0, len(order), self.batch_size):
+                bucket = order[start : start + self.batch_size]
+                max_length = len(chunks[bucket[0]])
+
+                input_ids = torch.full(
+                    (len(bucket), max_length), pad_token_id, dtype=torch.long
+                )
+                attention_mask = torch.zeros(
+                    (len(bucket), max_length), dtype=torch.long
+                )
+                for row, i in enumerate(bucket):
+                    input_ids[row, : len(chunks[i])] = torch.tensor(chunks[i])
+                    attention_mask[row, : len(chunks[i])] = 1
+
+                logits = self.model(
+                    input_ids=input_ids.to(self.device),
+                    attention_mask=attention_mask.to(self.device),
+                ).logits
+                bucket_scores = torch.maximum(-logits[:, 0], logits[:, 1]).tolist()
+                for i, score in zip(bucket, bucket_scores):
+                    scores[i] = score
+
+        return scores
+
     def get_rewards(
         self, prompt: str, completions: List[str], name: str
     ) -> List[NSFWRewardEvent]:
-        # Get all the reward results.
-        reward_events = [
-            self.reward(prompt, completion, name) for completion in completions
-        ]
+        if len(completions) == 0:
+            return []
+
+        # Split every completion into chunks, remembering which completion each chunk came from.
+        chunks, owners = [], []
+        for owner, input_ids in enumerate(self.tokenizer(completions)["input_ids"]):
+            for i in range(0, len(input_ids), self.chunk_size):
+                chunks.append(input_ids[i : i + self.chunk_size])
+                owners.append(owner)
+
+        # Reduce the chunk scores to the max hate score of each completion.
+        max_scores = [-1000] * len(completions)
+        for owner, score in zip(owners, self.get_chunk_scores(chunks)):
+            max_scores[owner] = max(score, max_scores[owner])
+
+        # 0 when needs to be filtered out, 1 when it is safe
+        reward_events = []
+        for score in max_scores:
+            reward_events.append(
+                NSFWRewardEvent(
+                    reward=0.0 if score > self.boundary else 1.0, score=score
+                )
+            )
 
         return reward_events
 
+    def get_batch_rewards(
+        self, jobs: List[Tuple[str, List[str], str]]
+    ) -> List[List[NSFWRewardEvent]]:
+        # The score does not depend on the prompt, so the completions of every job share the batches.
+        reward_events = self.get_rewards(
+            None,
+            [completion for _, completions, _ in jobs for completion in completions],
+            None,
+        )
+
+        # Split the reward events back into jobs.
+        batch_reward_events = []
+        for _, completions, _ in jobs:
+            batch_reward_events.append(reward_events[: len(completions)])
+            reward_events = reward_events[len(completions) :]
+        return batch_reward_events
+
     def normalize_rewards(self, rewards: torch.FloatTensor) -> torch.FloatTensor:
         return rewards
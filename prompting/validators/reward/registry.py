@@ -0,0 +1,146 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import threading
+import bittensor as bt
+from typing import Any, Callable, Dict, Hashable
+from transformers import AutoModel, AutoTokenizer
+from .backend import apply_backend
+
+
+class ModelRegistry:
+    """Process-wide registry of the checkpoints loaded by the validator.
+
+    Tokenizers are keyed by (class, path, revision) and models by (class, path, revision, dtype, device,
+    backend), so that components asking for the same checkpoint share a single copy of its weights.
+    Each key has its own lock: different checkpoints load concurrently while concurrent requests for the
+    same checkpoint wait for the first one to finish loading it.
+    """
+
+    _entries: Dict[Hashable, Any] = {}
+    _locks: Dict[Hashable, threading.Lock] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Returns the entry of the key, creating it with the factory on first use."""
+        with cls._lock:
+            lock = cls._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in cls._entries:
+                cls._entries[key] = factory()
+            return cls._entries[key]
+
+    @classmethod
+    def tokenizer(
+        cls, path: str, revision: str = None, tokenizer_class: type = AutoTokenizer
+    ):
+        """Returns the shared tokenizer of the checkpoint."""
+        key = ("tokenizer", tokenizer_class.__name__, path, revision)
+        return cls.get(
+            key, lambda: tokenizer_class.from_pretrained(path, revision=revision)
+        )
+
+    @classmethod
+    def model(
+        cls,
+        path: str,
+        revision: str = None,
+        dtype: torch.dtype = torch.float32,
+        device: str = "cpu",
+        model_class: type = AutoModel,
+        backend: str = "fp32",
+    ) -> torch.nn.Module:
+        """Returns the shared model of the checkpoint, loaded with the dtype on the device.
+        Args:
+            path (:obj:`str`):
+                Name or path of the checkpoint.
+            revision (:obj:`str`):
+                Revision of the checkpoint.
+            dtype (:obj:`torch.dtype`):
+                Dtype of the weights.
+            device (:obj:`str`):
+                Device the model runs on.
+            model_class (:obj:`type`):
+                Auto class loading the checkpoint.
+            backend (:obj:`str`):
+                Inference backend, see :func:`apply_backend`.
+        Returns:
+            model (:obj:`torch.nn.Module`):
+                Model shared by every caller using the same arguments.
+        """
+        device = str(torch.device(device))
+        key = (
+            "model",
+            model_class.__name__,
+            path,
+            revision,
+            str(dtype),
+            device,
+            backend,
+        )
+        return cls.get(
+            key,
+            lambda: apply_backend(
+                model_class.from_pretrained(
+                    path, revision=revision, torch_dtype=dtype
+                ).to(device),
+                backend,
+                device,
+            ),
+        )
+
+    @classmethod
+    def memory_report(cls) -> Dict[str, int]:
+        """Returns the resident size in bytes of the weights and buffers of every registered model."""
+        with cls._lock:
+            entries = list(cls._entries.items())
+
+        report = {}
+        for key, entry in entries:
+            if not isinstance(entry, torch.nn.Module):
+                continue
+            _, model_class, path, revision, dtype, device, backend = key
+            name = f"{model_class}({path}@{revision}, {dtype}, {device}, {backend})"
+            report[name] = sum(
+                tensor_size(value) for value in entry.state_dict().values()
+            )
+        return report
+
+    @classmethod
+    def log_memory_report(cls):
+        for name, size in cls.memory_report().items():
+            bt.logging.info(f"model memory: {name} {size / 2**20:.1f} MiB")
+
+    @classmethod
+    def clear(cls):
+        """Forgets every entry, the models are freed once nothing else references them."""
+        with cls._lock:
+            cls._entries.clear()
+            cls._locks.clear()
+
+
+def tensor_size(value: Any) -> int:
+    """Size in bytes of a state dict value, quantized linear layers store a tuple of packed tensors."""
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_size(item) for item in value)
+    return 0
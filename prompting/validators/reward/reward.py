@@ -17,10 +17,13 @@
 # DEALINGS IN THE SOFTWARE.
 
 import torch
+import threading
 import bittensor as bt
-from typing import List, Union
+from typing import List, Tuple, Union
 from abc import abstractmethod
-from dataclasses import dataclass, asdict, fields
+from dataclasses import dataclass, fields
+from .cache import RewardCache
+from .batching import RewardBatcher
 
 
 @dataclass
@@ -30,20 +33,34 @@ class BaseRewardEvent:
 
     @staticmethod
     def parse_reward_events(reward_events):
+        """Converts the reward events into columns, one sequence of values per field.
+        Reward events that are already columnar (a dict of sequences) are returned as is.
+        """
+        if isinstance(reward_events, dict):
+            return reward_events
+
         if reward_events == None or len(reward_events) == 0:
             field_names = [field.name for field in fields(BaseRewardEvent())]
             empty_reward_event = dict(zip(field_names, [[]] * len(field_names)))
             return empty_reward_event
 
+        # Read each field straight from the events instead of converting every event to a dict.
         field_names = [field.name for field in fields(reward_events[0])]
-        reward_events = [
-            asdict(reward_event).values() for reward_event in reward_events
-        ]
-        reward_event = dict(zip(field_names, list(zip(*reward_events))))
+        reward_event = {
+            field_name: tuple(
+                getattr(reward_event, field_name) for reward_event in reward_events
+            )
+            for field_name in field_names
+        }
         return reward_event
 
 
 class BaseRewardModel:
+    # Relative cost of scoring a completion, cheaper models run first when rewards are short-circuited.
+    cost: float = 1.0
+    # Stateful models (e.g. those keeping a history of completions) always score every successful completion.
+    stateful: bool = False
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -61,11 +78,69 @@ class BaseRewardModel:
     ) -> Union[torch.FloatTensor, dict]:
         ...
 
+    def get_batch_rewards(
+        self, jobs: List[Tuple[str, List[str], str]]
+    ) -> List[List[BaseRewardEvent]]:
+        """Gets the reward events of the (prompt, completions, name) jobs of several steps.
+        Models that can score several prompts in a single forward pass override this method.
+        """
+        return [
+            self.get_rewards(prompt, completions, name)
+            for prompt, completions, name in jobs
+        ]
+
+    def request_rewards(
+        self, prompt: str, completions: List[str], name: str
+    ) -> List[BaseRewardEvent]:
+        """Gets the reward events of the completions, batched with the concurrent steps if a batcher is set."""
+        if self.batcher is None:
+            return self.get_rewards(prompt, completions, name)
+        return self.batcher.submit(prompt, completions, name)
+
     def __init__(self) -> None:
         self.count = 0
         self.mean = 0.0
         self.var = 0.0
         self.count_limit = 3000
+        self.cache: RewardCache = None
+        self.batcher: RewardBatcher = None
+        # Guards the state shared by concurrent steps.
+        self.lock = threading.RLock()
+
+    def get_cached_rewards(
+        self, prompt: str, completions: List[str], name: str
+    ) -> Tuple[List[BaseRewardEvent], int, int]:
+        """Gets the reward events of the completions, only scoring the completions that are not cached.
+
+        Returns:
+            reward_events, hits, misses: The reward event of every completion, and the number of completions
+            served from the cache and scored by the model.
+        """
+        keys = [
+            RewardCache.key(self.name, prompt, completion) for completion in completions
+        ]
+        reward_events = [self.cache.get(key) for key in keys]
+
+        # Score each missing completion once, even if it is duplicated within the step.
+        missing = {}
+        for key, completion, reward_event in zip(keys, completions, reward_events):
+            if reward_event is None and key not in missing:
+                missing[key] = completion
+
+        if missing:
+            for key, reward_event in zip(
+                missing.keys(),
+                self.request_rewards(prompt, list(missing.values()), name),
+            ):
+                self.cache.put(key, reward_event)
+                missing[key] = reward_event
+
+        reward_events = [
+            missing[key] if reward_event is None else reward_event
+            for key, reward_event in zip(keys, reward_events)
+        ]
+        hits = len(completions) - len(missing)
+        return reward_events, hits, len(missing)
 
     def normalize_rewards(self, rewards: torch.FloatTensor) -> torch.FloatTensor:
         """
@@ -91,7 +166,10 @@ class BaseRewardModel:
         if 0 < new_count and 0 < self.count + new_count:
             # Calculate the mean and standard deviation of the new rewards.
             new_mean = rewards.mean()
-            new_var = rewards.var(dim=0)
+            # A single reward has no spread, its unbiased variance would be nan.
+            new_var = (
+                rewards.var(dim=0) if new_count > 1 else torch.zeros_like(new_mean)
+            )
 
             # Compute the weights for the new and old rewards.
             new_weight = new_count / (self.count + new_count)
@@ -122,58 +200,97 @@ class BaseRewardModel:
 
         return rewards
 
+    @staticmethod
+    def successful_mask(responses: List[bt.Synapse]) -> torch.BoolTensor:
+        """Returns the mask of the responses that were answered successfully."""
+        return torch.tensor(
+            [resp.dendrite.status_code == 200 for resp in responses], dtype=torch.bool
+        )
+
     def apply(
-        self, prompt: str, responses: List[bt.Synapse], name: str
+        self,
+        prompt: str,
+        responses: List[bt.Synapse],
+        name: str,
+        mask: torch.BoolTensor = None,
     ) -> Union[torch.FloatTensor, dict]:
-        """Applies the reward model across each call. Unsuccessful responses are zeroed."""
-        # Get indices of correctly responding calls.
+        """Applies the reward model across each call. Unsuccessful responses are zeroed.
+        Args:
+            prompt (:obj:`str`):
+                Prompt of the step.
+            responses (:obj:`List[bt.Synapse]`):
+                Responses of the step.
+            name (:obj:`str`):
+                Name of the task.
+            mask (:obj:`torch.BoolTensor`, `optional`):
+                Responses to score, the others are treated as unsuccessful. Defaults to the successfully
+                answered responses, pass it in to share it between the reward models of a step.
+        Returns:
+            rewards, reward_events: The normalized reward of every response and the filled reward events.
+        """
+        if mask is None:
+            mask = self.successful_mask(responses)
 
-        successful_completions_indices: List[int] = [
-            idx
-            for idx, resp in enumerate(responses)
-            if resp.dendrite.status_code == 200
-        ]
+        # Get indices of correctly responding calls.
+        successful_completions_indices = mask.cpu().nonzero().squeeze(1)
 
         # Get all completions from responding calls.
         successful_completions: List[str] = [
-            responses[idx].completion.strip() for idx in successful_completions_indices
+            responses[idx].completion.strip()
+            for idx in successful_completions_indices.tolist()
         ]
 
-        # Reward each completion.
-        reward_events = BaseRewardEvent.parse_reward_events(
-            self.get_rewards(prompt, successful_completions, name)
-        )
+        # Reward each completion, skipping the duplicates already scored by stateless models.
+        use_cache = self.cache is not None and not self.stateful
+        if self.stateful:
+            # Stateful models score the steps one at a time.
+            with self.lock:
+                reward_events = self.get_rewards(prompt, successful_completions, name)
+        elif use_cache:
+            reward_events, cache_hits, cache_misses = self.get_cached_rewards(
+                prompt, successful_completions, name
+            )
+        else:
+            reward_events = self.request_rewards(prompt, successful_completions, name)
+        reward_events = dict(BaseRewardEvent.parse_reward_events(reward_events))
         successful_rewards = torch.tensor(
             reward_events.pop("reward"), dtype=torch.float32
         )
 
         # Softmax rewards across samples.
-        successful_rewards_normalized = self.normalize_rewards(successful_rewards)
+        with self.lock:
+            successful_rewards_normalized = self.normalize_rewards(successful_rewards)
 
-        # Init zero rewards for all calls.
-        filled_rewards = torch.ones(len(responses), dtype=torch.float32) * torch.nan
+        # Scatter the rewards of the successful calls, the others are nan and zero.
+        filled_rewards = torch.full((len(responses),), torch.nan, dtype=torch.float32)
         filled_rewards_normalized = torch.zeros(len(responses), dtype=torch.float32)
-
-        # Fill reward tensor.
-        for idx, reward, reward_normalized in zip(
-            successful_completions_indices,
-            successful_rewards,
-            successful_rewards_normalized,
-        ):
-            filled_rewards[idx] = reward
-            filled_rewards_normalized[idx] = reward_normalized
+        filled_rewards[successful_completions_indices] = successful_rewards
+        filled_rewards_normalized[
+            successful_completions_indices
+        ] = successful_rewards_normalized
+
+        # Position of each call in the successful completions, unsuccessful calls point past the end.
+        positions = torch.full(
+            (len(responses),), len(successful_completions), dtype=torch.long
+        )
+        positions[successful_completions_indices] = torch.arange(
+            len(successful_completions)
+        )
+        positions = positions.tolist()
 
         # Fill every item of the reward_events
         for name, reward_values in reward_events.items():
-            filled_values = [None] * len(responses)
-            for idx, reward_value in zip(successful_completions_indices, reward_values):
-                filled_values[idx] = reward_value
-            reward_events[name] = filled_values
+            reward_values = list(reward_values) + [None]
+            reward_events[name] = [reward_values[position] for position in positions]
 
         # Name each item of the reward event with the reward model name.
         reward_events = {f"{self.name}_{k}": v for k, v in reward_events.items()}
         reward_events[self.name] = filled_rewards.tolist()
         reward_events[self.name + "_normalized"] = filled_rewards_normalized.tolist()
+        if use_cache:
+            # Step-level counts rather than per-uid values, logged as scalars by the EventSchema.
+            reward_events[self.name + "_cache_hits"] = cache_hits
+            reward_events[self.name + "_cache_misses"] = cache_misses
 
         # Warns unexpected behavior for rewards
         if torch.isnan(filled_rewards_normalized).any():
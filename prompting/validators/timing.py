@@ -0,0 +1,77 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+import numpy as np
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict
+
+
+class StepTimer:
+    """Records the wall and CPU time of the stages of a step.
+
+    The durations of a stage are written to the step event as `timing_<stage>` and `timing_<stage>_cpu`,
+    and the last `window` wall times of each stage are kept to report rolling percentiles. CPU time is
+    measured per thread, so stages running concurrently on the reward thread pool are timed correctly.
+    Stages that await are timed without `cpu`: the event loop thread runs the coroutines of other
+    forwards meanwhile, so its CPU time would not belong to the stage. When disabled, `time` returns a
+    no-op context manager.
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 1000):
+        self.enabled = enabled
+        self.window = window
+        self.history: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+
+    def time(self, stage: str, event: dict, cpu: bool = True):
+        """Returns a context manager timing the stage into the event, only recording the wall time
+        when `cpu` is not set."""
+        if not self.enabled:
+            return nullcontext()
+        return self._time(stage, event, cpu)
+
+    @contextmanager
+    def _time(self, stage: str, event: dict, cpu: bool):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            event[f"timing_{stage}"] = wall
+            if cpu:
+                event[f"timing_{stage}_cpu"] = time.thread_time() - cpu_start
+            with self.lock:
+                if stage not in self.history:
+                    self.history[stage] = deque(maxlen=self.window)
+                self.history[stage].append(wall)
+
+    def percentiles(self) -> Dict[str, Dict[str, float]]:
+        """Returns the rolling p50, p95 and p99 wall time of every stage."""
+        with self.lock:
+            history = {stage: list(walls) for stage, walls in self.history.items()}
+
+        return {
+            stage: dict(
+                zip(["p50", "p95", "p99"], np.percentile(walls, [50, 95, 99]).tolist())
+            )
+            for stage, walls in history.items()
+        }
@@ -232,17 +232,21 @@ def save_state(self):
 
     try:
         # Save diversity model.
-        diversity_model_dict = {
-            "historic_embeddings": self.diversity_model.historic_embeddings.to("cpu")
-        }
+        diversity_model_dict = self.diversity_model.state_dict()
         diversity_model_file_path = (
             f"{self.config.neuron.full_path}/diversity_model.pth"
         )
-        torch.save(diversity_model_dict, diversity_model_file_path)
-        bt.logging.success(
-            prefix="Saved diversity model",
-            sufix=f"<blue>{diversity_model_file_path}</blue> {list(self.diversity_model.historic_embeddings.shape)}",
-        )
+        if diversity_model_dict is None:
+            # A lazy diversity model that is not loaded yet still has the state it was restored with.
+            bt.logging.info(
+                f"Diversity model not loaded yet, keeping {diversity_model_file_path}"
+            )
+        else:
+            torch.save(diversity_model_dict, diversity_model_file_path)
+            bt.logging.success(
+                prefix="Saved diversity model",
+                sufix=f"<blue>{diversity_model_file_path}</blue> {self.diversity_model.history_size} embeddings",
+            )
     except Exception as e:
         bt.logging.warning(f"Failed to save diversity model with error: {e}")
 
@@ -282,12 +286,16 @@ def load_state(self):
             f"{self.config.neuron.full_path}/diversity_model.pth"
         )
         diversity_model_dict = torch.load(diversity_model_file_path)
-        self.diversity_model.historic_embeddings = diversity_model_dict[
-            "historic_embeddings"
-        ].to(self.device)
+        self.diversity_model.load_state_dict(diversity_model_dict)
+        # A lazy diversity model is only restored when it is loaded.
+        history = (
+            f"{self.diversity_model.history_size} embeddings"
+            if getattr(self.diversity_model, "loaded", True)
+            else "restored once it is loaded"
+        )
         bt.logging.success(
             prefix="Reloaded diversity model",
-            sufix=f"<blue>{diversity_model_file_path}</blue> {list(self.diversity_model.historic_embeddings.shape)}",
+            sufix=f"<blue>{diversity_model_file_path}</blue> {history}",
         )
     except Exception as e:
         bt.logging.warning(f"Failed to load diversity model with error: {e}")
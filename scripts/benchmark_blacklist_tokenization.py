@@ -0,0 +1,146 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Measures the batched tokenization of the blacklist against tokenizing every completion separately.
+
+Every step the blacklist counts the n-grams of all the completions returned by the network. This script
+tokenizes synthetic completions drawn from the vocabulary of the tokenizer, with punctuation, mixed case
+and a share of accented, CJK, fullwidth, control and zero-width words, both the way the blacklist used
+to (one completion at a time through the slow `BertTokenizer`) and with `Blacklist.tokenize_batch`,
+checks that the token ids are identical and reports the time per step for every batch size.
+
+Example:
+    python scripts/benchmark_blacklist_tokenization.py --batch_sizes 50 128 256
+"""
+
+import re
+import time
+import random
+import argparse
+from transformers import BertTokenizer
+from prompting.validators.reward.blacklist import Blacklist
+
+PUNCTUATION = [".", ",", "!", "?", ";", ":", "'", '"', "(", ")"]
+
+# Words on which slow and fast bert tokenizers are known to disagree: accents, combining marks, CJK,
+# fullwidth forms, control, zero-width and bidirectional characters, and unusual whitespace.
+UNICODE_WORDS = [
+    "Café",
+    "naïve",
+    "Cafe\u0301",
+    "日本語のテキスト",
+    "한국어",
+    "ｔｅｓｔ",
+    "ＡＢＣ１２３",
+    "zero\u200bwidth",
+    "join\u200der",
+    "bom\ufeff",
+    "nul\x00bell\x07",
+    "soft\u00adhyphen",
+    "ideographic\u3000space",
+    "İstanbul",
+    "straße",
+    "ﬁne",
+    "x²",
+    "ΟΔΟΣ",
+    "😀",
+    "\u202eRTL\u202c",
+]
+
+
+def make_completions(
+    words: list, count: int, length: int, unicode: float, generator: random.Random
+):
+    """Random completions of mixed case words, punctuation and a share of non ascii words."""
+    completions = []
+    for _ in range(count):
+        tokens = []
+        for word in generator.choices(words, k=generator.randint(1, length)):
+            if generator.random() < unicode:
+                word = generator.choice(UNICODE_WORDS)
+            if generator.random() < 0.2:
+                word = word.capitalize()
+            if generator.random() < 0.1:
+                word += generator.choice(PUNCTUATION)
+            tokens.append(word)
+        completions.append(" ".join(tokens))
+    return completions
+
+
+def tokenize_separately(tokenizer: BertTokenizer, preprocess, texts: list, word_limit):
+    """Token ids of the completions, tokenized one at a time by the slow tokenizer."""
+    batch_words = []
+    for text in texts:
+        text = preprocess.sub("", text.lower())
+        words = tokenizer(text.lower())["input_ids"][1:-1]
+        batch_words.append(words[:word_limit])
+    return batch_words
+
+
+def benchmark(config: argparse.Namespace):
+    Blacklist.tokenizer_path = config.tokenizer_path
+    blacklist = Blacklist()
+    tokenizer = BertTokenizer.from_pretrained(config.tokenizer_path)
+    preprocess = re.compile("[^(\\w|\\s)]")
+    words = [
+        word
+        for word in tokenizer.get_vocab()
+        if word.isalpha() and not word.startswith("[")
+    ]
+
+    generator = random.Random(config.seed)
+    print(f"{'batch':>8}{'separate ms':>14}{'batched ms':>13}{'speedup':>10}")
+    for batch_size in config.batch_sizes:
+        separate_time = batched_time = 0.0
+        for _ in range(config.steps):
+            texts = make_completions(
+                words, batch_size, config.length, config.unicode, generator
+            )
+
+            start = time.perf_counter()
+            expected = tokenize_separately(
+                tokenizer, preprocess, texts, blacklist.word_limit
+            )
+            separate_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            batch_words = blacklist.tokenize_batch(texts)
+            batched_time += time.perf_counter() - start
+
+            if batch_words != expected:
+                raise AssertionError("Batched token ids differ from the slow tokenizer")
+
+        print(
+            f"{batch_size:>8}{1000 * separate_time / config.steps:>14.2f}"
+            f"{1000 * batched_time / config.steps:>13.2f}"
+            f"{separate_time / batched_time:>10.1f}"
+        )
+
+
+def config() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tokenizer_path", type=str, default=Blacklist.tokenizer_path)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[50, 128, 256])
+    parser.add_argument("--length", type=int, default=300)
+    parser.add_argument("--unicode", type=float, default=0.05)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    benchmark(config())
@@ -0,0 +1,145 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Measures the recall and speed of the ivf diversity index against the exact search.
+
+The diversity reward compares every completion with a sliding window of past completions and rewards
+the distance to its second nearest neighbour. This script fills an `IVFIndex` with synthetic clustered
+embeddings, some of which are near duplicates of past ones as miners tend to produce, and reports for
+every step size the recall of the neighbours, the largest similarity error and the share of completions
+whose historic diversity decision (distance above 0.05) differs from the exact search.
+
+Example:
+    python scripts/benchmark_diversity_index.py --probes 8 16 32
+"""
+
+import time
+import torch
+import argparse
+import torch.nn.functional as F
+from torchmetrics.functional import pairwise_cosine_similarity
+from prompting.validators.reward.ann import IVFIndex
+
+# Distance to the nearest past completions below which the historic diversity reward vanishes.
+CUTOFF = 0.05
+
+
+def make_embeddings(
+    centers: torch.FloatTensor,
+    history: torch.FloatTensor,
+    count: int,
+    noise: float,
+    duplicates: float,
+    generator: torch.Generator,
+) -> torch.FloatTensor:
+    """Samples embeddings around random centers, a share of which are near duplicates of the history."""
+    topics = torch.randint(len(centers), (count,), generator=generator)
+    embeddings = centers[topics] + noise * torch.randn(
+        (count, centers.shape[1]), generator=generator
+    )
+    if history is not None and len(history) > 0:
+        copies = torch.rand(count, generator=generator) < duplicates
+        sources = torch.randint(len(history), (count,), generator=generator)
+        embeddings[copies] = history[sources[copies]] + 0.01 * torch.randn(
+            (int(copies.sum()), centers.shape[1]), generator=generator
+        )
+    return F.normalize(embeddings, p=2, dim=1)
+
+
+def benchmark(config: argparse.Namespace):
+    generator = torch.Generator().manual_seed(config.seed)
+    centers = F.normalize(
+        torch.randn((config.topics, config.dim), generator=generator), p=2, dim=1
+    )
+
+    print(
+        f"{'probes':>8}{'recall':>10}{'max error':>12}{'decisions':>12}"
+        f"{'exact ms':>11}{'ivf ms':>9}"
+    )
+    for num_probes in config.probes:
+        index = IVFIndex(config.capacity, num_lists=config.lists, num_probes=num_probes)
+        # The exact reference is the dense search over the history tensor that the exact mode keeps.
+        history = make_embeddings(
+            centers, None, config.capacity, config.noise, 0, generator
+        )
+        index.add(history)
+
+        hits = total = changed = 0
+        max_error = exact_time = ivf_time = 0.0
+        for _ in range(config.steps):
+            queries = make_embeddings(
+                centers,
+                history,
+                config.batch_size,
+                config.noise,
+                config.duplicates,
+                generator,
+            )
+
+            start = time.perf_counter()
+            similarity = pairwise_cosine_similarity(queries, history[config.skip :])
+            exact_similarities, positions = similarity.abs().topk(config.k, dim=1)
+            exact_time += time.perf_counter() - start
+            exact_ids = index.next_id - len(history) + config.skip + positions
+
+            start = time.perf_counter()
+            similarities, ids = index.search(queries, config.k, skip=config.skip)
+            ivf_time += time.perf_counter() - start
+
+            for exact_row, row in zip(exact_ids.tolist(), ids.tolist()):
+                hits += len(set(exact_row) & set(row))
+                total += len(exact_row)
+            max_error = max(
+                max_error, (exact_similarities - similarities).abs().max().item()
+            )
+            changed += int(
+                (
+                    (1 - exact_similarities[:, -1] > CUTOFF)
+                    != (1 - similarities[:, -1] > CUTOFF)
+                ).sum()
+            )
+            index.add(queries)
+            history = torch.cat([history, queries])[-config.capacity :]
+
+        completions = config.steps * config.batch_size
+        print(
+            f"{num_probes:>8}{hits / total:>10.4f}{max_error:>12.5f}"
+            f"{changed / completions:>12.4f}"
+            f"{1000 * exact_time / config.steps:>11.2f}"
+            f"{1000 * ivf_time / config.steps:>9.2f}"
+        )
+
+
+def config() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--capacity", type=int, default=15500)
+    parser.add_argument("--skip", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--lists", type=int, default=128)
+    parser.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--batch_size", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.03)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    benchmark(config())
@@ -0,0 +1,296 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""Replays the events logged by a validator through the reward stack.
+
+The validator writes every step to `completions.log` (see `--neuron.dont_save_events`). This script reads
+those events, rebuilds the responses of each step and feeds them through `compute_rewards` with the reward,
+masking and penalty functions the validator would use, then reports the throughput, latency percentiles
+and peak memory of every function. No chain, wallet or miner is needed.
+
+Example:
+    python scripts/replay_events.py --events ~/.bittensor/miners/.../completions.log --neuron.mock_reward_models
+    python scripts/replay_events.py --events completions.log --neuron.device cpu --neuron.reward_execution concurrent
+"""
+
+import os
+import json
+import time
+import torch
+import random
+import argparse
+import threading
+import functools
+import itertools
+import numpy as np
+import bittensor as bt
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from neurons.validators.validator import neuron
+from prompting.validators.config import add_args
+from prompting.validators.forward import compute_rewards
+from prompting.validators.timing import StepTimer
+from prompting.validators.loading import ModelLoader
+from prompting.validators.characterset import default_character
+from prompting.validators.tasks import create_message_from_description_task
+
+
+def read_events(paths: List[str]) -> Iterator[dict]:
+    """Yields the step events of serialized loguru logs."""
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)["record"]
+                if record["level"]["name"] == "EVENTS":
+                    yield record["extra"]
+
+
+def make_responses(event: dict) -> List[SimpleNamespace]:
+    """Rebuilds the responses of a step from its event."""
+    status_codes = event.get("completion_status_codes") or [200] * len(
+        event["completions"]
+    )
+    return [
+        SimpleNamespace(
+            completion=completion or "",
+            dendrite=SimpleNamespace(status_code=int(status_code)),
+        )
+        for completion, status_code in zip(event["completions"], status_codes)
+    ]
+
+
+def resident_memory() -> int:
+    """Returns the resident memory of the process in bytes."""
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakMemory:
+    """Peak memory of measured calls above the memory in use when they start.
+
+    On a cuda device the peak statistics are reset before every call. On cpu the resident memory is
+    sampled by a background thread while calls are running, as ru_maxrss only ever grows. Calls can be
+    nested or concurrent, the peak reached while a call runs counts towards every other running call.
+    """
+
+    def __init__(self, device: torch.device, interval: float = 0.001):
+        self.cuda = torch.device(device).type == "cuda"
+        self.interval = interval
+        self.calls = itertools.count()
+        self.peaks: Dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.sampler: threading.Thread = None
+
+    def current(self) -> int:
+        if self.cuda:
+            return torch.cuda.memory_allocated()
+        return resident_memory()
+
+    def record(self, memory: int):
+        for call, peak in self.peaks.items():
+            self.peaks[call] = max(peak, memory)
+
+    def sample(self):
+        """Records the resident memory into the running calls until they all return."""
+        while True:
+            memory = resident_memory()
+            with self.lock:
+                if not self.peaks:
+                    self.sampler = None
+                    return
+                self.record(memory)
+            time.sleep(self.interval)
+
+    def start(self) -> Tuple[int, int]:
+        """Starts measuring a call, returning its id and the memory in use."""
+        memory = self.current()
+        with self.lock:
+            if self.cuda:
+                # Keep the peak of the running calls before resetting it.
+                self.record(torch.cuda.max_memory_allocated())
+                torch.cuda.reset_peak_memory_stats()
+            call = next(self.calls)
+            self.peaks[call] = memory
+            if not self.cuda and self.sampler is None:
+                self.sampler = threading.Thread(target=self.sample, daemon=True)
+                self.sampler.start()
+        return call, memory
+
+    def stop(self, call: int, memory_start: int) -> int:
+        """Stops measuring a call, returning its peak memory increase."""
+        with self.lock:
+            self.record(
+                torch.cuda.max_memory_allocated() if self.cuda else self.current()
+            )
+            return self.peaks.pop(call) - memory_start
+
+
+class FunctionStats:
+    """Latency, throughput and memory of a reward, masking or penalty function."""
+
+    def __init__(self, memory: PeakMemory):
+        self.memory = memory
+        self.latencies: List[float] = []
+        self.completions = 0
+        self.peak_memory_increase = 0
+
+    def measure(self, fn: Callable, count_completions: Callable) -> Callable:
+        """Wraps the function so that each call is measured."""
+
+        @functools.wraps(fn)
+        def measured(*args, **kwargs):
+            call, memory_start = self.memory.start()
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                memory_increase = self.memory.stop(call, memory_start)
+            self.latencies.append(time.perf_counter() - start)
+            self.completions += count_completions(*args, **kwargs)
+            self.peak_memory_increase = max(self.peak_memory_increase, memory_increase)
+            return result
+
+        return measured
+
+    def report(self) -> dict:
+        latencies = np.array(self.latencies)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        return {
+            "calls": len(latencies),
+            "completions": self.completions,
+            "completions_per_second": self.completions / latencies.sum(),
+            "latency_p50_ms": p50,
+            "latency_p95_ms": p95,
+            "latency_p99_ms": p99,
+            "peak_memory_increase_mb": self.peak_memory_increase / 2**20,
+        }
+
+
+def count_scored(prompt, responses, name, mask=None) -> int:
+    """Number of completions a reward or masking function scores."""
+    return len(responses) if mask is None else int(mask.sum())
+
+
+def count_penalized(responses, task) -> int:
+    """Number of completions a penalty function scores."""
+    return len(responses)
+
+
+def replay(config: "bt.Config") -> Dict[str, dict]:
+    """Feeds the logged events through compute_rewards and returns the stats of every function."""
+    random.seed(config.seed)
+
+    # Build the reward stack the same way the validator does.
+    validator = SimpleNamespace(
+        config=config,
+        device=torch.device(config.neuron.device),
+        step_timer=StepTimer(),
+        model_loader=ModelLoader(max_workers=config.neuron.model_loading_workers),
+    )
+    neuron.init_reward_models(validator)
+    validator.model_loader.log_timeline()
+    validator.model_loader.shutdown()
+
+    memory = PeakMemory(validator.device)
+    stats: Dict[str, FunctionStats] = {}
+    for fn in validator.reward_functions + validator.masking_functions:
+        stats[fn.name] = FunctionStats(memory)
+        fn.apply = stats[fn.name].measure(fn.apply, count_scored)
+    for fn in validator.penalty_functions:
+        stats[fn.name] = FunctionStats(memory)
+        fn.apply_penalties = stats[fn.name].measure(fn.apply_penalties, count_penalized)
+
+    step_stats = FunctionStats(memory)
+    run_step = step_stats.measure(compute_rewards, lambda *args: len(args[2]))
+
+    events = read_events(config.events)
+    for step, event in enumerate(events):
+        if config.max_steps is not None and step >= config.max_steps:
+            break
+
+        # Events written before the base text was logged fall back to the full prompt.
+        task = create_message_from_description_task(
+            event.get("base_text", event["prompt"]), default_character()
+        )
+        responses = make_responses(event)
+        validator.blacklist.add(
+            [response.completion for response in responses if response.completion]
+        )
+        run_step(validator, task, responses, event["name"], {})
+
+    if not step_stats.latencies:
+        raise ValueError(f"No events found in {config.events}, pass them with --events")
+
+    report = {name: fn_stats.report() for name, fn_stats in stats.items()}
+    report["compute_rewards"] = step_stats.report()
+    return report
+
+
+def config() -> "bt.Config":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--events",
+        type=str,
+        nargs="+",
+        help="Paths of the completions.log files to replay.",
+        default=[],
+    )
+    parser.add_argument(
+        "--max_steps",
+        type=int,
+        help="Replay at most this many steps.",
+        default=None,
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the task criteria, which are not logged and regenerated at random.",
+        default=0,
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Optional path of a json file the report is written to.",
+        default=None,
+    )
+    add_args(None, parser)
+    return bt.config(parser)
+
+
+if __name__ == "__main__":
+    config = config()
+    report = replay(config)
+
+    columns = list(next(iter(report.values())).keys())
+    print(
+        f"{'function':<28}"
+        + "".join(f"{column:>{len(column) + 2}}" for column in columns)
+    )
+    for name, row in report.items():
+        print(
+            f"{name:<28}"
+            + "".join(f"{row[column]:>{len(column) + 2}.2f}" for column in columns)
+        )
+
+    if config.output is not None:
+        with open(config.output, "w") as file:
+            json.dump(report, file, indent=2)
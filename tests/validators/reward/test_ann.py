@@ -0,0 +1,136 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import torch
+import tempfile
+import unittest
+import torch.nn.functional as F
+from transformers import BertModel
+from torchmetrics.functional import pairwise_cosine_similarity
+from prompting.validators.reward.ann import IVFIndex
+from prompting.validators.reward.diversity import DiversityRewardModel
+from prompting.validators.reward.history import EmbeddingHistory
+from .test_backend import make_checkpoint
+
+
+def make_embeddings(count: int, dim: int = 16, topics: int = 8, seed: int = 0):
+    """Unit embeddings drawn around a few random topics."""
+    generator = torch.Generator().manual_seed(seed)
+    centers = torch.randn((topics, dim), generator=generator)
+    topic = torch.randint(topics, (count,), generator=generator)
+    embeddings = centers[topic] + 0.2 * torch.randn((count, dim), generator=generator)
+    return F.normalize(embeddings, p=2, dim=1)
+
+
+class IVFIndexTestCase(unittest.TestCase):
+    def test_exact_search_matches_dense_search_over_window(self):
+        index = IVFIndex(capacity=50, num_lists=4, train_size=20)
+        embeddings = make_embeddings(130)
+        for start in range(0, 120, 15):
+            index.add(embeddings[start : start + 15])
+        self.assertEqual(len(index), 50)
+        self.assertEqual(len(index.lists), 4)
+
+        # The window holds the last 50 embeddings, the 10 oldest of which are skipped.
+        queries = embeddings[120:]
+        window = embeddings[70:120]
+        similarity = pairwise_cosine_similarity(queries, window[10:]).abs()
+        expected, positions = similarity.topk(3, dim=1)
+
+        similarities, ids = index.exact_search(queries, 3, skip=10)
+        self.assertTrue(torch.allclose(similarities, expected, atol=1e-5))
+        self.assertTrue(torch.equal(ids, positions + 80))
+
+    def test_probing_every_list_is_exact(self):
+        index = IVFIndex(capacity=200, num_lists=8, num_probes=8, train_size=100)
+        index.add(make_embeddings(300))
+        queries = make_embeddings(20, seed=1)
+        exact = index.exact_search(queries, 2, skip=5)
+        approximate = index.search(queries, 2, skip=5)
+        self.assertTrue(torch.allclose(exact[0], approximate[0]))
+        self.assertTrue(torch.equal(exact[1], approximate[1]))
+
+    def test_search_finds_opposite_embeddings(self):
+        index = IVFIndex(capacity=200, num_lists=8, num_probes=2, train_size=100)
+        embeddings = make_embeddings(200)
+        index.add(embeddings)
+        similarities, ids = index.search(-embeddings[:10], 1)
+        self.assertTrue(torch.allclose(similarities[:, 0], torch.ones(10)))
+        self.assertTrue(torch.equal(ids[:, 0], torch.arange(10)))
+
+    def test_expired_embeddings_are_not_returned(self):
+        index = IVFIndex(capacity=100, num_lists=4, num_probes=1, train_size=50)
+        embeddings = make_embeddings(300)
+        for start in range(0, 300, 20):
+            index.add(embeddings[start : start + 20])
+            _, ids = index.search(embeddings[start : start + 20], 2)
+            self.assertTrue((ids >= index.oldest_id).all())
+        # The index was retrained once the first trained window had been replaced.
+        self.assertGreaterEqual(index.trained_at, 150)
+
+
+class TinyDiversityRewardModel(DiversityRewardModel):
+    diversity_model_path = None
+
+
+class DiversityIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        TinyDiversityRewardModel.diversity_model_path = make_checkpoint(
+            self.directory.name, BertModel
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_ivf_rewards_match_exact_rewards(self):
+        models = [
+            TinyDiversityRewardModel("cpu", index="exact"),
+            TinyDiversityRewardModel("cpu", index="ivf", num_probes=4),
+        ]
+        for model in models:
+            model.history_range = (20, 300)
+            model.history = EmbeddingHistory(300, "cpu")
+            if model.index is not None:
+                model.index = IVFIndex(300, num_lists=8, num_probes=4, train_size=100)
+
+        embeddings = make_embeddings(1000, dim=32, topics=40)
+        changed = scored = 0
+        for start in range(0, 1000, 25):
+            batch = embeddings[start : start + 25]
+            exact, ivf = [model.get_historic_rewards(batch) for model in models]
+            if exact is None:
+                self.assertIsNone(ivf)
+            elif models[1].index.centroids is None:
+                self.assertTrue(torch.allclose(exact, ivf, atol=1e-5))
+            else:
+                changed += int(((exact > 0.5) != (ivf > 0.5)).sum())
+                scored += len(batch)
+            for model in models:
+                model.update_historic_embeddings(batch)
+
+        # The approximate search changes the decision of less than 1% of the completions.
+        self.assertGreater(scored, 0)
+        self.assertLess(changed / scored, 0.01)
+
+    def test_unknown_index_is_rejected(self):
+        with self.assertRaises(ValueError):
+            TinyDiversityRewardModel("cpu", index="hnsw")
+
+
+if __name__ == "__main__":
+    unittest.main()
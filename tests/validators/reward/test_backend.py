@@ -0,0 +1,226 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import os
+import torch
+import tempfile
+import unittest
+from huggingface_hub import try_to_load_from_cache
+from transformers import (
+    BertConfig,
+    BertModel,
+    BertForSequenceClassification,
+    BertTokenizerFast,
+)
+from prompting.validators.reward.backend import apply_backend
+from prompting.validators.reward.embedding import EmbeddingService
+from prompting.validators.reward.diversity import DiversityRewardModel
+from prompting.validators.reward.nsfw import NSFWRewardModel
+from prompting.validators.reward.relevance import (
+    RelevanceRewardModel,
+    BertRelevanceRewardModel,
+    MpnetRelevenceModel,
+)
+
+WORDS = "the a knight dragon tower sword old young king queen sings runs red blue sea".split()
+
+SENTENCES = [
+    "the old knight runs to the tower",
+    "a young queen sings by the sea",
+    "the red dragon",
+    "the blue sword of the king " * 30,
+    "the old knight runs to the tower .",
+]
+
+# Decision boundaries of the reward models that can run on the int8 backend.
+NSFW_BOUNDARY = (
+    -0.5
+)  # Completions whose max(-nothate, hate) logit is above it are masked.
+BERT_RELEVANCE_BOUND = (
+    -0.0246
+)  # Completions whose -RMSE to the prompt is below it are masked.
+MPNET_RELEVANCE_BOUND = (
+    0.3  # Completions whose cosine similarity to the prompt is below it are masked.
+)
+DIVERSITY_BOUNDARY = (
+    0.2  # Completions whose diversity reward is not above it get no reward.
+)
+
+
+def tolerance(boundary: float) -> float:
+    """Allowed difference between the fp32 and int8 scores, a tenth of the decision boundary."""
+    return 0.1 * abs(boundary)
+
+
+def make_checkpoint(directory: str, model_class) -> str:
+    """Saves a small randomly initialised bert checkpoint with its tokenizer."""
+    torch.manual_seed(0)
+    vocab_file = os.path.join(directory, "vocab.txt")
+    with open(vocab_file, "w") as file:
+        file.write(
+            "\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "."] + WORDS)
+        )
+
+    config = BertConfig(
+        vocab_size=len(WORDS) + 6,
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=128,
+        max_position_embeddings=64,
+        initializer_range=0.05,
+    )
+    model_class(config).save_pretrained(directory)
+    BertTokenizerFast(vocab_file, model_max_length=64).save_pretrained(directory)
+    return directory
+
+
+class TinyDiversityRewardModel(DiversityRewardModel):
+    diversity_model_path = None
+
+
+class RewardBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertDecisionsAgree(
+        self,
+        fp32_scores: torch.FloatTensor,
+        int8_scores: torch.FloatTensor,
+        boundary: float,
+    ):
+        """Checks that the int8 scores are within the tolerance of the boundary and take the same decisions.
+
+        The randomly initialised checkpoints do not score around the real boundary, so the decisions are
+        also compared for boundaries spread over the fp32 scores, skipping those within the tolerance of
+        a score.
+        """
+        self.assertLess((fp32_scores - int8_scores).abs().max(), tolerance(boundary))
+        self.assertTrue(torch.equal(fp32_scores > boundary, int8_scores > boundary))
+
+        for shifted in torch.linspace(fp32_scores.min(), fp32_scores.max(), 41):
+            if ((fp32_scores - shifted).abs() > tolerance(boundary)).all():
+                self.assertTrue(
+                    torch.equal(fp32_scores > shifted, int8_scores > shifted)
+                )
+
+    def test_int8_relevance_decisions_match_fp32(self):
+        path = make_checkpoint(self.directory.name, BertModel)
+        fp32 = EmbeddingService(path, "cpu", backend="fp32")
+        int8 = EmbeddingService(path, "cpu", backend="int8")
+        self.assertIsInstance(
+            int8.model.encoder.layer[0].attention.self.query,
+            torch.ao.nn.quantized.dynamic.Linear,
+        )
+
+        for overflow in [False, True]:
+            fp32_embeddings = fp32.encode(SENTENCES, overflow=overflow)
+            int8_embeddings = int8.encode(SENTENCES, overflow=overflow)
+
+            # Bert relevance compares the RMSE between the prompt and the completions.
+            fp32_scores = -(
+                ((fp32_embeddings[1:] - fp32_embeddings[0]) ** 2).mean(dim=1) ** 0.5
+            )
+            int8_scores = -(
+                ((int8_embeddings[1:] - int8_embeddings[0]) ** 2).mean(dim=1) ** 0.5
+            )
+            self.assertDecisionsAgree(fp32_scores, int8_scores, BERT_RELEVANCE_BOUND)
+
+            # Mpnet relevance compares the cosine similarity with the prompt.
+            self.assertDecisionsAgree(
+                (fp32_embeddings[1:] @ fp32_embeddings[0]).abs(),
+                (int8_embeddings[1:] @ int8_embeddings[0]).abs(),
+                MPNET_RELEVANCE_BOUND,
+            )
+
+    def test_int8_diversity_decisions_match_fp32(self):
+        TinyDiversityRewardModel.diversity_model_path = make_checkpoint(
+            self.directory.name, BertModel
+        )
+        fp32 = TinyDiversityRewardModel("cpu", backend="fp32")
+        int8 = TinyDiversityRewardModel("cpu", backend="int8")
+
+        sentences = SENTENCES + [
+            "the king and the queen",
+            "a dragon runs to the sea",
+            "the young knight sings",
+        ]
+        self.assertDecisionsAgree(
+            fp32.get_batch_diversity_rewards(fp32.get_embeddings(sentences)),
+            int8.get_batch_diversity_rewards(int8.get_embeddings(sentences)),
+            DIVERSITY_BOUNDARY,
+        )
+
+    def test_int8_mask_decisions_match_fp32(self):
+        path = make_checkpoint(self.directory.name, BertForSequenceClassification)
+        tokenizer = BertTokenizerFast.from_pretrained(path)
+        fp32 = apply_backend(
+            BertForSequenceClassification.from_pretrained(path), "fp32", "cpu"
+        )
+        int8 = apply_backend(
+            BertForSequenceClassification.from_pretrained(path), "int8", "cpu"
+        )
+
+        inputs = tokenizer(
+            SENTENCES, padding=True, truncation=True, return_tensors="pt"
+        )
+        with torch.no_grad():
+            fp32_logits = fp32(**inputs).logits
+            int8_logits = int8(**inputs).logits
+
+        # Same score as the nsfw filter, which masks completions scoring above its boundary.
+        self.assertDecisionsAgree(
+            torch.maximum(-fp32_logits[:, 0], fp32_logits[:, 1]),
+            torch.maximum(-int8_logits[:, 0], int8_logits[:, 1]),
+            NSFW_BOUNDARY,
+        )
+
+    def test_int8_keeps_the_decisions_of_the_real_checkpoints(self):
+        paths = [
+            NSFWRewardModel.nsfw_filter_model_path,
+            BertRelevanceRewardModel.relevance_model_path,
+            MpnetRelevenceModel.diversity_model_path,
+        ]
+        if any(try_to_load_from_cache(path, "config.json") is None for path in paths):
+            self.skipTest("The reward model checkpoints are not downloaded")
+
+        prompt = "Tell me about the history of the castle on the hill."
+        completions = [
+            "The castle was built in the twelfth century to guard the valley.",
+            "I love pizza with extra cheese.",
+            "You are an idiot and everyone hates you.",
+            "Its walls were rebuilt after a siege in 1450, and the keep still stands.",
+            "The castle on the hill has a long history of sieges and restorations.",
+        ]
+        for model_class in [NSFWRewardModel, RelevanceRewardModel]:
+            fp32 = model_class("cpu", backend="fp32")
+            int8 = model_class("cpu", backend="int8")
+            self.assertEqual(
+                [event.reward for event in fp32.get_rewards(prompt, completions, "")],
+                [event.reward for event in int8.get_rewards(prompt, completions, "")],
+            )
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            apply_backend(torch.nn.Linear(2, 2), "int4", "cpu")
+
+
+if __name__ == "__main__":
+    unittest.main()
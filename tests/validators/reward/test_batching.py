@@ -0,0 +1,151 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from prompting.validators.reward.batching import RewardBatcher
+from prompting.validators.reward.reward import BaseRewardModel, BaseRewardEvent
+
+
+class PromptLengthRewardModel(BaseRewardModel):
+    """Reward model scoring completions by their length plus the length of the prompt."""
+
+    @property
+    def name(self) -> str:
+        return "prompt_length"
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def get_rewards(self, prompt, completions, name):
+        if "fail" in completions:
+            raise ValueError("failed to score")
+        return [
+            BaseRewardEvent(reward=len(prompt) + len(completion))
+            for completion in completions
+        ]
+
+    def get_batch_rewards(self, jobs):
+        self.batches.append(len(jobs))
+        return super().get_batch_rewards(jobs)
+
+
+class RewardBatcherTestCase(unittest.TestCase):
+    def submit_concurrently(self, model, jobs):
+        # Every step registers with the batcher before any of them submits, as in `compute_rewards`.
+        callers = [model.batcher.expect() for _ in jobs]
+
+        def submit(caller, job):
+            with caller:
+                return model.request_rewards(*job)
+
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = [
+                executor.submit(submit, caller, job)
+                for caller, job in zip(callers, jobs)
+            ]
+            return [future.result() for future in futures]
+
+    def test_concurrent_jobs_are_scored_in_one_batch(self):
+        model = PromptLengthRewardModel()
+        model.batcher = RewardBatcher(model, window=1.0, max_batch_size=8)
+        jobs = [("p" * i, ["a", "bb"], "augment") for i in range(4)]
+
+        results = self.submit_concurrently(model, jobs)
+
+        # The fourth job fills the batch, so nobody waits for the whole window.
+        self.assertEqual(model.batches, [4])
+        for (prompt, completions, _), reward_events in zip(jobs, results):
+            self.assertEqual(
+                [event.reward for event in reward_events],
+                [len(prompt) + len(completion) for completion in completions],
+            )
+
+    def test_lone_step_does_not_wait_for_the_window(self):
+        model = PromptLengthRewardModel()
+        model.batcher = RewardBatcher(model, window=10.0)
+
+        start = time.monotonic()
+        results = self.submit_concurrently(model, [("p", ["a"], "augment")])
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(model.batches, [1])
+        self.assertEqual(results[0][0].reward, 2)
+
+    def test_step_leaving_without_submitting_is_not_waited_for(self):
+        model = PromptLengthRewardModel()
+        model.batcher = RewardBatcher(model, window=10.0)
+        submitting, leaving = model.batcher.expect(), model.batcher.expect()
+
+        def submit():
+            with submitting:
+                return model.request_rewards("p", ["a"], "augment")
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(submit)
+            # The other step finds its completions cached and never submits.
+            time.sleep(0.1)
+            with leaving:
+                pass
+            future.result()
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(model.batches, [1])
+        self.assertEqual(model.batcher.expected, 0)
+
+    def test_unregistered_jobs_are_scored_without_waiting(self):
+        model = PromptLengthRewardModel()
+        model.batcher = RewardBatcher(model, window=10.0)
+
+        start = time.monotonic()
+        reward_events = model.request_rewards("pp", ["a"], "augment")
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(reward_events[0].reward, 3)
+
+    def test_errors_are_raised_in_every_job_of_the_batch(self):
+        model = PromptLengthRewardModel()
+        model.batcher = RewardBatcher(model, window=1.0, max_batch_size=2)
+
+        callers = [model.batcher.expect() for _ in range(2)]
+
+        def submit(caller, completion):
+            with caller:
+                return model.request_rewards("p", [completion], "augment")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(submit, callers[0], "fail"),
+                executor.submit(submit, callers[1], "ok"),
+            ]
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    future.result()
+        self.assertEqual(model.batches, [2])
+
+    def test_without_batcher_scores_directly(self):
+        model = PromptLengthRewardModel()
+        reward_events = model.request_rewards("pp", ["a"], "augment")
+        self.assertEqual(reward_events[0].reward, 3)
+        self.assertEqual(model.batches, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
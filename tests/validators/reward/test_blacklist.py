@@ -0,0 +1,215 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import os
+import random
+import tempfile
+import json
+import unittest
+from huggingface_hub import try_to_load_from_cache
+from transformers import BertTokenizer
+from prompting.validators.reward.blacklist import Blacklist
+
+WORDS = [f"word{index}" for index in range(200)]
+
+PHRASE = "the quick brown fox jumps over the lazy dog again and again"
+
+# Text on which slow and fast bert tokenizers are known to disagree: accents, combining marks, CJK,
+# fullwidth forms, control, zero-width and bidirectional characters, and unusual whitespace.
+UNICODE_TEXTS = [
+    "Café naïve résumé Cafe\u0301",
+    "日本語のテキスト 中文 한국어",
+    "ｔｅｓｔ ＡＢＣ １２３",
+    "zero\u200bwidth\u200djoin\u2060er\ufeffbom",
+    "tab\tnew\nline\x00nul\x07bell\x1fus\x85nel",
+    "soft\u00adhyphen \u3000ideographic\u00a0space",
+    "İstanbul ıi straße ﬁne x² ǅ",
+    "ΟΔΟΣ Σίσυφος ℌ Ω emoji 😀",
+    "\u202eRTL\u202c mixed",
+]
+
+# Vocabulary of the test tokenizers, with a few of the non ascii words.
+VOCAB = (
+    ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    + WORDS
+    + sorted(set(PHRASE.split()))
+    + ["café", "cafe", "naïve", "naive", "é", "e", "##é", "##e", "##s"]
+    + ["日", "本", "語", "中", "文", "ｔｅｓｔ", "test", "straße", "ß", "ο", "σ", "ς"]
+)
+
+
+def make_completions(count: int, seed: int = 0):
+    """Random completions, a third of which contain the same overused phrase."""
+    generator = random.Random(seed)
+    completions = []
+    for index in range(count):
+        words = generator.choices(WORDS, k=generator.randint(0, 40))
+        if index % 3 == 0:
+            words.insert(generator.randint(0, len(words)), PHRASE)
+        completions.append(" ".join(words))
+    return completions
+
+
+def significance(blacklist: Blacklist) -> dict:
+    """Significance scores computed from the whole counter."""
+    threshold = max(
+        blacklist.support * blacklist.num_completion, blacklist.w_current + 1
+    )
+    scores = {}
+    for ngram, (frequency, max_error) in blacklist.counter.items():
+        if frequency + max_error > threshold:
+            decoded_ngram = blacklist.tokenizer.decode(ngram)
+            if len(decoded_ngram.split()) >= blacklist.n_min:
+                scores[decoded_ngram] = (
+                    blacklist.A ** (len(decoded_ngram.split()) - 1)
+                    * ((frequency + max_error) / blacklist.num_completion)
+                    * blacklist.frequency_multiplier
+                )
+    return dict(sorted(scores.items(), key=lambda x: x[1], reverse=True))
+
+
+class TinyBlacklist(Blacklist):
+    tokenizer_path = None
+
+
+class BlacklistTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "vocab.txt"), "w") as file:
+            file.write("\n".join(VOCAB))
+        TinyBlacklist.tokenizer_path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hashes_follow_extracted_ngrams(self):
+        blacklist = TinyBlacklist(ngram_keys="hash")
+        for completion in make_completions(30):
+            words = blacklist.tokenize(completion)
+            ngrams = blacklist.extract_ngrams(completion)
+            hashes = blacklist.hash_ngrams(words)
+            self.assertEqual(len(hashes), len(ngrams))
+            for index, ngram in enumerate(ngrams):
+                self.assertEqual(blacklist.ngram_tokens(words, index), ngram)
+
+            # Equal n-grams have equal hashes, distinct ones distinct hashes.
+            self.assertEqual(len(set(hashes)), len(set(ngrams)))
+
+    def test_hash_keys_match_tuple_keys(self):
+        blacklists = [
+            TinyBlacklist(ngram_keys="tuple", boundary=5),
+            TinyBlacklist(ngram_keys="hash", boundary=5),
+        ]
+        completions = make_completions(300)
+        for start in range(0, 300, 50):
+            for blacklist in blacklists:
+                blacklist.add(completions[start : start + 50])
+
+        by_tuple, by_hash = blacklists
+        self.assertEqual(len(by_tuple.counter), len(by_hash.counter))
+        significance = by_tuple.calculate_significance()
+        self.assertIn("the quick brown fox jumps over the lazy dog again", significance)
+        self.assertEqual(by_hash.calculate_significance(), significance)
+
+        # Only the n-grams above the support threshold are decoded.
+        self.assertLess(len(by_hash.significant), len(by_hash.counter) / 10)
+        # Only the n-grams within reach of the threshold keep their token ids.
+        self.assertLess(len(by_hash.candidates), len(by_hash.counter) / 10)
+
+        test_completions = make_completions(20, seed=1)
+        self.assertEqual(
+            [event.reward for event in by_hash.get_rewards("", test_completions, "")],
+            [event.reward for event in by_tuple.get_rewards("", test_completions, "")],
+        )
+
+    def test_incremental_significance_matches_full_recompute(self):
+        # A short window and half life exercise pruning and halving, a small memory limit the safety
+        # prune that raises the window index, and the threshold, until the next window resets it.
+        for support, memory_lim in [(0.05, 1_000_000), (0.01, 1500)]:
+            blacklists = [
+                TinyBlacklist(
+                    ngram_keys=keys,
+                    error=0.02,
+                    half_life=400,
+                    support=support,
+                    memory_lim=memory_lim,
+                )
+                for keys in ["tuple", "hash"]
+            ]
+            completions = make_completions(1200)
+            for start in range(0, 1200, 40):
+                for blacklist in blacklists:
+                    blacklist.add(completions[start : start + 40])
+
+                by_tuple, by_hash = blacklists
+                expected = significance(by_tuple)
+                self.assertEqual(by_tuple.calculate_significance(), expected)
+                self.assertEqual(by_hash.calculate_significance(), expected)
+            self.assertGreater(len(expected), 0)
+
+    def assertBatchTokenizationMatches(self, blacklist: Blacklist, tokenizer_path: str):
+        tokenizer = BertTokenizer.from_pretrained(tokenizer_path)
+        texts = (
+            make_completions(50)
+            + UNICODE_TEXTS
+            + [
+                "",
+                "The Quick, brown fox! Jumps; over\tthe lazy dog...",
+                "WORD1 wörd2 naïve word3\n\nword4",
+                "word5\x1eword6",
+            ]
+        )
+
+        expected = []
+        for text in texts:
+            # Reference pipeline: lowercase, strip punctuation, slow tokenizer without special tokens.
+            text = blacklist.preprocess.sub("", text.lower()).lower()
+            expected.append(tokenizer(text)["input_ids"][1:-1][: blacklist.word_limit])
+
+        self.assertEqual(blacklist.tokenize_batch(texts), expected)
+        self.assertEqual(blacklist.tokenize_batch(texts[:-1]), expected[:-1])
+        # Each text tokenized on its own, as the fast tokenizer does not see its neighbours.
+        for text, words in zip(UNICODE_TEXTS, expected[50:]):
+            self.assertEqual(blacklist.tokenize_batch([text]), [words])
+        self.assertEqual(blacklist.tokenize_batch([]), [])
+
+    def test_batch_tokenization_matches_slow_tokenizer(self):
+        # Uncased like the default of a bare vocabulary, and cased like bert-base-cased.
+        for do_lower_case in [True, False]:
+            path = os.path.join(self.directory.name, f"lower_{do_lower_case}")
+            os.makedirs(path)
+            with open(os.path.join(path, "vocab.txt"), "w") as file:
+                file.write("\n".join(VOCAB))
+            with open(os.path.join(path, "tokenizer_config.json"), "w") as file:
+                json.dump({"do_lower_case": do_lower_case}, file)
+
+            TinyBlacklist.tokenizer_path = path
+            self.assertBatchTokenizationMatches(TinyBlacklist(word_limit=30), path)
+
+    def test_batch_tokenization_matches_slow_bert_base_cased(self):
+        if try_to_load_from_cache(Blacklist.tokenizer_path, "vocab.txt") is None:
+            self.skipTest(f"The {Blacklist.tokenizer_path} tokenizer is not downloaded")
+
+        self.assertBatchTokenizationMatches(Blacklist(), Blacklist.tokenizer_path)
+
+    def test_unknown_ngram_keys_are_rejected(self):
+        with self.assertRaises(ValueError):
+            TinyBlacklist(ngram_keys="bytes")
+
+
+if __name__ == "__main__":
+    unittest.main()
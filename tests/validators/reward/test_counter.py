@@ -0,0 +1,76 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import math
+import unittest
+import numpy as np
+from prompting.validators.reward.counter import NgramCounter
+
+
+class NgramCounterTestCase(unittest.TestCase):
+    def test_matches_dictionary_counter(self):
+        generator = np.random.default_rng(0)
+        # Few bits of key entropy force repeated keys and long probe sequences.
+        universe = generator.integers(
+            -(2**63), 2**63 - 1, size=3000, dtype=np.int64
+        )
+        counter = NgramCounter(capacity=4)
+        reference = {}
+        for step in range(1, 301):
+            keys = universe[generator.integers(0, len(universe), size=50)]
+            _, _, totals = counter.add(keys, step - 1)
+            for key in keys.tolist():
+                count = reference.setdefault(key, [0, step - 1])
+                count[0] += 1
+            self.assertEqual(
+                totals.tolist(),
+                [sum(reference[key]) for key in sorted(set(keys.tolist()))],
+            )
+
+            if step % 50 == 0:
+                counter.prune(step // 25)
+                reference = {
+                    key: count
+                    for key, count in reference.items()
+                    if count[0] + count[1] > step // 25
+                }
+            if step % 120 == 0:
+                counter.halve()
+                reference = {
+                    key: [math.ceil(count[0] / 2), math.ceil(count[1] / 2)]
+                    for key, count in reference.items()
+                }
+
+            self.assertEqual(len(counter), len(reference))
+        self.assertEqual(dict(counter.items()), reference)
+        for key, count in reference.items():
+            self.assertIn(key, counter)
+            self.assertEqual(counter[key], count)
+        self.assertNotIn(int(universe[0]) ^ 1, counter)
+        with self.assertRaises(KeyError):
+            counter[int(universe[0]) ^ 1]
+
+    def test_above_returns_keys_over_the_bound(self):
+        counter = NgramCounter()
+        counter.add(np.array([1, 2, 2, 3, 3, 3], dtype=np.int64), 0)
+        keys, totals = counter.above(1)
+        self.assertEqual(dict(zip(keys.tolist(), totals.tolist())), {2: 2, 3: 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
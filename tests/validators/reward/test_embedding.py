@@ -0,0 +1,72 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import threading
+import unittest
+from collections import OrderedDict
+from prompting.validators.reward.embedding import EmbeddingService
+
+
+class CountingEmbeddingService(EmbeddingService):
+    """Embedding service with a deterministic encoder that records every encoded sentence."""
+
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.encoded = []
+
+    def encode(self, sentences, overflow=False):
+        self.encoded.extend(sentences)
+        return torch.tensor([[float(len(s)), float(overflow)] for s in sentences])
+
+
+class EmbeddingServiceTestCase(unittest.TestCase):
+    def test_each_sentence_is_encoded_once(self):
+        service = CountingEmbeddingService()
+
+        first = service.embed(["a", "bb", "a"])
+        second = service.embed(["bb", "ccc"])
+
+        self.assertEqual(service.encoded, ["a", "bb", "ccc"])
+        self.assertTrue(torch.equal(first, torch.tensor([[1.0, 0], [2, 0], [1, 0]])))
+        self.assertTrue(torch.equal(second, torch.tensor([[2.0, 0], [3, 0]])))
+
+    def test_embedding_modes_are_cached_separately(self):
+        service = CountingEmbeddingService()
+
+        service.embed(["a"])
+        embeddings = service.embed(["a"], overflow=True)
+
+        self.assertEqual(service.encoded, ["a", "a"])
+        self.assertTrue(torch.equal(embeddings, torch.tensor([[1.0, 1.0]])))
+
+    def test_least_recently_used_embeddings_are_evicted(self):
+        service = CountingEmbeddingService(cache_size=2)
+
+        service.embed(["a", "bb"])
+        service.embed(["a"])
+        service.embed(["ccc"])
+        service.embed(["a", "bb"])
+
+        self.assertEqual(service.encoded, ["a", "bb", "ccc", "bb"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,314 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import io
+import os
+import torch
+import tempfile
+import unittest
+from transformers import BertModel
+from torchmetrics.functional import pairwise_cosine_similarity
+from prompting.validators.reward.history import HEADER, EmbeddingHistory
+from .test_ann import TinyDiversityRewardModel, make_embeddings
+from .test_backend import make_checkpoint
+
+
+class EmbeddingHistoryTestCase(unittest.TestCase):
+    def test_matches_concatenated_history(self):
+        history = EmbeddingHistory(capacity=50, device="cpu")
+        embeddings = make_embeddings(400)
+        expected = torch.tensor([])
+        start = 0
+        for size in [7, 30, 1, 49, 50, 13, 120, 3, 22]:
+            batch = embeddings[start : start + size]
+            start += size
+            history.append(batch)
+            expected = torch.cat([expected, batch])[-50:]
+
+            self.assertEqual(len(history), len(expected))
+            self.assertTrue(torch.equal(history.tensor(), expected))
+            for skip in [0, 10, 49, 50]:
+                segments = history.segments(skip=skip)
+                self.assertLessEqual(len(segments), 2)
+                stored = torch.cat(segments) if segments else torch.empty((0, 16))
+                self.assertTrue(torch.equal(stored, expected[skip:]))
+
+    def test_segments_are_views(self):
+        history = EmbeddingHistory(capacity=10, device="cpu")
+        history.append(make_embeddings(14))
+        buffer = history.buffer.untyped_storage().data_ptr()
+        for segment in history.segments(skip=2):
+            self.assertEqual(segment.untyped_storage().data_ptr(), buffer)
+
+    def test_reduced_precision_similarity_within_tolerance(self):
+        embeddings = make_embeddings(600, dim=768, topics=40)
+        queries = make_embeddings(50, dim=768, topics=40, seed=1)
+        reference = EmbeddingHistory(capacity=500, device="cpu")
+        reference.append(embeddings)
+        expected = reference.similarity(queries, skip=20)
+
+        # Maximum similarity error of each format, and its memory relative to fp32.
+        for dtype, tolerance, ratio in [
+            ("fp16", 1e-4, 2),
+            ("bf16", 1e-3, 2),
+            ("int8", 2e-3, 3.5),
+        ]:
+            history = EmbeddingHistory(capacity=500, device="cpu", dtype=dtype)
+            history.append(embeddings)
+            similarity = history.similarity(queries, skip=20)
+            self.assertLess((similarity - expected).abs().max(), tolerance, dtype)
+            self.assertLess((history.tensor() - reference.tensor()).abs().max(), 0.01)
+
+            size = history.buffer.numel() * history.buffer.element_size()
+            if history.scales is not None:
+                size += history.scales.numel() * history.scales.element_size()
+            self.assertGreaterEqual(
+                reference.buffer.numel() * reference.buffer.element_size() / size,
+                ratio,
+            )
+
+    def test_unknown_dtype_is_rejected(self):
+        with self.assertRaises(ValueError):
+            EmbeddingHistory(capacity=10, device="cpu", dtype="int4")
+
+    def test_file_backed_history_is_mapped_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for dtype in ["fp32", "bf16", "int8"]:
+                path = os.path.join(directory, f"{dtype}.bin")
+                history = EmbeddingHistory(
+                    capacity=50, device="cpu", dtype=dtype, path=path
+                )
+                history.append(make_embeddings(70))
+                self.assertIs(history.buffer, history.file_rows)
+                expected = history.tensor()
+
+                # Record the file at every header commit of the next write, where a crash could leave it.
+                snapshots = []
+                commit = history.commit
+
+                def recording_commit(cursor, length):
+                    commit(cursor, length)
+                    snapshots.append(bytes(history.file))
+
+                history.commit = recording_commit
+                history.append(make_embeddings(5, seed=1))
+
+                # The overwritten rows are dropped from the header first, then the new rows are counted.
+                self.assertEqual(len(snapshots), 2)
+                for snapshot, rows in zip(snapshots, [expected[5:], history.tensor()]):
+                    with open(path + ".crash", "wb") as file:
+                        file.write(snapshot)
+                    restored = EmbeddingHistory(
+                        capacity=50, device="cpu", dtype=dtype, path=path + ".crash"
+                    )
+                    self.assertTrue(torch.equal(restored.tensor(), rows))
+
+                # Every write is on disk without flushing.
+                restored = EmbeddingHistory(
+                    capacity=50, device="cpu", dtype=dtype, path=path
+                )
+                self.assertEqual((restored.cursor, len(restored)), (5, 50))
+                self.assertTrue(torch.equal(restored.tensor(), history.tensor()))
+
+            # A file written with another capacity is ignored and overwritten.
+            restored = EmbeddingHistory(capacity=40, device="cpu", path=path)
+            self.assertEqual(len(restored), 0)
+            restored.append(make_embeddings(3))
+            self.assertEqual(len(EmbeddingHistory(40, "cpu", path=path)), 3)
+
+    def test_rows_are_synced_before_the_header_counting_them(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for dtype in ["fp32", "int8"]:
+                path = os.path.join(directory, f"{dtype}.bin")
+                history = EmbeddingHistory(
+                    capacity=50, device="cpu", dtype=dtype, path=path
+                )
+                history.append(make_embeddings(48))
+                batch = make_embeddings(5, seed=1)
+                stored = history.quantize(batch)["rows"]
+
+                # Record the header and whether the new rows are in the file at every sync.
+                syncs = []
+                flush = history.file.flush
+
+                def recording_flush():
+                    header = HEADER.unpack(bytes(history.file[: HEADER.size]))
+                    rows = torch.cat([history.file_rows[48:], history.file_rows[:3]])
+                    syncs.append((header[2:4], torch.equal(rows, stored)))
+                    flush()
+
+                history.file.flush = recording_flush
+                history.append(batch)
+
+                # The overwritten rows are dropped, the rows are synced, then the header counts them.
+                self.assertEqual(
+                    syncs, [((48, 45), False), ((48, 45), True), ((3, 50), True)]
+                )
+
+
+class DiversityHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        TinyDiversityRewardModel.diversity_model_path = make_checkpoint(
+            self.directory.name, BertModel
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_historic_rewards_skip_the_oldest_embeddings(self):
+        model = TinyDiversityRewardModel("cpu")
+        model.history_range = (20, 100)
+        model.history = EmbeddingHistory(100, "cpu")
+
+        embeddings = make_embeddings(400, dim=32, topics=40)
+        history = torch.tensor([])
+        for start in range(0, 400, 25):
+            batch = embeddings[start : start + 25]
+            rewards = model.get_historic_rewards(batch)
+            if len(history) < 22:
+                self.assertIsNone(rewards)
+            else:
+                similarity = pairwise_cosine_similarity(batch, history[20:])
+                expected = 1 - similarity.abs().topk(2, dim=1)[0][:, -1]
+                expected = 1 / (1 + torch.exp(-1000 * expected + 50))
+                self.assertTrue(torch.allclose(rewards, expected))
+
+            model.update_historic_embeddings(batch)
+            history = torch.cat([history, batch])[-100:]
+
+    def test_duplicates_are_not_added_to_the_history(self):
+        embeddings = make_embeddings(40, dim=32, topics=40)
+        for index in ["exact", "ivf"]:
+            model = TinyDiversityRewardModel("cpu", index=index)
+            model.duplicate_range = 15
+
+            model.update_historic_embeddings(embeddings[:20])
+            self.assertEqual(len(model.historic_embeddings), 20)
+
+            # Repeats within the batch keep their first occurrence, near duplicates of the last
+            # `duplicate_range` embeddings of the history are dropped, older ones are kept. Opposite
+            # embeddings are not duplicates.
+            batch = torch.cat(
+                [
+                    embeddings[20:25],
+                    embeddings[[21, 20]],
+                    embeddings[[18]] + 1e-4,
+                    embeddings[[2]],
+                    -embeddings[[19]],
+                    embeddings[25:30],
+                ]
+            )
+            self.assertEqual(
+                model.duplicates(batch).tolist(),
+                [False] * 5 + [True, True, True, False, False] + [False] * 5,
+            )
+            model.update_historic_embeddings(batch)
+            self.assertTrue(
+                torch.allclose(
+                    model.historic_embeddings,
+                    torch.cat(
+                        [
+                            embeddings[:25],
+                            embeddings[[2]],
+                            -embeddings[[19]],
+                            embeddings[25:30],
+                        ]
+                    ),
+                )
+            )
+
+    def test_state_dict_round_trip(self):
+        embeddings = make_embeddings(30, dim=32)
+        for dtype in ["fp32", "int8"]:
+            model = TinyDiversityRewardModel("cpu", history_dtype=dtype)
+            model.update_historic_embeddings(embeddings)
+            file = io.BytesIO()
+            torch.save(model.state_dict(), file)
+            file.seek(0)
+
+            for history_dtype, index in [
+                (dtype, "exact"),
+                ("fp16", "exact"),
+                ("fp32", "ivf"),
+            ]:
+                restored = TinyDiversityRewardModel(
+                    "cpu", index=index, history_dtype=history_dtype
+                )
+                restored.load_state_dict(torch.load(file))
+                file.seek(0)
+                self.assertTrue(
+                    torch.allclose(
+                        restored.historic_embeddings,
+                        model.historic_embeddings,
+                        atol=1e-3,
+                    )
+                )
+
+        # States saved before the ring buffer hold a fp32 tensor.
+        model = TinyDiversityRewardModel("cpu", history_dtype="int8")
+        model.load_state_dict({"historic_embeddings": embeddings})
+        self.assertTrue(
+            torch.allclose(model.historic_embeddings, embeddings, atol=0.01)
+        )
+
+    def test_mapped_state_dict_only_points_to_the_file(self):
+        path = os.path.join(self.directory.name, "diversity_history.bin")
+        model = TinyDiversityRewardModel("cpu", history_path=path)
+        model.update_historic_embeddings(make_embeddings(30, dim=32))
+        state = model.state_dict()
+        self.assertEqual(state, {"history": {"dtype": "fp32", "path": path}})
+
+        restored = TinyDiversityRewardModel("cpu", history_path=path)
+        restored.load_state_dict(state)
+        self.assertTrue(
+            torch.equal(restored.historic_embeddings, model.historic_embeddings)
+        )
+
+        # Another model reads the file without mapping it as its own history.
+        other = TinyDiversityRewardModel("cpu", history_dtype="int8")
+        other.load_state_dict(state)
+        self.assertIsNone(other.history.path)
+        self.assertTrue(
+            torch.allclose(
+                other.historic_embeddings, model.historic_embeddings, atol=0.01
+            )
+        )
+
+    def test_ivf_index_does_not_keep_a_ring_buffer(self):
+        path = os.path.join(self.directory.name, "diversity_history.bin")
+        for kwargs in [{"history_dtype": "int8"}, {"history_path": path}]:
+            with self.assertRaises(ValueError):
+                TinyDiversityRewardModel("cpu", index="ivf", **kwargs)
+
+        model = TinyDiversityRewardModel("cpu", index="ivf")
+        model.update_historic_embeddings(make_embeddings(30, dim=32))
+        self.assertIsNone(model.history)
+        self.assertEqual(model.history_size, 30)
+        self.assertFalse(os.path.exists(path))
+
+    def test_historic_embeddings_round_trip(self):
+        embeddings = make_embeddings(30, dim=32)
+        for index in ["exact", "ivf"]:
+            model = TinyDiversityRewardModel("cpu", index=index)
+            self.assertEqual(len(model.historic_embeddings), 0)
+            model.historic_embeddings = embeddings
+            self.assertTrue(torch.allclose(model.historic_embeddings, embeddings))
+
+
+if __name__ == "__main__":
+    unittest.main()
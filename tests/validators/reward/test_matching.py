@@ -0,0 +1,98 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import random
+import unittest
+from fuzzywuzzy import fuzz
+from prompting.validators.reward.matching import AhoCorasick, PhraseMatcher
+
+WORDS = "the a of and to quick brown fox jumps over lazy dog sea king tower red sword".split()
+
+
+def make_phrase(generator: random.Random, count: int) -> str:
+    return " ".join(generator.choices(WORDS, k=count))
+
+
+def mutate(generator: random.Random, text: str, edits: int) -> str:
+    """Applies random character substitutions, insertions and deletions."""
+    characters = list(text)
+    for _ in range(edits):
+        position = generator.randrange(len(characters) + 1)
+        operation = generator.choice(["substitute", "insert", "delete"])
+        character = generator.choice("abcdefghijklmnopqrstuvwxyz ")
+        if operation == "insert" or position == len(characters):
+            characters.insert(position, character)
+        elif operation == "substitute":
+            characters[position] = character
+        else:
+            del characters[position]
+    return "".join(characters)
+
+
+class AhoCorasickTestCase(unittest.TestCase):
+    def test_finds_every_pattern_occurring_in_the_text(self):
+        generator = random.Random(0)
+        patterns = ["he", "she", "his", "hers", "a", "ab", "bab", "abab"] + [
+            make_phrase(generator, 2) for _ in range(50)
+        ]
+        automaton = AhoCorasick(patterns)
+        for _ in range(100):
+            text = make_phrase(generator, 20) + " shers ababab"
+            expected = {
+                index for index, pattern in enumerate(patterns) if pattern in text
+            }
+            self.assertEqual(automaton.search(text), expected)
+
+
+class PhraseMatcherTestCase(unittest.TestCase):
+    def test_matches_the_first_phrase_above_the_fuzzy_boundary(self):
+        generator = random.Random(0)
+        for boundary in [95, 90, 80]:
+            phrases = [
+                make_phrase(generator, generator.randint(5, 10)) for _ in range(40)
+            ]
+            matcher = PhraseMatcher(phrases, boundary)
+
+            matched = 0
+            for _ in range(300):
+                text = make_phrase(generator, generator.randint(0, 60))
+                if generator.random() < 0.5:
+                    # Insert a slightly altered phrase, sometimes longer than the rest of the text.
+                    phrase = mutate(
+                        generator, generator.choice(phrases), generator.randint(0, 3)
+                    )
+                    position = generator.randint(0, len(text))
+                    text = text[:position] + phrase + text[position:]
+
+                expected = next(
+                    (
+                        index
+                        for index, phrase in enumerate(phrases)
+                        if fuzz.partial_ratio(phrase, text) > boundary
+                    ),
+                    None,
+                )
+                self.assertEqual(matcher.match(text), expected, (boundary, text))
+                matched += expected is not None
+            self.assertGreater(matched, 50)
+
+    def test_no_phrases(self):
+        self.assertIsNone(PhraseMatcher([], 95).match("the quick brown fox"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import os
+import torch
+import tempfile
+import unittest
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import (
+    MistralConfig,
+    MistralForSequenceClassification,
+    PreTrainedTokenizerFast,
+)
+from prompting.validators.reward.mistral import MistralRewardModel
+
+WORDS = "you are a knight of the old tower hello there traveller well met i guard gate sword".split()
+
+CHAT_TEMPLATE = (
+    "{{ bos_token }}{% for message in messages %}"
+    "{% if message['role'] == 'user' %}[INST] {{ message['content'] }} [/INST] "
+    "{% else %}{{ message['content'] }}{{ eos_token }}{% endif %}{% endfor %}"
+)
+
+
+def make_checkpoint(directory: str, num_labels: int) -> str:
+    """Saves a tiny randomly initialised mistral reward model with a word level tokenizer."""
+    torch.manual_seed(0)
+    vocab = {
+        token: i
+        for i, token in enumerate(["<unk>", "<s>", "</s>", "[INST]", "[/INST]"] + WORDS)
+    }
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="<unk>",
+        bos_token="<s>",
+        eos_token="</s>",
+        chat_template=CHAT_TEMPLATE,
+        model_input_names=["input_ids", "attention_mask"],
+    ).save_pretrained(directory)
+
+    config = MistralConfig(
+        vocab_size=len(vocab),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=256,
+        num_labels=num_labels,
+    )
+    MistralForSequenceClassification(config).save_pretrained(directory)
+    return directory
+
+
+class MistralRewardModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.prompt = "you are a knight of the old tower " * 4
+        self.completions = [
+            "hello there traveller",
+            "well met",
+            "i guard the gate of the old tower with my sword " * 3,
+            "hello",
+            "well met traveller i guard the gate",
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_model(self, num_labels: int, prefix_caching: bool):
+        class TinyMistralRewardModel(MistralRewardModel):
+            # Checkpoints are shared by path, so each head gets its own directory.
+            reward_model_path = make_checkpoint(
+                os.path.join(self.directory.name, f"num_labels_{num_labels}"),
+                num_labels,
+            )
+            revision = None
+
+        return TinyMistralRewardModel(
+            device="cpu", batch_size=2, prefix_caching=prefix_caching
+        )
+
+    def test_prefix_cached_scores_match_unbatched_scores(self):
+        for num_labels in [1, 2]:
+            model = self.make_model(num_labels, prefix_caching=True)
+            unbatched = [
+                model.reward(self.prompt, completion, "augment").reward
+                for completion in self.completions
+            ]
+            reward_events = model.get_rewards(self.prompt, self.completions, "augment")
+
+            for reward_event, expected in zip(reward_events, unbatched):
+                self.assertAlmostEqual(reward_event.reward, expected, places=5)
+
+    def test_batched_jobs_with_different_prompts(self):
+        model = self.make_model(1, prefix_caching=True)
+        jobs = [
+            (self.prompt, self.completions[:3], "augment"),
+            ("you are a traveller", self.completions[3:], "augment"),
+            (self.prompt, self.completions[3:], "augment"),
+        ]
+
+        batch_reward_events = model.get_batch_rewards(jobs)
+
+        for (prompt, completions, name), reward_events in zip(
+            jobs, batch_reward_events
+        ):
+            self.assertEqual(len(reward_events), len(completions))
+            for reward_event, completion in zip(reward_events, completions):
+                self.assertAlmostEqual(
+                    reward_event.reward,
+                    model.reward(prompt, completion, name).reward,
+                    places=5,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
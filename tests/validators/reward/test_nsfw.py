@@ -0,0 +1,106 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import torch
+import tempfile
+import unittest
+from transformers import BertForSequenceClassification
+from prompting.validators.reward.nsfw import NSFWRewardModel
+from .test_backend import SENTENCES, make_checkpoint
+
+
+class TinyNSFWRewardModel(NSFWRewardModel):
+    nsfw_filter_model_path = None
+
+
+class NSFWRewardModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        TinyNSFWRewardModel.nsfw_filter_model_path = make_checkpoint(
+            self.directory.name, BertForSequenceClassification
+        )
+        self.model = TinyNSFWRewardModel("cpu", batch_size=4)
+        # Short chunks split the long completions, whose last chunk is padded in its batch.
+        self.model.chunk_size = 16
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_batched_chunks_match_the_per_chunk_loop(self):
+        completions = SENTENCES + [
+            "",
+            "the old knight " * 6,
+            "the young king sings",
+        ]
+        lengths = [len(ids) for ids in self.model.tokenizer(completions)["input_ids"]]
+        self.assertGreater(max(lengths), 3 * self.model.chunk_size)
+        self.assertTrue(any(length % self.model.chunk_size for length in lengths))
+
+        expected = [self.model.reward("", completion, "") for completion in completions]
+        reward_events = self.model.get_rewards("", completions, "")
+        self.assertTrue(
+            torch.allclose(
+                torch.tensor([event.score for event in reward_events]),
+                torch.tensor([event.score for event in expected]),
+                atol=1e-5,
+            )
+        )
+
+        # Boundaries just around every score take the same decisions in both paths.
+        for expected_event in expected:
+            for boundary in [expected_event.score - 1e-3, expected_event.score + 1e-3]:
+                self.model.boundary = boundary
+                self.assertEqual(
+                    [
+                        event.reward
+                        for event in self.model.get_rewards("", completions, "")
+                    ],
+                    [
+                        self.model.reward("", completion, "").reward
+                        for completion in completions
+                    ],
+                )
+
+    def test_batch_rewards_are_split_back_into_jobs(self):
+        jobs = [
+            ("", SENTENCES[:2], ""),
+            ("", [], ""),
+            ("", SENTENCES[2:] + [""], ""),
+        ]
+        batch_reward_events = self.model.get_batch_rewards(jobs)
+        self.assertEqual([len(events) for events in batch_reward_events], [2, 0, 4])
+        for (_, completions, _), reward_events in zip(jobs, batch_reward_events):
+            # The completions of the other jobs only change the padding of the batches.
+            self.assertTrue(
+                torch.allclose(
+                    torch.tensor([event.score for event in reward_events]),
+                    torch.tensor(
+                        [
+                            event.score
+                            for event in self.model.get_rewards("", completions, "")
+                        ]
+                    ),
+                    atol=1e-5,
+                )
+            )
+
+    def test_no_completions(self):
+        self.assertEqual(self.model.get_rewards("", [], ""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
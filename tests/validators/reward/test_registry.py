@@ -0,0 +1,90 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import torch
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from transformers import BertModel
+from prompting.validators.reward.embedding import EmbeddingService
+from prompting.validators.reward.registry import ModelRegistry
+from .test_backend import make_checkpoint
+
+
+class ModelRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = make_checkpoint(self.directory.name, BertModel)
+
+    def tearDown(self):
+        ModelRegistry.clear()
+        self.directory.cleanup()
+
+    def test_same_checkpoint_is_loaded_once(self):
+        first = ModelRegistry.model(self.path, device="cpu")
+        second = ModelRegistry.model(self.path, device=torch.device("cpu"))
+        self.assertIs(first, second)
+        self.assertIs(
+            ModelRegistry.tokenizer(self.path), ModelRegistry.tokenizer(self.path)
+        )
+
+        # A different dtype or backend is a different copy of the weights.
+        half = ModelRegistry.model(self.path, dtype=torch.float16)
+        self.assertIsNot(first, half)
+        self.assertEqual(next(half.parameters()).dtype, torch.float16)
+        self.assertIsNot(first, ModelRegistry.model(self.path, backend="int8"))
+
+    def test_concurrent_requests_share_one_load(self):
+        calls = []
+        started = threading.Event()
+
+        def factory():
+            calls.append(1)
+            started.wait(timeout=1)
+            return object()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(ModelRegistry.get, "entry", factory) for _ in range(4)
+            ]
+            started.set()
+            entries = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(entry is entries[0] for entry in entries))
+
+    def test_embedding_services_share_weights(self):
+        service = EmbeddingService.get(self.path, "cpu")
+        self.assertIs(service, EmbeddingService.get(self.path, "cpu"))
+        self.assertIs(
+            EmbeddingService(self.path, "cpu").model, ModelRegistry.model(self.path)
+        )
+
+    def test_memory_report(self):
+        model = ModelRegistry.model(self.path)
+        ModelRegistry.tokenizer(self.path)
+        expected = sum(
+            value.numel() * value.element_size()
+            for value in model.state_dict().values()
+        )
+        report = ModelRegistry.memory_report()
+        self.assertEqual(list(report.values()), [expected])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import torch
+import tempfile
+import unittest
+import torch.nn.functional as F
+from unittest import mock
+from transformers import BertModel
+from torchmetrics.functional import pairwise_cosine_similarity
+from prompting.validators.reward import relevance
+from prompting.validators.reward.embedding import mean_pooling
+from prompting.validators.reward.relevance import (
+    RelevanceRewardModel,
+    BertRelevanceRewardModel,
+    MpnetRelevenceModel,
+)
+from .test_backend import SENTENCES, make_checkpoint
+
+
+class TinyBertRelevanceRewardModel(BertRelevanceRewardModel):
+    relevance_model_path = None
+
+
+class TinyMpnetRelevenceModel(MpnetRelevenceModel):
+    diversity_model_path = None
+
+
+def embed(service, message: str, overflow: bool) -> torch.FloatTensor:
+    """Embedding of a single message, averaged over its overflow chunks as the per-completion loop did."""
+    encoded_input = service.tokenizer(
+        message,
+        padding=True,
+        truncation=True,
+        return_overflowing_tokens=overflow,
+        return_tensors="pt",
+    )
+    encoded_input.pop("overflow_to_sample_mapping", None)
+    with torch.no_grad():
+        embeddings = service.model(**encoded_input)
+    sentence_embeddings = F.normalize(
+        mean_pooling(embeddings, encoded_input["attention_mask"]), p=2, dim=1
+    )
+    return torch.mean(sentence_embeddings, dim=0, keepdim=True)
+
+
+def loop_scores(model: RelevanceRewardModel, prompt: str, completion: str):
+    """Bert and mpnet scores of one completion, embedding the prompt and the completion one at a time."""
+    bert, mpnet = model.models
+    bert_score = -(
+        (
+            (
+                embed(bert.embedding_service, completion, overflow=True)
+                - embed(bert.embedding_service, prompt, overflow=True)
+            )
+            ** 2
+        ).mean()
+        ** 0.5
+    )
+    mpnet_score = pairwise_cosine_similarity(
+        embed(mpnet.embedding_service, prompt, overflow=False),
+        embed(mpnet.embedding_service, completion, overflow=False),
+    ).abs()
+    return [float(bert_score), mpnet_score.item()]
+
+
+class RelevanceRewardModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = make_checkpoint(self.directory.name, BertModel)
+        TinyBertRelevanceRewardModel.relevance_model_path = path
+        TinyMpnetRelevenceModel.diversity_model_path = path
+        with mock.patch.object(
+            relevance, "BertRelevanceRewardModel", TinyBertRelevanceRewardModel
+        ), mock.patch.object(relevance, "MpnetRelevenceModel", TinyMpnetRelevenceModel):
+            self.model = RelevanceRewardModel("cpu")
+
+        self.prompt = "the old knight runs to the tower"
+        # The repeated sentence overflows the 64 tokens of the checkpoint.
+        self.completions = SENTENCES[1:] + ["", "the young king sings by the tower"]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def rewards(self):
+        return [
+            event.reward
+            for event in self.model.get_rewards(self.prompt, self.completions, "")
+        ]
+
+    def expected_rewards(self, expected):
+        return [
+            0
+            if any(score < bound for score, bound in zip(scores, self.model.bounds))
+            else 1.0
+            for scores in expected
+        ]
+
+    def test_batched_scores_match_the_per_completion_loop(self):
+        tokenizer = self.model.models[0].embedding_service.tokenizer
+        self.assertGreater(len(tokenizer(SENTENCES[3])["input_ids"]), 64)
+
+        expected = [
+            loop_scores(self.model, self.prompt, completion)
+            for completion in self.completions
+        ]
+        reward_events = self.model.get_rewards(self.prompt, self.completions, "")
+        self.assertTrue(
+            torch.allclose(
+                torch.tensor(
+                    [[event.bert_score, event.mpnet_score] for event in reward_events]
+                ),
+                torch.tensor(expected),
+                atol=1e-5,
+            )
+        )
+        self.assertEqual(
+            [event.reward for event in reward_events], self.expected_rewards(expected)
+        )
+
+    def test_bounds_around_the_scores_take_the_same_decisions(self):
+        expected = [
+            loop_scores(self.model, self.prompt, completion)
+            for completion in self.completions
+        ]
+        for i in range(len(self.model.bounds)):
+            for scores in expected:
+                for bound in [scores[i] - 1e-4, scores[i] + 1e-4]:
+                    self.model.bounds = [-1.0, 0.0]
+                    self.model.bounds[i] = bound
+                    self.assertEqual(self.rewards(), self.expected_rewards(expected))
+
+        # A score equal to the bound is not below it.
+        reward_events = self.model.get_rewards(self.prompt, self.completions, "")
+        self.model.bounds = [reward_events[0].bert_score, 0.0]
+        self.assertEqual(self.rewards()[0], 1.0)
+        self.model.bounds = [-1.0, reward_events[0].mpnet_score]
+        self.assertEqual(self.rewards()[0], 1.0)
+
+    def test_no_completions(self):
+        self.assertEqual(self.model.get_rewards(self.prompt, [], ""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
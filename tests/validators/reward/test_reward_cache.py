@@ -0,0 +1,115 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import torch
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from prompting.validators.reward.cache import RewardCache
+from prompting.validators.reward.reward import BaseRewardModel, BaseRewardEvent
+
+
+class CountingRewardModel(BaseRewardModel):
+    """Reward model scoring completions by their length and recording what it scored."""
+
+    @property
+    def name(self) -> str:
+        return "counting"
+
+    def __init__(self):
+        super().__init__()
+        self.scored = []
+
+    def get_rewards(self, prompt, completions, name):
+        self.scored.extend(completions)
+        return [BaseRewardEvent(reward=len(completion)) for completion in completions]
+
+
+def make_responses(completions):
+    return [
+        SimpleNamespace(completion=c, dendrite=SimpleNamespace(status_code=200))
+        for c in completions
+    ]
+
+
+class RewardCacheTestCase(unittest.TestCase):
+    def test_entries_expire_after_ttl(self):
+        cache = RewardCache(max_size=10, ttl=5)
+        with patch("time.monotonic", return_value=100):
+            cache.put(("model", "p", "c"), 1.0)
+        with patch("time.monotonic", return_value=104):
+            self.assertEqual(cache.get(("model", "p", "c")), 1.0)
+        with patch("time.monotonic", return_value=106):
+            self.assertIsNone(cache.get(("model", "p", "c")))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = RewardCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_whitespace_identical_completions_share_a_key(self):
+        self.assertEqual(
+            RewardCache.key("model", "prompt", "Hello  there\n"),
+            RewardCache.key("model", "prompt", "Hello there"),
+        )
+        self.assertNotEqual(
+            RewardCache.key("model", "prompt", "Hello there"),
+            RewardCache.key("model", "other prompt", "Hello there"),
+        )
+
+    def test_apply_scores_duplicates_once(self):
+        completions = ["a b", "a b ", "ccc", "a b", "dddd"]
+        uncached_model = CountingRewardModel()
+        uncached_rewards, _ = uncached_model.apply(
+            "prompt", make_responses(completions), "augment"
+        )
+
+        model = CountingRewardModel()
+        model.cache = RewardCache()
+        rewards, reward_events = model.apply(
+            "prompt", make_responses(completions), "augment"
+        )
+
+        self.assertEqual(model.scored, ["a b", "ccc", "dddd"])
+        self.assertTrue(torch.equal(rewards, uncached_rewards))
+        self.assertEqual(reward_events["counting_cache_hits"], 2)
+        self.assertEqual(reward_events["counting_cache_misses"], 3)
+
+        # A later step with the same prompt is served from the cache.
+        _, reward_events = model.apply("prompt", make_responses(["ccc"]), "augment")
+        self.assertEqual(model.scored, ["a b", "ccc", "dddd"])
+        self.assertEqual(reward_events["counting_cache_hits"], 1)
+
+    def test_stateful_models_bypass_the_cache(self):
+        model = CountingRewardModel()
+        model.stateful = True
+        model.cache = RewardCache()
+        _, reward_events = model.apply("prompt", make_responses(["a", "a"]), "augment")
+
+        self.assertEqual(model.scored, ["a", "a"])
+        self.assertNotIn("counting_cache_hits", reward_events)
+
+
+if __name__ == "__main__":
+    unittest.main()
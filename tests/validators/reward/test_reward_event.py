@@ -16,8 +16,11 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import math
+import torch
 import unittest
 from dataclasses import fields
+from types import SimpleNamespace
 import prompting.validators.reward as reward
 
 
@@ -111,3 +114,38 @@ class RewardEventTestCase(unittest.TestCase):
         result_empty = reward.reward.BaseRewardEvent.parse_reward_events([])
         self.assertTrue(all(len(lst) == 0 for lst in result_empty.values()))
         self.assertEqual(result_empty, {"reward": [], "normalized_reward": []})
+
+    def test_parse_reward_events_with_columnar_reward_events(self):
+        events = {"reward": [1, 2], "normalized_reward": [None, None]}
+        result = reward.reward.BaseRewardEvent.parse_reward_events(events)
+        self.assertIs(result, events)
+
+    def test_apply_scatters_reward_events_of_successful_responses(self):
+        class LengthRewardModel(reward.reward.BaseRewardModel):
+            name = "length"
+
+            def get_rewards(self, prompt, completions, name):
+                return [
+                    reward.nsfw.NSFWRewardEvent(reward=len(c), score=-len(c))
+                    for c in completions
+                ]
+
+        responses = [
+            SimpleNamespace(completion=c, dendrite=SimpleNamespace(status_code=s))
+            for c, s in [("a", 200), ("bb", 408), ("ccc", 200), ("dddd", 200)]
+        ]
+        # The last response is excluded, e.g. because an earlier model zeroed it.
+        mask = LengthRewardModel.successful_mask(responses) & torch.tensor(
+            [True, True, True, False]
+        )
+        rewards, events = LengthRewardModel().apply(
+            "prompt", responses, "augment", mask=mask
+        )
+
+        self.assertEqual(rewards[1].item(), 0)
+        self.assertEqual(rewards[3].item(), 0)
+        self.assertEqual(events["length"][0], 1)
+        self.assertEqual(events["length"][2], 3)
+        self.assertTrue(math.isnan(events["length"][1]))
+        self.assertTrue(math.isnan(events["length"][3]))
+        self.assertEqual(events["length_score"], [-1, None, -3, None])
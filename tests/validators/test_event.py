@@ -120,6 +120,32 @@ class EventTestCase(unittest.TestCase):
         assert event.relevance_filter_normalized is None
         assert event.task_validator_filter_normalized is None
 
+    def test_event_from_dict_reward_cache_counts(self):
+        """Test that the reward cache counts are converted as step-level scalars"""
+        event_dict = {
+            "completions": ["test", "test"],
+            "completion_times": [0.123, 0.456],
+            "completion_status_messages": ["Success", "Success"],
+            "completion_status_codes": ["1", "1"],
+            "name": "test-name",
+            "task_type": "test-task",
+            "block": 1.0,
+            "gating_loss": 1.0,
+            "uids": [1, 2],
+            "prompt": "test-prompt",
+            "step_length": 1.0,
+            "best": "test-best",
+            "rewards": [1.0, 1.0],
+            RewardModelType.nsfw.value + "_cache_hits": 1,
+            RewardModelType.nsfw.value + "_cache_misses": 1,
+        }
+
+        event = EventSchema.from_dict(event_dict, disable_log_rewards=True)
+
+        assert event.nsfw_filter_cache_hits == 1
+        assert event.nsfw_filter_cache_misses == 1
+        assert event.mistral_reward_model_cache_hits is None
+
     def test_event_from_dict_forward_reward_logging_mismatch(self):
         """Test that all default columns logged on the forward pass are correctly converted and that
         that reward columns that should be logged are logged as warnings"""
@@ -0,0 +1,285 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import time
+import torch
+import unittest
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from prompting.validators.forward import compute_rewards
+from prompting.validators.timing import StepTimer
+from prompting.validators.tasks import create_message_from_description_task
+from prompting.validators.characterset import default_character
+from prompting.validators.reward.reward import BaseRewardModel, BaseRewardEvent
+from prompting.validators.reward.batching import RewardBatcher
+from prompting.validators.penalty import (
+    TaskValidationPenaltyModel,
+    KeywordMatchPenaltyModel,
+    ContentMatchPenaltyModel,
+)
+
+
+class LengthRewardModel(BaseRewardModel):
+    """Deterministic reward model scoring completions by their length."""
+
+    def __init__(self, name: str, scale: float, cost: float = 1.0):
+        super().__init__()
+        self.mock_name = name
+        self.scale = scale
+        self.scored = []
+        self.cost = cost
+
+    @property
+    def name(self) -> str:
+        return self.mock_name
+
+    def get_rewards(self, prompt, completions, name):
+        self.scored.extend(completions)
+        return [
+            BaseRewardEvent(reward=(len(completion) * self.scale) % 1.0)
+            for completion in completions
+        ]
+
+
+def make_response(completion: str, status_code: int = 200):
+    return SimpleNamespace(
+        completion=completion, dendrite=SimpleNamespace(status_code=status_code)
+    )
+
+
+class KeywordMask(BaseRewardModel):
+    """Cheap mask zeroing the completions that contain a keyword."""
+
+    cost: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return "keyword_mask"
+
+    def get_rewards(self, prompt, completions, name):
+        return [
+            BaseRewardEvent(reward=0.0 if "tower" in completion else 1.0)
+            for completion in completions
+        ]
+
+    def normalize_rewards(self, rewards):
+        return rewards
+
+
+def make_validator(
+    reward_execution: str, short_circuit_rewards: bool = False, timing: bool = False
+):
+    return SimpleNamespace(
+        device="cpu",
+        config=SimpleNamespace(
+            neuron=SimpleNamespace(
+                reward_execution=reward_execution,
+                short_circuit_rewards=short_circuit_rewards,
+                disable_log_rewards=False,
+            )
+        ),
+        reward_weights=torch.tensor([0.7, 0.3]),
+        reward_functions=[
+            LengthRewardModel("length_a", 0.37, cost=10.0),
+            LengthRewardModel("length_b", 0.11),
+        ],
+        masking_functions=[LengthRewardModel("mask", 0.5), KeywordMask()],
+        penalty_functions=[
+            TaskValidationPenaltyModel(max_penalty=0.6),
+            ContentMatchPenaltyModel(max_penalty=0.2),
+            KeywordMatchPenaltyModel(max_penalty=1),
+        ],
+        reward_executor=ThreadPoolExecutor(max_workers=4),
+        step_timer=StepTimer(enabled=timing),
+    )
+
+
+class ComputeRewardsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.task = create_message_from_description_task(
+            "Your name is Test.", default_character()
+        )
+        self.completions = [
+            "Hello there, traveller.",
+            "Here is a task: Answer: nothing.",
+            "I am the keeper of the old tower. " * 20,
+            "",
+            "Well met.",
+        ]
+
+    def compute(
+        self,
+        reward_execution: str,
+        short_circuit_rewards: bool = False,
+        timing: bool = False,
+    ):
+        responses = [make_response(c) for c in self.completions]
+        responses[3].dendrite.status_code = 408
+        event = {}
+        validator = make_validator(reward_execution, short_circuit_rewards, timing)
+        rewards = compute_rewards(
+            validator,
+            self.task,
+            responses,
+            self.task.task_name,
+            event,
+        )
+        return rewards, event, validator
+
+    def test_concurrent_execution_matches_sequential(self):
+        sequential_rewards, sequential_event, _ = self.compute("sequential")
+        concurrent_rewards, concurrent_event, _ = self.compute("concurrent")
+
+        self.assertTrue(torch.equal(sequential_rewards, concurrent_rewards))
+        self.assertEqual(sequential_event.keys(), concurrent_event.keys())
+
+    def test_short_circuit_skips_zeroed_completions(self):
+        rewards, event, validator = self.compute(
+            "sequential", short_circuit_rewards=True
+        )
+        full_rewards, _, _ = self.compute("sequential")
+
+        # The keyword mask zeroes the third completion and the keyword penalty the second one.
+        expensive_model = validator.reward_functions[0]
+        self.assertEqual(
+            expensive_model.scored, [self.completions[0], self.completions[4]]
+        )
+
+        # Zeroed completions get the same event fields as failed ones.
+        self.assertEqual(event["length_a_normalized"][1], 0.0)
+        self.assertTrue(torch.isnan(torch.tensor(event["length_a"][2])))
+        self.assertTrue(torch.equal(rewards[1:4], full_rewards[1:4]))
+        self.assertTrue(torch.all(rewards[1:4] == 0))
+
+    def test_short_circuit_normalizes_with_the_surviving_completions(self):
+        rewards, event, validator = self.compute(
+            "sequential", short_circuit_rewards=True
+        )
+        full_rewards, full_event, full_validator = self.compute("sequential")
+
+        # The running statistics only count the surviving completions.
+        expensive_model = validator.reward_functions[0]
+        self.assertEqual(expensive_model.count, 2)
+        self.assertEqual(full_validator.reward_functions[0].count, 4)
+
+        # The survivors are normalized as if only they had been scored.
+        reference = LengthRewardModel("length_a", 0.37)
+        survivors = [0, 4]
+        expected = reference.normalize_rewards(
+            torch.tensor([event["length_a"][i] for i in survivors])
+        )
+        self.assertTrue(
+            torch.allclose(
+                torch.tensor([event["length_a_normalized"][i] for i in survivors]),
+                expected,
+            )
+        )
+        self.assertNotEqual(
+            [event["length_a_normalized"][i] for i in survivors],
+            [full_event["length_a_normalized"][i] for i in survivors],
+        )
+
+    def test_short_circuit_single_survivor_keeps_the_variance(self):
+        validator = make_validator("sequential", short_circuit_rewards=True)
+        expensive_model = validator.reward_functions[0]
+
+        # Only the first completion survives the masks and penalties.
+        completions = self.completions[:4] + ["The old tower stands."]
+        responses = [make_response(c) for c in completions]
+        responses[3].dendrite.status_code = 408
+        compute_rewards(validator, self.task, responses, self.task.task_name, {})
+        self.assertEqual(expensive_model.count, 1)
+        self.assertFalse(torch.isnan(expensive_model.var))
+
+        # The next steps are still scaled by the variance.
+        event = {}
+        responses = [make_response(c) for c in self.completions]
+        compute_rewards(validator, self.task, responses, self.task.task_name, event)
+        self.assertGreater(expensive_model.var, 0)
+        rewards = torch.tensor([event["length_a"][i] for i in [0, 4]])
+        self.assertTrue(
+            torch.allclose(
+                torch.tensor([event["length_a_normalized"][i] for i in [0, 4]]),
+                0.5
+                * (
+                    1
+                    + torch.erf(
+                        (rewards - expensive_model.mean)
+                        / torch.sqrt(expensive_model.var * 2)
+                    )
+                ),
+            )
+        )
+
+    def test_short_circuit_concurrent_execution_matches_sequential(self):
+        sequential_rewards, sequential_event, _ = self.compute(
+            "sequential", short_circuit_rewards=True
+        )
+        concurrent_rewards, concurrent_event, _ = self.compute(
+            "concurrent", short_circuit_rewards=True
+        )
+
+        self.assertTrue(torch.equal(sequential_rewards, concurrent_rewards))
+        self.assertEqual(sequential_event.keys(), concurrent_event.keys())
+        self.assertEqual(
+            sequential_event["length_a_normalized"],
+            concurrent_event["length_a_normalized"],
+        )
+
+    def test_batched_functions_do_not_wait_for_a_lone_step(self):
+        for reward_execution in ["sequential", "concurrent"]:
+            for short_circuit_rewards in [False, True]:
+                expected_rewards, _, _ = self.compute(
+                    reward_execution, short_circuit_rewards
+                )
+
+                responses = [make_response(c) for c in self.completions]
+                responses[3].dendrite.status_code = 408
+                validator = make_validator(reward_execution, short_circuit_rewards)
+                functions = validator.reward_functions + validator.masking_functions
+                for fn in functions:
+                    fn.batcher = RewardBatcher(fn, window=10.0)
+
+                start = time.monotonic()
+                rewards = compute_rewards(
+                    validator, self.task, responses, self.task.task_name, {}
+                )
+
+                self.assertLess(time.monotonic() - start, 5.0)
+                self.assertTrue(torch.equal(rewards, expected_rewards))
+                self.assertEqual([fn.batcher.expected for fn in functions], [0] * 4)
+
+    def test_timing_records_every_function(self):
+        _, event, _ = self.compute("sequential")
+        self.assertFalse(any(key.startswith("timing_") for key in event))
+
+        for reward_execution in ["sequential", "concurrent"]:
+            _, event, validator = self.compute(reward_execution, timing=True)
+            names = [
+                fn.name
+                for fn in validator.reward_functions
+                + validator.masking_functions
+                + validator.penalty_functions
+            ]
+            for name in names:
+                self.assertGreaterEqual(event[f"timing_{name}"], 0)
+                self.assertGreaterEqual(event[f"timing_{name}_cpu"], 0)
+            self.assertEqual(validator.step_timer.percentiles().keys(), set(names))
+
+
+if __name__ == "__main__":
+    unittest.main()
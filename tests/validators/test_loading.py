@@ -0,0 +1,138 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import time
+import threading
+import unittest
+from types import SimpleNamespace
+from prompting.validators.loading import ModelLoader
+from prompting.validators.reward.lazy import LazyRewardModel
+from prompting.validators.reward.reward import BaseRewardModel, BaseRewardEvent
+
+
+class SlowRewardModel(BaseRewardModel):
+    """Reward model that takes a while to load and records how often it was loaded."""
+
+    cost = 3.0
+    stateful = True
+    loads = 0
+
+    @property
+    def name(self) -> str:
+        return "slow"
+
+    def __init__(self, reward: float = 1.0):
+        super().__init__()
+        time.sleep(0.05)
+        SlowRewardModel.loads += 1
+        self.reward = reward
+        self.added = []
+
+    def add(self, texts):
+        self.added.extend(texts)
+
+    def state_dict(self):
+        return {"added": list(self.added)}
+
+    def load_state_dict(self, state):
+        self.added = list(state["added"])
+
+    def get_rewards(self, prompt, completions, name):
+        return [BaseRewardEvent(reward=self.reward) for _ in completions]
+
+
+class ModelLoaderTestCase(unittest.TestCase):
+    def test_models_load_concurrently(self):
+        loader = ModelLoader(max_workers=2)
+        barrier = threading.Barrier(2, timeout=5)
+
+        # Each factory waits for the other one, which only succeeds if they run at the same time.
+        futures = [
+            loader.submit(name, lambda name=name: (barrier.wait(), name)[1])
+            for name in ["a", "b"]
+        ]
+
+        self.assertEqual([loader.resolve(future) for future in futures], ["a", "b"])
+        self.assertEqual(sorted(name for name, _, _ in loader.timeline), ["a", "b"])
+        loader.shutdown()
+
+    def test_single_worker_loads_on_submit(self):
+        loader = ModelLoader(max_workers=1)
+        future = loader.submit("a", lambda: "model")
+        self.assertTrue(future.done())
+        self.assertEqual(loader.resolve(future), "model")
+        self.assertEqual(loader.resolve("not a future"), "not a future")
+
+    def test_errors_are_raised_when_resolved(self):
+        loader = ModelLoader(max_workers=2)
+
+        def fail():
+            raise OSError("missing checkpoint")
+
+        future = loader.submit("a", fail)
+        with self.assertRaises(OSError):
+            loader.resolve(future)
+        loader.shutdown()
+
+
+class LazyRewardModelTestCase(unittest.TestCase):
+    def test_model_is_loaded_once_on_first_use(self):
+        SlowRewardModel.loads = 0
+        model = LazyRewardModel("slow", SlowRewardModel, reward=0.5)
+        model.cache = "shared cache"
+
+        self.assertEqual(SlowRewardModel.loads, 0)
+        self.assertEqual(model.name, "slow")
+        self.assertEqual(model.cost, 3.0)
+        self.assertTrue(model.stateful)
+
+        responses = [
+            SimpleNamespace(completion="hi", dendrite=SimpleNamespace(status_code=200))
+        ]
+        rewards, _ = model.apply("prompt", responses, "augment")
+        model.add(["hello"])
+
+        self.assertEqual(SlowRewardModel.loads, 1)
+        self.assertEqual(rewards.tolist(), [0.5])
+        self.assertEqual(model.model.added, ["hello"])
+        self.assertEqual(model.model.cache, "shared cache")
+
+        # Attributes of the wrapped model are set on it.
+        model.added = []
+        self.assertEqual(model.model.added, [])
+
+    def test_state_is_restored_when_the_model_is_loaded(self):
+        SlowRewardModel.loads = 0
+        model = LazyRewardModel("slow", SlowRewardModel)
+
+        # Checkpoints neither load the model nor overwrite the state it will be restored with.
+        model.load_state_dict({"added": ["saved"]})
+        self.assertIsNone(model.state_dict())
+        self.assertFalse(model.loaded)
+        self.assertEqual(SlowRewardModel.loads, 0)
+
+        model.add(["new"])
+        self.assertTrue(model.loaded)
+        self.assertEqual(model.state_dict(), {"added": ["saved", "new"]})
+
+        model.load_state_dict({"added": []})
+        self.assertEqual(model.model.added, [])
+        self.assertEqual(SlowRewardModel.loads, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
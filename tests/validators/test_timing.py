@@ -0,0 +1,76 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# Copyright © 2023 Opentensor Foundation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import asyncio
+import unittest
+from prompting.validators.timing import StepTimer
+
+
+class StepTimerTestCase(unittest.TestCase):
+    def test_disabled_timer_records_nothing(self):
+        timer = StepTimer()
+        event = {}
+        with timer.time("stage", event):
+            pass
+        self.assertEqual(event, {})
+        self.assertEqual(timer.percentiles(), {})
+
+    def test_records_wall_and_cpu_time(self):
+        timer = StepTimer(enabled=True)
+        event = {}
+        with timer.time("sleep", event):
+            time.sleep(0.05)
+
+        self.assertGreaterEqual(event["timing_sleep"], 0.05)
+        # Sleeping does not use the CPU.
+        self.assertLess(event["timing_sleep_cpu"], 0.05)
+
+    def test_awaiting_stages_only_record_wall_time(self):
+        timer = StepTimer(enabled=True)
+        event = {}
+
+        async def busy():
+            # Coroutine of another forward using the loop thread while the stage awaits.
+            start = time.perf_counter()
+            while time.perf_counter() - start < 0.05:
+                pass
+
+        async def stage():
+            with timer.time("dendrite", event, cpu=False):
+                await asyncio.gather(asyncio.sleep(0.01), busy())
+
+        asyncio.run(stage())
+        self.assertGreaterEqual(event["timing_dendrite"], 0.05)
+        self.assertNotIn("timing_dendrite_cpu", event)
+
+    def test_percentiles_use_the_last_window(self):
+        timer = StepTimer(enabled=True, window=10)
+        for _ in range(20):
+            with timer.time("stage", {}):
+                pass
+        self.assertEqual(len(timer.history["stage"]), 10)
+
+        percentiles = timer.percentiles()["stage"]
+        self.assertEqual(percentiles.keys(), {"p50", "p95", "p99"})
+        self.assertLessEqual(percentiles["p50"], percentiles["p95"])
+        self.assertLessEqual(percentiles["p95"], percentiles["p99"])
+
+
+if __name__ == "__main__":
+    unittest.main()